@@ -0,0 +1,256 @@
+"""Self-hosted, versioned player assets.
+
+hls.js and the players' own scripts live in ``player_assets/``, so players
+don't depend on a CDN that restricted networks block. hls.js is vendored
+once per version with ``python assets.py fetch``, which downloads it from
+the npm registry and checks it against the registry's integrity hash.
+
+By default assets go through Streamlit's component file route on the
+app's own origin, with the content hash as a query string, which works
+behind https and on single-port hosts. With a public ``AAEC_ASSETS_URL``
+set, they are served instead from a small server of their own
+(``AAEC_ASSETS_PORT``) under content-hashed names
+(``hls-1.4.14.min.3f2a9c0d1e.js``) with ``Cache-Control: immutable`` and a
+one-year ``max-age``, gzipped once at startup, so a browser downloads each
+file once per release.
+
+Until hls.js is vendored, players load the pinned version from jsDelivr,
+with Subresource Integrity when ``AAEC_HLS_JS_INTEGRITY`` holds its hash
+(``python assets.py fetch`` prints it). A missing file is looked for again
+every ``retry_seconds``, so vendoring it takes effect without a restart.
+
+    player_assets.url('hls.js')       # URL a page loads hls.js from
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import http.server
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+import urllib.request
+
+HLS_JS_VERSION = '1.4.14'
+HLS_JS_CDN = f'https://cdn.jsdelivr.net/npm/hls.js@{HLS_JS_VERSION}/dist/hls.min.js'
+# SRI hash of HLS_JS_CDN, e.g. ``sha384-...``
+HLS_JS_INTEGRITY = os.environ.get('AAEC_HLS_JS_INTEGRITY', '')
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'player_assets')
+ASSETS_PORT = int(os.environ.get('AAEC_ASSETS_PORT', '8766'))
+ASSETS_HOST = os.environ.get('AAEC_ASSETS_HOST', '0.0.0.0')
+# Public base URL of the asset server; empty keeps assets on the app's origin
+ASSETS_URL = os.environ.get('AAEC_ASSETS_URL', '')
+
+# Asset name -> file in ASSETS_DIR
+ASSET_FILES = {
+    'hls.js': f'hls-{HLS_JS_VERSION}.min.js',
+    'iframe_player.js': 'iframe_player.js',
+}
+_CONTENT_TYPES = {'.js': 'text/javascript; charset=utf-8', '.css': 'text/css; charset=utf-8'}
+_IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class PlayerAssets:
+    """Content hashes and URLs of the files in ``directory``, and the server for them."""
+
+    def __init__(self, directory=ASSETS_DIR, public_url=ASSETS_URL, retry_seconds=10.0):
+        self.directory = directory
+        self.public_url = public_url.rstrip('/')
+        self.retry_seconds = retry_seconds
+        self._digests = {}
+        # filename -> when to look for a missing file again
+        self._missing = {}
+        self._files = None
+        self._server = None
+        self._registered = False
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_served = 0
+
+    def digest(self, filename):
+        """Short content hash of a file (read once per process), or ``None`` while it is missing."""
+        digest = self._digests.get(filename)
+        if digest is not None or time.monotonic() < self._missing.get(filename, 0.0):
+            return digest
+        try:
+            with open(os.path.join(self.directory, filename), 'rb') as file:
+                digest = self._digests[filename] = hashlib.sha256(file.read()).hexdigest()[:10]
+        except OSError:
+            self._missing[filename] = time.monotonic() + self.retry_seconds
+        return digest
+
+    @staticmethod
+    def hashed_name(filename, digest):
+        stem, extension = os.path.splitext(filename)
+        return f'{stem}.{digest}{extension}'
+
+    def url(self, name):
+        """URL the browser loads asset ``name`` (a key of ``ASSET_FILES``) from."""
+        filename = ASSET_FILES[name]
+        digest = self.digest(filename)
+        if digest is None:
+            if name == 'hls.js':
+                return HLS_JS_CDN
+            raise FileNotFoundError(os.path.join(self.directory, filename))
+        if self._server is not None:
+            return f'{self.public_url}/{self.hashed_name(filename, digest)}'
+        return f'{self._component_base()}/{filename}?v={digest}'
+
+    def integrity(self, name):
+        """SRI hash to load asset ``name`` with, or ``''``; only the CDN fallback has one."""
+        if name == 'hls.js' and self.digest(ASSET_FILES[name]) is None:
+            return HLS_JS_INTEGRITY
+        return ''
+
+    def _component_base(self):
+        # Registering the directory as a component makes Streamlit serve
+        # its files; nothing is ever rendered from it
+        if not self._registered:
+            from streamlit import runtime
+            if runtime.exists():
+                from streamlit.components.v1 import declare_component
+                declare_component('player_assets', path=self.directory)
+                self._registered = True
+        from streamlit import config
+        base_path = config.get_option('server.baseUrlPath').strip('/')
+        return f"{'/' + base_path if base_path else ''}/component/{__name__}.player_assets"
+
+    # Serving
+
+    def _load(self):
+        """Hashed name -> ``(content type, body, gzipped body, digest)`` of every file."""
+        files = {}
+        for filename in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, filename)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as file:
+                body = file.read()
+            digest = hashlib.sha256(body).hexdigest()[:10]
+            self._digests[filename] = digest
+            content_type = _CONTENT_TYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+            files[self.hashed_name(filename, digest)] = (content_type, body, gzip.compress(body, 9), digest)
+        return files
+
+    def start_server(self, port=ASSETS_PORT, host=ASSETS_HOST):
+        """Serve the assets from a daemon thread once per process; ``url`` points there from then on."""
+        assets = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def respond(self, send_body):
+                assets.requests += 1
+                asset = assets._files.get(self.path.split('?', 1)[0].lstrip('/'))
+                if asset is None:
+                    self.send_error(404)
+                    return
+                content_type, body, gzipped, digest = asset
+                etag = f'"{digest}"'
+                if self.headers.get('If-None-Match') == etag:
+                    assets.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Cache-Control', _IMMUTABLE)
+                    self.end_headers()
+                    return
+                use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+                if use_gzip:
+                    body = gzipped
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if use_gzip:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Vary', 'Accept-Encoding')
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', _IMMUTABLE)
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                    assets.bytes_served += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        with self._lock:
+            if self._server is not None:
+                return
+            self._files = self._load()
+            server = http.server.ThreadingHTTPServer((host, port), Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name='player-assets', daemon=True).start()
+            self._server = server
+
+    def stats(self):
+        return {
+            'files': len(self._files or ()),
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'bytes_served': self.bytes_served,
+        }
+
+
+# Process-wide assets shared by all sessions
+player_assets = PlayerAssets()
+
+
+def subresource_integrity(path, algorithm='sha384'):
+    """The ``integrity`` attribute value for the file at ``path``."""
+    with open(path, 'rb') as file:
+        return f"{algorithm}-{base64.b64encode(hashlib.new(algorithm, file.read()).digest()).decode('ascii')}"
+
+
+def fetch_hls_js(version=HLS_JS_VERSION, directory=ASSETS_DIR, registry='https://registry.npmjs.org'):
+    """Vendor ``dist/hls.min.js`` of hls.js ``version`` into ``directory``; returns its path."""
+    with urllib.request.urlopen(f'{registry}/hls.js/{version}', timeout=30) as response:
+        dist = json.load(response)['dist']
+    with urllib.request.urlopen(dist['tarball'], timeout=120) as response:
+        tarball = response.read()
+    algorithm, _, expected = dist['integrity'].partition('-')
+    if base64.b64encode(hashlib.new(algorithm, tarball).digest()).decode('ascii') != expected:
+        raise ValueError(f"hls.js {version}: tarball does not match the registry's {algorithm} integrity hash")
+    with tarfile.open(fileobj=io.BytesIO(tarball), mode='r:gz') as archive:
+        script = archive.extractfile('package/dist/hls.min.js').read()
+    path = os.path.join(directory, f'hls-{version}.min.js')
+    with open(path, 'wb') as file:
+        file.write(script)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vendor and list the self-hosted player assets.")
+    parser.add_argument('command', choices=['fetch', 'list'], help="fetch hls.js, or list assets and their hashes")
+    parser.add_argument('--version', default=HLS_JS_VERSION, help="hls.js version to fetch")
+    args = parser.parse_args(argv)
+
+    if args.command == 'fetch':
+        path = fetch_hls_js(args.version)
+        print(f"{path}: {os.path.getsize(path)} bytes")
+        print(f"AAEC_HLS_JS_INTEGRITY={subresource_integrity(path)}  (the same file on {HLS_JS_CDN})")
+        if args.version != HLS_JS_VERSION:
+            print(f"HLS_JS_VERSION in assets.py is still {HLS_JS_VERSION}")
+        return 0
+
+    for name, filename in ASSET_FILES.items():
+        digest = player_assets.digest(filename)
+        if digest is None:
+            print(f"{name}: {filename} missing" + (f", served from {HLS_JS_CDN}" if name == 'hls.js' else ''))
+        else:
+            size = os.path.getsize(os.path.join(ASSETS_DIR, filename))
+            print(f"{name}: {player_assets.hashed_name(filename, digest)} ({size} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
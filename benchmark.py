@@ -0,0 +1,272 @@
+"""Headless benchmark of the load -> parse -> select -> render path.
+
+Generates synthetic playlists shaped like ``list.m3u`` (category headers,
+``#EXTINF:0,<name>`` lines, ``chunks.m3u8`` URLs), times each stage the app
+runs on a rerun and writes the results as JSON so two runs can be compared:
+
+    python benchmark.py --sizes 100 10000 100000 --output bench.json
+    python benchmark.py --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from catalog import ChannelIndex, CatalogCache, file_digest, iter_m3u_file, parse_m3u_content
+from channel_list import CHANNEL_LIST_PAGE, window_start
+from channel_table import SNAPSHOT_SUFFIX, ChannelTable
+from player import build_player_html
+from search import SearchIndex
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+# Same category headers as list.m3u; names cycle so the default channel and
+# quick-access matches exist at every size.
+CATEGORIES = ["SERIALS", "SPORTS", "MUSICS AND SERIES", "Cartoon", "Movies", "Danzer and Wildlife", "NEPALI"]
+CHANNEL_NAMES = [
+    "ZeeTV HD", "Colors ", "StarSports 1 HD", "StarSports 2 HD", "StarSports SELECT 1 HD",
+    "Sony Ten 1 HD", "Sony Ten 2 HD", "Nick HD", "Cartoon Network", "Star Movies HD",
+    "National Geographic ", "Kantipur HD ", "Avenews ", "StarSports 1 HD HINDI",
+]
+
+
+# Syllables for distinct made-up words, so search indexes see a real vocabulary
+SYLLABLES = ["ka", "ri", "to", "ne", "su", "ma", "lo", "vi", "de", "ra", "pu", "ze", "mo", "ti", "ba", "go"]
+
+# Search benchmark queries: exact, multi-term, typo, prefix, common and digit terms
+SEARCH_QUERIES = ["starsports 1 hd", "StarSports1", "strasports", "sony ten 2", "kantip", "nat geo", "hd", "1"]
+
+
+def made_up_word(number):
+    word = ""
+    while True:
+        word += SYLLABLES[number % len(SYLLABLES)]
+        number //= len(SYLLABLES)
+        if not number:
+            return word.capitalize()
+
+
+def generate_playlist(path, entries, per_category=100, attributes=False, unique_names=False):
+    """Write a synthetic playlist of ``entries`` channels to ``path``.
+
+    With ``unique_names``, every name gets a distinct made-up word appended.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("#EXTM3U\n")
+        for i in range(entries):
+            if i % per_category == 0:
+                category = CATEGORIES[(i // per_category) % len(CATEGORIES)]
+                file.write(f"\n#========{category}==========\n")
+            name = CHANNEL_NAMES[i % len(CHANNEL_NAMES)]
+            if unique_names:
+                name = f"{name.strip()} {made_up_word(i)}"
+            slug = f"via{name.strip().replace(' ', '').lower()}{i}"
+            if attributes:
+                file.write(f'#EXTINF:-1 tvg-id="{slug}" tvg-logo="http://logos.example/{slug}.png",{name}\n')
+            else:
+                file.write(f"#EXTINF:0,{name}\n")
+            file.write(f"http://103.10.30.130:8081/viatv/{slug}/chunks.m3u8\n")
+    return os.path.getsize(path)
+
+
+def best_of(function, repeat):
+    """Return (best seconds, last result) over ``repeat`` calls."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def peak_memory(function):
+    """Return the peak traced allocation, in bytes, of one call."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def select_channels(index):
+    # What a rerun does per view: default selection, position, prev/next
+    for category in [None] + list(index.category_ranges):
+        view = index.view(category)
+        channel_id = index.default_id(category)
+        position = channel_id - view.start
+        if position > 0:
+            channel_id -= 1
+        _ = index.full_names[channel_id], index.urls[channel_id], index.display_names[channel_id]
+    return [index.original_names[channel_id] for channel_id in index.quick_access_ids[:6]]
+
+
+def channel_list_rows(index):
+    # The window of the "All" list a rerun sends around the default channel
+    view = index.view()
+    offset = window_start(index.default_id() - view.start, len(view))
+    return [[channel_id, index.display_names[channel_id], ''] for channel_id in view[offset:offset + CHANNEL_LIST_PAGE]]
+
+
+def bench_size(entries, directory, repeat, attributes=False, measure_memory=True):
+    path = os.path.join(directory, f"bench_{entries}.m3u")
+    size = generate_playlist(path, entries, attributes=attributes)
+    lines = entries * 2 + entries // 100 + 1
+    stages = {}
+
+    def record(name, seconds, items, function=None):
+        stage = {
+            'seconds': seconds,
+            'items': items,
+            'items_per_second': items / seconds if seconds else None,
+        }
+        if measure_memory and function is not None:
+            stage['peak_bytes'] = peak_memory(function)
+        stages[name] = stage
+
+    # File discovery: a cold load walks the candidate paths, hashes and parses;
+    # every later rerun only pays for a stat() of the cached path.
+    paths = [os.path.join(directory, 'missing.m3u'), os.path.join(directory, 'data', 'missing.m3u'), path]
+    seconds, _ = best_of(lambda: CatalogCache(paths, None, False).get(), repeat)
+    record('cold_load', seconds, entries, lambda: CatalogCache(paths, None, False).get())
+
+    # The same cold load with a compiled snapshot: hash the playlist, map the table
+    mirrors = {}
+    snapshot_path = path + SNAPSHOT_SUFFIX
+    ChannelTable.from_dicts(*parse_m3u_content(iter_m3u_file(path), mirrors), mirrors,
+                            file_digest(path)).save(snapshot_path)
+    seconds, _ = best_of(lambda: CatalogCache(paths, None, True).get(), repeat)
+    record('snapshot_load', seconds, entries, lambda: CatalogCache(paths, None, True).get())
+    stages['snapshot_load']['snapshot_bytes'] = os.path.getsize(snapshot_path)
+    os.remove(snapshot_path)
+
+    cache = CatalogCache(paths, None, False)
+    cache.get()
+    hit_calls = 1000
+    seconds, _ = best_of(lambda: [cache.get() for _ in range(hit_calls)], repeat)
+    record('discovery_cache_hit', seconds / hit_calls, 1)
+
+    seconds, parsed = best_of(lambda: parse_m3u_content(iter_m3u_file(path)), repeat)
+    record('parse_m3u_content', seconds, lines, lambda: parse_m3u_content(iter_m3u_file(path)))
+    stages['parse_m3u_content']['bytes_per_second'] = size / seconds
+
+    seconds, index = best_of(lambda: ChannelIndex.from_dicts(*parsed), repeat)
+    record('channel_index', seconds, entries, lambda: ChannelIndex.from_dicts(*parsed))
+
+    select_calls = 1000
+    seconds, _ = best_of(lambda: [select_channels(index) for _ in range(select_calls)], repeat)
+    record('channel_select', seconds / select_calls, len(index.category_ranges) + 1)
+
+    channel_id = index.default_id()
+    render_calls = 1000
+    seconds, html = best_of(
+        lambda: [build_player_html(index.full_names[channel_id], index.urls[channel_id]) for _ in range(render_calls)],
+        repeat,
+    )
+    record('player_html', seconds / render_calls, 1)
+    stages['player_html']['html_bytes'] = len(html[0].encode('utf-8'))
+
+    list_calls = 100
+    seconds, rows = best_of(lambda: [channel_list_rows(index) for _ in range(list_calls)], repeat)
+    record('channel_list', seconds / list_calls, len(rows[0]))
+    stages['channel_list']['payload_bytes'] = len(json.dumps(rows[0]).encode('utf-8'))
+
+    os.remove(path)
+
+    # Search runs over distinct names, built like the app does on first use
+    generate_playlist(path, entries, attributes=attributes, unique_names=True)
+    catalog = CatalogCache([path], None, False).get()
+    seconds, search_index = best_of(lambda: SearchIndex(catalog.index), repeat)
+    record('search_index', seconds, entries)
+    stages['search_index']['tokens'] = len(search_index.vocabulary)
+    seconds, _ = best_of(lambda: SearchIndex(catalog.index, previous=search_index), repeat)
+    record('search_index_reload', seconds, entries)
+    query_seconds = []
+    for query in SEARCH_QUERIES + [made_up_word(entries // 2).lower()]:
+        seconds, _ = best_of(lambda: search_index.search(query), max(repeat, 20))
+        query_seconds.append(seconds)
+    record('search', sum(query_seconds) / len(query_seconds), 1)
+    stages['search']['max_seconds'] = max(query_seconds)
+    os.remove(path)
+    return {'entries': entries, 'lines': lines, 'file_bytes': size, 'stages': stages}
+
+
+def compare(current, baseline, threshold):
+    """Print per-stage time ratios; return the number of regressions."""
+    previous = {result['entries']: result for result in baseline['results']}
+    regressions = 0
+    for result in current['results']:
+        old = previous.get(result['entries'])
+        if old is None:
+            continue
+        for stage, values in result['stages'].items():
+            old_values = old['stages'].get(stage)
+            if not old_values or not old_values['seconds']:
+                continue
+            ratio = values['seconds'] / old_values['seconds']
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{result['entries']:>9} {stage:<22} {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="playlist sizes in channels (up to 1000000)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the best is kept")
+    parser.add_argument('--attributes', action='store_true', help="emit tvg-id/tvg-logo EXTINF attributes")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak-memory pass")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for entries in args.sizes:
+            result = bench_size(entries, directory, args.repeat, args.attributes, not args.no_memory)
+            results.append(result)
+            parse = result['stages']['parse_m3u_content']
+            print(f"{entries:>9} channels: parse {parse['seconds'] * 1000:9.2f} ms "
+                  f"({parse['items_per_second']:,.0f} lines/s), "
+                  f"cold load {result['stages']['cold_load']['seconds'] * 1000:9.2f} ms "
+                  f"({result['stages']['snapshot_load']['seconds'] * 1000:.2f} ms from snapshot), "
+                  f"select {result['stages']['channel_select']['seconds'] * 1e6:7.2f} us, "
+                  f"player {result['stages']['player_html']['seconds'] * 1e6:7.2f} us, "
+                  f"list {result['stages']['channel_list']['payload_bytes']} B, "
+                  f"search {result['stages']['search']['seconds'] * 1e6:.0f} us "
+                  f"(max {result['stages']['search']['max_seconds'] * 1e6:.0f} us)", file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
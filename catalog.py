@@ -0,0 +1,700 @@
+"""Playlist discovery, parsing and the process-wide channel catalog cache.
+
+Streamlit re-executes ``main.py`` on every interaction, so anything that
+should survive a rerun (or be shared between sessions) lives here, in an
+imported module that stays resident in ``sys.modules``. Nothing here imports
+Streamlit, so the parser and index are usable from scripts and batch jobs.
+
+Run ``python catalog.py PLAYLIST...`` to validate playlists, and add
+``--output-dir DIR`` or ``--in-place`` to rewrite them deduplicated by URL
+with normalized names and categories; files are streamed, and several
+files are processed in parallel (``--jobs``).
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
+from functools import cached_property
+from urllib.parse import urlsplit
+
+from channel_table import SNAPSHOT_SUFFIX, ChannelTable
+from metrics import metrics
+
+# Try multiple possible locations for the M3U file
+PLAYLIST_PATHS = [
+    'list.m3u',  # Current directory
+    './list.m3u',  # Explicit current directory
+    os.path.join(os.path.dirname(__file__), 'list.m3u'),  # Same directory as script
+    'data/list.m3u',  # Data subdirectory
+    './data/list.m3u',  # Explicit data subdirectory
+]
+
+# Directory where the first worker process writes the compiled catalog and
+# every other one memory-maps it, so all workers share a single copy
+CATALOG_SHARED_DIR = os.environ.get('AAEC_CATALOG_SHARED_DIR')
+# Map a current ``<playlist>.catalog`` snapshot instead of parsing at cold start
+CATALOG_SNAPSHOT_ENABLED = os.environ.get('AAEC_CATALOG_SNAPSHOT', '1') != '0'
+
+
+# "#EXTINF:<duration> key="value" ...,<title>" -- attributes are optional
+_EXTINF_RE = re.compile(r'#EXTINF:\s*(-?\d+(?:\.\d+)?)((?:\s+[\w-]+="[^"]*")*)\s*,(.*)')
+_ATTRIBUTE_RE = re.compile(r'([\w-]+)="([^"]*)"')
+# Fallback for EXTINF lines the strict pattern rejects: unquoted or
+# single-quoted values, a missing duration, stray text before the comma
+_LOOSE_DURATION_RE = re.compile(r'\s*(-?\d+(?:\.\d+)?)?')
+_LOOSE_ATTRIBUTE_RE = re.compile(r'\s*([\w-]+)=("[^"]*"|\'[^\']*\'|[^\s,"\']*)')
+_URL_LIST_SEPARATOR_RE = re.compile(r'[\s|]+')
+# An http(s) URL with a host and no whitespace
+_STREAM_URL_RE = re.compile(r'https?://[^/\s?#]+[^\s]*$', re.IGNORECASE)
+
+def parse_attributes(attribute_text):
+    """Return every ``key="value"`` pair of an EXTINF attribute run as a dict."""
+    return dict(_ATTRIBUTE_RE.findall(attribute_text)) if attribute_text else {}
+
+
+def _parse_loose_extinf(line):
+    """``(title, duration, attribute_text)`` of an irregular EXTINF line, or ``None``.
+
+    Attributes are taken from whatever parses as ``key=value`` and
+    rewritten as ``key="value"``; the title follows the next comma.
+    """
+    match = _LOOSE_DURATION_RE.match(line, 8)
+    duration = float(match.group(1)) if match.group(1) else -1.0
+    position = match.end()
+    attributes = []
+    while True:
+        match = _LOOSE_ATTRIBUTE_RE.match(line, position)
+        if match is None:
+            break
+        value = match.group(2)
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attributes.append(f'{match.group(1)}="{value.replace(chr(34), chr(39))}"')
+        position = match.end()
+    comma = line.find(',', position)
+    if comma < 0:
+        return None
+    return line[comma + 1:], duration, ' ' + ' '.join(attributes) if attributes else None
+
+
+def _attribute(attribute_text, key):
+    # ``key`` includes the leading space and '="', e.g. ' tvg-id="'
+    if not attribute_text:
+        return None
+    start = attribute_text.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    return attribute_text[start:attribute_text.index('"', start)] or None
+
+
+class M3UEntry(namedtuple('M3UEntry', ['name', 'url', 'category', 'duration', 'attribute_text'])):
+    """One playlist channel; ``attribute_text`` is the raw ``key="value"`` run.
+
+    Only ``group-title`` is needed while parsing, so the other attributes
+    are extracted on access instead of for every line of a large playlist.
+    """
+    __slots__ = ()
+
+    @property
+    def tvg_id(self):
+        return _attribute(self.attribute_text, ' tvg-id="')
+
+    @property
+    def tvg_logo(self):
+        return _attribute(self.attribute_text, ' tvg-logo="')
+
+    @property
+    def attributes(self):
+        return parse_attributes(self.attribute_text)
+
+    @property
+    def alt_urls(self):
+        """Mirror URLs from an ``alt-url="<url>|<url>"`` attribute, if any."""
+        value = _attribute(self.attribute_text, ' alt-url="')
+        return [url for url in _URL_LIST_SEPARATOR_RE.split(value) if url] if value else []
+
+
+def iter_m3u_entries(lines, report=None):
+    """Yield playlist items from an iterable of lines.
+
+    Each category header yields its name as a plain string (so empty
+    categories are still known) and each channel yields an ``M3UEntry``.
+    Works on any line iterator (an open file, a generator), so playlists are
+    consumed incrementally and only the entry being built is held in memory.
+    Understands ``#========X==========`` category headers, ``#EXTGRP`` and
+    ``#EXTINF`` durations and attributes; a ``group-title`` attribute takes
+    precedence over the enclosing category header. Attributes that aren't
+    double-quoted are accepted too. Only http(s) streams become channels,
+    since the player can't play others; ``report`` counts the skipped ones
+    as ``unsupported_urls`` and unreadable EXTINF lines as ``rejected_lines``.
+    """
+    if report is None:
+        report = {}
+    for key in ('rejected_lines', 'unsupported_urls'):
+        report.setdefault(key, 0)
+    current_category = "General"
+    group = None
+    pending = None
+    extinf_match = _EXTINF_RE.match
+
+    for line in lines:
+        line = line.strip()
+
+        # Skip empty lines and comments that aren't channel info
+        if not line or line[0] == '/':
+            continue
+
+        if line[0] == '#':
+            # Check for channel info
+            if line.startswith('#EXTINF:'):
+                match = extinf_match(line)
+                if match:
+                    duration, attribute_text, title = match.groups()
+                    if attribute_text:
+                        attribute_text = ' ' + attribute_text.strip()
+                        pending = (title.strip(), float(duration), attribute_text,
+                                   _attribute(attribute_text, ' group-title="'))
+                    else:
+                        pending = (title.strip(), float(duration), None, None)
+                else:
+                    loose = _parse_loose_extinf(line)
+                    if loose is None:
+                        report['rejected_lines'] += 1
+                        pending = None
+                    else:
+                        title, duration, attribute_text = loose
+                        pending = (title.strip(), duration, attribute_text,
+                                   _attribute(attribute_text, ' group-title="'))
+            # Check for category headers
+            elif line.startswith('#========') and line.endswith('=========='):
+                current_category = line[1:].strip('=').strip()
+                yield current_category
+            elif line.startswith('#EXTGRP:'):
+                group = line[8:].strip() or None
+            continue
+
+        if pending is not None and '://' in line:
+            if line[:7].lower() == 'http://' or line[:8].lower() == 'https://':
+                name, duration, attribute_text, group_title = pending
+                yield M3UEntry(name, line, group_title or group or current_category, duration, attribute_text)
+            else:
+                report['unsupported_urls'] += 1
+            pending = None
+            group = None
+
+
+def file_digest(path):
+    """Return the SHA-1 hex digest of ``path``, read in fixed-size chunks."""
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def iter_m3u_file(path):
+    """Yield the lines of ``path`` without reading the whole file into memory."""
+    with open(path, 'r', encoding='utf-8') as file:
+        yield from file
+
+
+# Function to parse M3U content into a dictionary with categories
+@metrics.timed('parse_m3u_content')
+def parse_m3u_content(content, mirrors=None, report=None):
+    """Build the channel dicts from M3U text or any iterable of lines; skipped lines are counted in ``report``."""
+    if isinstance(content, str):
+        content = io.StringIO(content)
+    return build_channel_dicts(iter_m3u_entries(content, report), mirrors)
+
+
+def build_channel_dicts(entries, mirrors=None):
+    """Build ``(channel_sources, channel_categories, clean_channels)`` from entries.
+
+    ``entries`` is what ``iter_m3u_entries`` yields: a plain category name
+    for every header so empty categories still show up, and an ``M3UEntry``
+    for every channel; the entry itself is stored in ``clean_channels``
+    rather than a copy.
+
+    If a ``mirrors`` dict is passed, a channel repeated under the same name
+    in the same category is folded into the first one instead of listed
+    again, and ``mirrors[full_channel_name]`` collects every URL of such
+    channels (and of ``alt-url`` attributes), primary first.
+    """
+    channels = {}
+    categories = {}
+    clean_channels = {}  # For display without category prefix
+    channel_number = 1
+    first_by_name = {}
+    mirror_urls = {}  # full channel name -> set of its mirror URLs, for large folds
+
+    for entry in entries:
+        if isinstance(entry, str):
+            categories.setdefault(entry, [])
+            continue
+
+        if mirrors is not None:
+            first = first_by_name.get((entry.category, entry.name))
+            if first is not None:
+                urls = mirrors.setdefault(first, [channels[first]])
+                seen = mirror_urls.get(first)
+                if seen is None:
+                    seen = mirror_urls[first] = set(urls)
+                for url in (entry.url, *entry.alt_urls):
+                    if url not in seen:
+                        seen.add(url)
+                        urls.append(url)
+                continue
+
+        # Create user-friendly channel name with number
+        clean_name = f"{channel_number:02d}. {entry.name}"
+        full_channel_name = f"[{entry.category}] {clean_name}"
+
+        channels[full_channel_name] = entry.url
+        clean_channels[clean_name] = entry
+        category_channels = categories.get(entry.category)
+        if category_channels is None:
+            category_channels = categories[entry.category] = []
+        category_channels.append(full_channel_name)
+        if mirrors is not None:
+            first_by_name[entry.category, entry.name] = full_channel_name
+            alt_urls = entry.alt_urls
+            if alt_urls:
+                mirrors[full_channel_name] = list(dict.fromkeys((entry.url, *alt_urls)))
+        channel_number += 1
+
+    return channels, categories, clean_channels
+
+
+def normalize_text(text):
+    """Collapse runs of whitespace (including trailing spaces) into single spaces."""
+    return ' '.join(text.split())
+
+
+def normalize_entries(items, dedupe=True, normalize=True, report=None):
+    """Yield ``iter_m3u_entries`` items cleaned up for rewriting.
+
+    With ``normalize``, channel names and categories get their whitespace
+    collapsed and categories differing only in case take the first spelling
+    seen (a ``group-title`` attribute is updated to match). With ``dedupe``,
+    a channel whose URL was already listed is dropped, e.g. "Colors" and
+    "Colors HD" pointing at the same stream. Counts go into ``report``.
+    Only the seen URLs and category spellings are held in memory.
+    """
+    if report is None:
+        report = {}
+    for key in ('channels', 'duplicates', 'renamed', 'recategorized', 'invalid_urls'):
+        report.setdefault(key, 0)
+    spellings = {}
+    seen_urls = set()
+
+    def category_name(category):
+        cleaned = normalize_text(category)
+        return spellings.setdefault(cleaned.casefold(), cleaned)
+
+    for item in items:
+        if isinstance(item, str):
+            yield category_name(item) if normalize else item
+            continue
+
+        if not _STREAM_URL_RE.match(item.url):
+            report['invalid_urls'] += 1
+        if dedupe:
+            if item.url in seen_urls:
+                report['duplicates'] += 1
+                continue
+            seen_urls.add(item.url)
+
+        if normalize:
+            name = normalize_text(item.name)
+            category = category_name(item.category)
+            attribute_text = item.attribute_text
+            if name != item.name:
+                report['renamed'] += 1
+            if category != item.category:
+                report['recategorized'] += 1
+                group_title = _attribute(attribute_text, ' group-title="')
+                if group_title is not None:
+                    attribute_text = attribute_text.replace(
+                        f' group-title="{group_title}"', f' group-title="{category}"', 1)
+            item = item._replace(name=name, category=category, attribute_text=attribute_text)
+        report['channels'] += 1
+        yield item
+
+
+def iter_m3u_lines(items):
+    """Yield playlist lines for ``iter_m3u_entries`` items, category headers included."""
+    yield "#EXTM3U\n"
+    current_category = None
+    for item in items:
+        category = item if isinstance(item, str) else item.category
+        if category != current_category:
+            current_category = category
+            yield f"\n#========{category}==========\n"
+        if isinstance(item, str):
+            continue
+        duration = int(item.duration) if item.duration == int(item.duration) else item.duration
+        yield f"#EXTINF:{duration}{item.attribute_text or ''},{item.name}\n{item.url}\n"
+
+
+def rewrite_playlist(path, output=None, dedupe=True, normalize=True):
+    """Validate ``path`` and, if ``output`` is given, rewrite it there cleaned up.
+
+    The playlist is streamed from input to output; the output is written to
+    a temporary file and moved into place, so ``output`` may be ``path``.
+    Returns a report dict of counts.
+    """
+    started = time.perf_counter()
+    report = {'path': path, 'output': output, 'untrimmed': 0}
+
+    def count_untrimmed(lines):
+        # The parser strips titles, so whitespace around names is only visible here
+        for line in lines:
+            if line.startswith('#EXTINF:'):
+                match = _EXTINF_RE.match(line.rstrip('\r\n'))
+                if match and match.group(3) != match.group(3).strip():
+                    report['untrimmed'] += 1
+            yield line
+
+    items = normalize_entries(iter_m3u_entries(count_untrimmed(iter_m3u_file(path)), report), dedupe, normalize,
+                              report)
+    if output is None:
+        for _ in items:
+            pass
+    else:
+        directory = os.path.dirname(os.path.abspath(output))
+        descriptor, temporary_path = tempfile.mkstemp(prefix='.playlist-', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                file.writelines(iter_m3u_lines(items))
+            os.replace(temporary_path, output)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+# Channel selected when a view is first shown
+DEFAULT_CHANNEL = "StarSports 1 HD"
+
+# Define preferred sports channels for quick access
+QUICK_ACCESS_CHANNELS = [
+    "StarSports 1 HD",
+    "StarSports 2 HD",
+    "StarSports 3 HD",
+    "StarSports SELECT 1 HD",
+    "StarSports SELECT 2 HD",
+    "StarSports SELECT 1",
+    "StarSports SELECT 2",
+    "Sony Ten 1 HD",
+    "Sony Ten 2 HD",
+    "Sony Ten 3 HD",
+    "StarSports 1 HD HINDI"
+]
+
+
+class ChannelIndex:
+    """Integer channel IDs and precomputed lookups for one ``ChannelTable``.
+
+    IDs are assigned category by category, so every category (and "All")
+    is a contiguous ``range`` of IDs: membership, position and prev/next are
+    arithmetic. Names and URLs are columns of the shared table, decoded on
+    access, so the index itself only adds the default and quick-access IDs.
+    """
+
+    def __init__(self, table, default_channel=DEFAULT_CHANNEL, quick_access_channels=QUICK_ACCESS_CHANNELS):
+        self.table = table
+        self.full_names = table.full_names
+        self.display_names = table.display_names
+        self.original_names = table.names
+        self.urls = table.urls
+        self.category_of = table.category_of
+        self.categories = table.categories
+        self.category_ranges = {
+            category: table.category_range(index) for index, category in enumerate(table.categories)
+        }
+        self.all = range(len(table))
+
+        # First channel matching the default in each view: matching names
+        # are found in the string pool without decoding every channel name
+        default_name_ids = table.pool.containing(default_channel)
+        self.default_ids = {}
+        if default_name_ids:
+            for channel_id, name_id in enumerate(table.name_ids):
+                if name_id in default_name_ids:
+                    self.default_ids.setdefault(None, channel_id)
+                    self.default_ids.setdefault(self.category_of[channel_id], channel_id)
+
+        # Quick access keeps playlist order, like scanning channel_sources did
+        self.quick_access_ids = sorted(
+            channel_id for name in set(quick_access_channels) for channel_id in table.find(name)
+        )
+
+    @classmethod
+    def from_dicts(cls, channel_sources, channel_categories, clean_channels, mirrors=None, **options):
+        """Index of the dicts ``parse_m3u_content`` returns."""
+        return cls(ChannelTable.from_dicts(channel_sources, channel_categories, clean_channels, mirrors), **options)
+
+    def __len__(self):
+        return len(self.all)
+
+    def urls_for(self, channel_id):
+        """Every URL of a channel, primary first, mirrors after it."""
+        return self.table.mirrors_of(channel_id) or (self.urls[channel_id],)
+
+    @cached_property
+    def stream_urls(self):
+        """Every distinct channel URL, mirrors included, in channel order."""
+        return self.table.distinct_urls()
+
+    @cached_property
+    def upstream_hosts(self):
+        """``(scheme, netloc)`` of every channel URL, e.g. for proxy allow-listing."""
+        return frozenset((parts.scheme, parts.netloc) for parts in map(urlsplit, self.stream_urls))
+
+    def view(self, category=None):
+        """Return the ID range for ``category``, or every channel for ``None``."""
+        if category is None:
+            return self.all
+        return self.category_ranges[category]
+
+    def default_id(self, category=None):
+        view = self.view(category)
+        return self.default_ids.get(category, view.start)
+
+
+class Catalog:
+    """An immutable, parsed playlist shared by every session in the process.
+
+    Only the compact ``ChannelTable`` is kept; the dicts it was built from
+    are dropped once the table exists.
+    """
+
+    def __init__(self, path, mtime_ns, size, digest, table):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.table = table
+        self.index = ChannelIndex(table)
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_dicts(cls, path, mtime_ns, size, digest, channel_sources, channel_categories, clean_channels,
+                   mirrors=None):
+        table = ChannelTable.from_dicts(channel_sources, channel_categories, clean_channels, mirrors)
+        return cls(path, mtime_ns, size, digest, table)
+
+
+class CatalogCache:
+    """Loads and parses the playlist once, rebuilding only when the file changes.
+
+    Entries are keyed on path + mtime + content hash: an unchanged ``stat``
+    is a hit without touching the file, a touched-but-identical file is a hit
+    after one re-hash, and only a real content change triggers a re-parse.
+
+    A snapshot compiled next to the playlist (``python channel_table.py
+    list.m3u``) is memory-mapped instead of parsing while the playlist's
+    hash matches the one it records. With ``shared_dir`` set, a parsed
+    table is also saved there under its content hash and memory-mapped
+    back; another process that finds the same hash maps that file instead.
+    """
+
+    def __init__(self, paths=None, shared_dir=CATALOG_SHARED_DIR, use_snapshots=CATALOG_SNAPSHOT_ENABLED):
+        self.paths = list(paths or PLAYLIST_PATHS)
+        self.shared_dir = shared_dir
+        self.use_snapshots = use_snapshots
+        self._lock = threading.Lock()
+        self._catalog = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.snapshot_loads = 0
+        self.last_rebuild_seconds = 0.0
+        # Lines of the last parsed playlist that didn't become channels
+        self.skipped = {'rejected_lines': 0, 'unsupported_urls': 0}
+        # Read errors from the most recent discovery, shown by the UI
+        self.warnings = []
+
+    def get(self):
+        """Return the current ``Catalog``, or ``None`` if no playlist is found."""
+        with self._lock:
+            catalog = self._catalog
+            if catalog is not None:
+                try:
+                    st_result = os.stat(catalog.path)
+                except OSError:
+                    st_result = None
+                if st_result is not None and (st_result.st_mtime_ns, st_result.st_size) == (catalog.mtime_ns, catalog.size):
+                    self.hits += 1
+                    return catalog
+
+            # Includes parsing when a playlist changed
+            with metrics.span('file_discovery'):
+                return self._reload(catalog)
+
+    def _reload(self, previous):
+        self.warnings = []
+        for file_path in self.paths:
+            if not isinstance(file_path, str):
+                continue
+            try:
+                started = time.perf_counter()
+                st_result = os.stat(file_path)
+                digest = file_digest(file_path)
+                if previous is not None and previous.path == file_path and digest == previous.digest:
+                    # Touched but unchanged: keep the parsed data, refresh the key
+                    previous.mtime_ns = st_result.st_mtime_ns
+                    previous.size = st_result.st_size
+                    self.hits += 1
+                    return previous
+
+                shared_path = self._shared_path(digest)
+                snapshot_path = file_path + SNAPSHOT_SUFFIX if self.use_snapshots else None
+                table = self._load_snapshot(snapshot_path, digest)
+                if table is None:
+                    table = self._load_snapshot(shared_path, digest)
+                if table is not None:
+                    self.snapshot_loads += 1
+                else:
+                    mirrors = {}
+                    skipped = {}
+                    channel_sources, channel_categories, clean_channels = parse_m3u_content(
+                        iter_m3u_file(file_path), mirrors, skipped
+                    )
+                    self.skipped = skipped
+                    if skipped['rejected_lines'] or skipped['unsupported_urls']:
+                        self.warnings.append(
+                            f"{file_path}: skipped {skipped['rejected_lines']} unreadable #EXTINF lines and "
+                            f"{skipped['unsupported_urls']} streams that aren't http(s)")
+                    table = ChannelTable.from_dicts(channel_sources, channel_categories, clean_channels,
+                                                    mirrors, digest)
+                    if shared_path is not None:
+                        table = self._share(table, shared_path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                self.warnings.append(f"Error reading {file_path}: {e}")
+                continue
+
+            self.misses += 1
+            self._catalog = Catalog(file_path, st_result.st_mtime_ns, st_result.st_size, digest, table)
+            self.last_rebuild_seconds = time.perf_counter() - started
+            self.rebuilds += 1
+            metrics.inc('catalog_reloads')
+            return self._catalog
+
+        self.misses += 1
+        self._catalog = None
+        return None
+
+    def _shared_path(self, digest):
+        if not self.shared_dir:
+            return None
+        return os.path.join(self.shared_dir, f"catalog-{digest}.bin")
+
+    @staticmethod
+    def _load_snapshot(path, digest):
+        if path is None:
+            return None
+        try:
+            return ChannelTable.load(path, digest)
+        except (OSError, ValueError):
+            # Missing, stale or written by another version: parse instead
+            return None
+
+    @staticmethod
+    def _share(table, shared_path):
+        try:
+            os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+            table.save(shared_path)
+            return ChannelTable.load(shared_path)
+        except (OSError, ValueError):
+            return table
+
+    def current(self):
+        """Return the last loaded ``Catalog`` without checking the file."""
+        return self._catalog
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'snapshot_loads': self.snapshot_loads,
+            'rejected_lines': self.skipped['rejected_lines'],
+            'unsupported_urls': self.skipped['unsupported_urls'],
+            'last_rebuild_ms': round(self.last_rebuild_seconds * 1000, 3),
+            'path': self._catalog.path if self._catalog else None,
+            'mapped': self._catalog is not None and self._catalog.table.buffer is not None,
+        }
+
+
+# Process-wide cache shared by all sessions
+catalog_cache = CatalogCache()
+
+
+def _rewrite_job(job):
+    path, output, dedupe, normalize = job
+    try:
+        return rewrite_playlist(path, output, dedupe, normalize)
+    except (OSError, UnicodeDecodeError) as e:
+        return {'path': path, 'output': output, 'error': str(e)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate, dedupe and normalize M3U playlists.")
+    parser.add_argument('playlists', nargs='+', help="playlist files")
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument('--output-dir', help="write cleaned playlists here, under their own names")
+    destination.add_argument('--in-place', action='store_true', help="replace each playlist with its cleaned copy")
+    parser.add_argument('--no-dedupe', action='store_true', help="keep channels whose URL was already listed")
+    parser.add_argument('--no-normalize', action='store_true', help="keep names and categories as they are")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes for many files")
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for path in args.playlists:
+        output = path if args.in_place else None
+        if args.output_dir:
+            output = os.path.join(args.output_dir, os.path.basename(path))
+        jobs.append((path, output, not args.no_dedupe, not args.no_normalize))
+
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as executor:
+            reports = list(executor.map(_rewrite_job, jobs))
+    else:
+        reports = [_rewrite_job(job) for job in jobs]
+
+    problems = 0
+    for report in reports:
+        if 'error' in report:
+            problems += 1
+            print(f"{report['path']}: {report['error']}")
+            continue
+        found = (report['duplicates'] + report['untrimmed'] + report['renamed'] + report['recategorized']
+                 + report['invalid_urls'])
+        problems += bool(found) and report['output'] is None
+        print(f"{report['path']}: {report['channels']} channels, {report['duplicates']} duplicate URLs, "
+              f"{report['untrimmed']} untrimmed and {report['renamed']} irregularly spaced names, "
+              f"{report['recategorized']} categories to normalize, "
+              f"{report['invalid_urls']} invalid URLs ({report['seconds'] * 1000:.0f} ms)"
+              + (f" -> {report['output']}" if report['output'] else ''))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""The virtualized channel list embedded by ``main.py``.
+
+``channel_list`` renders the component in ``channel_list_component/``: the
+browser gets the number of rows and one window of ``CHANNEL_LIST_PAGE``
+rows, and renders only those on screen plus a small overscan. Scrolling
+past the window asks for another one through the component value, so what
+a rerun sends doesn't grow with the catalog. ``ChannelListState`` keeps the
+window of one list in the session and turns the list's events into the
+selected channel.
+"""
+import os
+
+from metrics import metrics
+
+# Rows sent to the browser per rerun
+CHANNEL_LIST_PAGE = int(os.environ.get('AAEC_CHANNEL_LIST_PAGE', '60'))
+CHANNEL_LIST_ROW_HEIGHT = 32
+CHANNEL_LIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'channel_list_component')
+
+_channel_list_component = None
+
+
+def window_start(index, total, page=CHANNEL_LIST_PAGE):
+    """First row of the window of ``page`` rows showing row ``index`` a third of the way down."""
+    return max(0, min(index - page // 3, total - page))
+
+
+def channel_list(rows, offset, total, selected_id, selected_index, view, height=420, page=CHANNEL_LIST_PAGE,
+                 key='channel_list', on_change=None):
+    """Render the virtualized list and return its last event, if any.
+
+    ``rows`` are ``[channel ID, label, caption]`` for the rows of the list
+    from ``offset``, out of ``total``. A new ``view`` (any string naming
+    what is listed) or ``selected_id`` scrolls row ``selected_index`` into
+    view. Events are ``{'event': 'select', 'id', 'seq'}`` when a row is
+    clicked and ``{'event': 'window', 'start', 'seq'}`` when rows outside
+    the window scroll into view; ``seq`` makes each one a new value.
+    """
+    global _channel_list_component
+    if _channel_list_component is None:
+        # Declared on first use: registration needs a running script
+        from streamlit.components.v1 import declare_component
+        _channel_list_component = declare_component('channel_list', path=CHANNEL_LIST_DIR)
+    with metrics.span('channel_list_component'):
+        return _channel_list_component(rows=rows, offset=offset, total=total, selected_id=selected_id,
+                                       selected_index=selected_index, view=view, height=height, page=page,
+                                       row_height=CHANNEL_LIST_ROW_HEIGHT, key=key, on_change=on_change,
+                                       default=None)
+
+
+class ChannelListState:
+    """Window and selection of one channel list, kept in a session's state.
+
+    ``session_state`` is the Streamlit session state; the selected channel
+    ID lives in it under ``channel_key`` so other controls can set it too.
+    """
+
+    def __init__(self, session_state, key, channel_key, page=CHANNEL_LIST_PAGE):
+        self.session_state = session_state
+        self.key = key
+        self.channel_key = channel_key
+        self.page = page
+        self._window_key = f'{key}_window'
+
+    def on_event(self):
+        """Component callback: apply the list's last event before the rerun."""
+        event = self.session_state.get(self.key)
+        if not isinstance(event, dict):
+            return
+        window = self.session_state.setdefault(self._window_key, {'start': 0, 'view': None, 'selected': None})
+        if event.get('event') == 'select' and isinstance(event.get('id'), int):
+            # Unknown IDs fall back to the view's default like any stale selection
+            self.session_state[self.channel_key] = event['id']
+            window['selected'] = event['id']
+        elif event.get('event') == 'window' and isinstance(event.get('start'), int):
+            window['start'] = event['start']
+
+    def render(self, channels, labels, captions=None, view='', height=420):
+        """Render the list of ``channels`` (IDs); ``labels`` and ``captions`` map an ID to its text."""
+        window = self.session_state.setdefault(self._window_key, {'start': 0, 'view': None, 'selected': None})
+        selected_id = self.session_state[self.channel_key]
+        selected_index = channels.index(selected_id)
+        total = len(channels)
+        # Follow a selection made elsewhere (navigation, search, quick access)
+        # unless it is already in the window the viewer scrolled to
+        if view != window['view'] or (
+            selected_id != window['selected']
+            and not window['start'] <= selected_index < window['start'] + self.page
+        ):
+            window['start'] = window_start(selected_index, total, self.page)
+        window['view'] = view
+        window['selected'] = selected_id
+
+        offset = max(0, min(window['start'], total - self.page))
+        rows = [
+            [channel_id, labels(channel_id), captions(channel_id) if captions is not None else '']
+            for channel_id in channels[offset:offset + self.page]
+        ]
+        return channel_list(rows, offset, total, selected_id, selected_index, view, height, self.page,
+                            key=self.key, on_change=self.on_event)
@@ -0,0 +1,151 @@
+// Virtualized channel list component.
+//
+// Only a window of rows (a page around what is on screen) comes with each
+// "streamlit:render" message, together with the total number of rows, so
+// the payload is the same size for ten channels or a hundred thousand. The
+// scroll area is sized for every row; only the rows in view plus a small
+// overscan are in the DOM. Scrolling to rows outside the window shows
+// placeholders and asks the server for a new window through the component
+// value; clicking a row sends its channel ID the same way.
+(function () {
+  var viewport = document.getElementById('viewport');
+  var spacer = document.getElementById('spacer');
+
+  var rows = [];
+  var offset = 0;
+  var total = 0;
+  var page = 60;
+  var overscan = 8;
+  var rowHeight = 32;
+  var selectedId = null;
+  var view = null;
+  var lastHeight = 0;
+  var requested = null;
+  var requestTimer = null;
+  var eventCount = 0;
+  var frame = null;
+
+  function send(type, data) {
+    var message = { isStreamlitMessage: true, type: type };
+    for (var key in data) { message[key] = data[key]; }
+    window.parent.postMessage(message, '*');
+  }
+
+  function sendEvent(value) {
+    // Unique across remounts of the iframe, so every event changes the value
+    eventCount += 1;
+    value.seq = Date.now() * 1000 + eventCount % 1000;
+    send('streamlit:setComponentValue', { value: value, dataType: 'json' });
+  }
+
+  function setFrameHeight() {
+    var height = viewport.offsetHeight;
+    if (height !== lastHeight) {
+      lastHeight = height;
+      send('streamlit:setFrameHeight', { height: height });
+    }
+  }
+
+  function requestWindow(first) {
+    // Centre the next window on what is in view; debounced so a fling
+    // only asks once it settles
+    var start = Math.max(0, Math.min(first - Math.floor(page / 3), total - page));
+    if (start === requested) { return; }
+    clearTimeout(requestTimer);
+    requestTimer = setTimeout(function () {
+      requested = start;
+      sendEvent({ event: 'window', start: start });
+    }, 150);
+  }
+
+  function draw() {
+    frame = null;
+    var first = Math.floor(viewport.scrollTop / rowHeight);
+    var visible = Math.ceil(viewport.clientHeight / rowHeight);
+    var start = Math.max(0, first - overscan);
+    var end = Math.min(total, first + visible + overscan);
+
+    var fragment = document.createDocumentFragment();
+    for (var index = start; index < end; index++) {
+      var row = rows[index - offset];
+      var element = document.createElement('div');
+      element.style.top = (index * rowHeight) + 'px';
+      element.style.height = rowHeight + 'px';
+      if (row) {
+        element.className = 'row' + (row[0] === selectedId ? ' selected' : '');
+        element.dataset.id = row[0];
+        var label = document.createElement('span');
+        label.className = 'label';
+        label.textContent = row[1];
+        element.appendChild(label);
+        if (row[2]) {
+          var caption = document.createElement('span');
+          caption.className = 'caption';
+          caption.textContent = row[2];
+          element.appendChild(caption);
+        }
+      } else {
+        element.className = 'row pending';
+        element.textContent = '…';
+      }
+      fragment.appendChild(element);
+    }
+    spacer.replaceChildren(fragment);
+
+    if (start < offset || end > offset + rows.length) {
+      requestWindow(first);
+    } else {
+      clearTimeout(requestTimer);
+    }
+  }
+
+  function scheduleDraw() {
+    if (frame === null) { frame = window.requestAnimationFrame(draw); }
+  }
+
+  function scrollToIndex(index) {
+    var top = index * rowHeight;
+    if (top < viewport.scrollTop || top + rowHeight > viewport.scrollTop + viewport.clientHeight) {
+      viewport.scrollTop = Math.max(0, top - Math.floor(viewport.clientHeight / 3));
+    }
+  }
+
+  spacer.addEventListener('click', function (event) {
+    var element = event.target.closest('.row');
+    if (!element || element.dataset.id === undefined) { return; }
+    var id = Number(element.dataset.id);
+    if (id === selectedId) { return; }
+    // Highlight at once; the server confirms with the next render
+    selectedId = id;
+    scheduleDraw();
+    sendEvent({ event: 'select', id: id });
+  });
+
+  viewport.addEventListener('scroll', scheduleDraw, { passive: true });
+
+  window.addEventListener('message', function (event) {
+    var data = event.data;
+    if (event.source !== window.parent || !data || data.type !== 'streamlit:render') { return; }
+    var args = data.args;
+    rows = args.rows || [];
+    offset = args.offset || 0;
+    total = args.total || 0;
+    page = args.page || page;
+    rowHeight = args.row_height || rowHeight;
+    requested = null;
+    viewport.style.height = args.height + 'px';
+    spacer.style.height = (total * rowHeight) + 'px';
+
+    // A new view or a selection made elsewhere scrolls the selected row into view
+    var moved = args.view !== view || args.selected_id !== selectedId;
+    view = args.view;
+    selectedId = args.selected_id;
+    if (moved && args.selected_index >= 0) {
+      scrollToIndex(args.selected_index);
+    }
+    setFrameHeight();
+    draw();
+  });
+
+  send('streamlit:componentReady', { apiVersion: 1 });
+})();
@@ -0,0 +1,424 @@
+"""Compact, immutable column storage for the channel catalog.
+
+The parsed playlist used to live in three dicts (sources, categories, clean
+names) plus per-channel name and URL lists, repeating every URL and name as
+separate ``str`` objects. A ``ChannelTable`` instead keeps each distinct
+string once, UTF-8 encoded in a single buffer (a ``StringPool``), and the
+channel rows as ``array`` columns of pool numbers:
+
+    table = ChannelTable.from_dicts(channel_sources, channel_categories, clean_channels)
+    table.names[channel_id], table.urls[channel_id]   # decoded on access
+
+Display names (``"08. StarSports 1 HD"``) and full names
+(``"[SPORTS] 08. StarSports 1 HD"``) are formatted from the channel number
+on access instead of being stored. The table can be written to a file and
+memory-mapped back (``save``/``load``), so several server worker processes
+share one copy of the pages instead of each holding its own.
+
+Such a snapshot is versioned and records the SHA-1 of the playlist it was
+compiled from; ``CatalogCache`` maps ``list.m3u.catalog`` at cold start
+when that hash still matches, skipping the text parse entirely, and falls
+back to ``parse_m3u_content`` when it doesn't. Compile one with
+
+    python channel_table.py list.m3u            # writes list.m3u.catalog
+    python channel_table.py list.m3u --check    # is the snapshot current?
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+SNAPSHOT_MAGIC = b'AAECTBL\x00'
+SNAPSHOT_VERSION = 3
+# Written next to the playlist by the compile tool
+SNAPSHOT_SUFFIX = '.catalog'
+
+# Section order in a snapshot; each one is an array of unsigned 32-bit ints
+# except the UTF-8 string data and the ASCII source digest
+_SECTIONS = ('source_digest', 'pool_offsets', 'pool_data', 'category_starts', 'name_ids', 'url_ids',
+             'numbers', 'name_order', 'mirror_channels', 'mirror_starts', 'mirror_url_ids', 'tvg_id_ids')
+# Pool number of a missing string, e.g. a channel without a tvg-id
+NO_STRING = 0xFFFFFFFF
+# Written natively; a snapshot from a machine with another byte order is rejected
+_BYTE_ORDER_MARK = 0x01020304
+_HEADER = struct.Struct('=8sIII' + 'QQ' * len(_SECTIONS))
+
+
+class StringPool:
+    """Distinct strings packed into one UTF-8 buffer, addressed by number."""
+
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, number):
+        offsets = self.offsets
+        return str(self.data[offsets[number]:offsets[number + 1]], 'utf-8')
+
+    def containing(self, text):
+        """Numbers of the strings containing ``text``, found in the encoded data without decoding it."""
+        offsets = self.offsets
+        encoded = text.encode('utf-8')
+        pattern = re.compile(re.escape(encoded))
+        numbers = set()
+        position = 0
+        while True:
+            match = pattern.search(self.data, position)
+            if match is None:
+                return numbers
+            start = match.start()
+            number = bisect_right(offsets, start) - 1
+            if start + len(encoded) <= offsets[number + 1]:
+                numbers.add(number)
+                position = offsets[number + 1]
+            else:
+                # Spans two strings; a real match may still start inside it
+                position = start + 1
+
+
+class StringPoolBuilder:
+    """Collects strings for a ``StringPool``; equal strings share one number."""
+
+    def __init__(self):
+        self.numbers = {}
+        self.chunks = []
+        self.offsets = array('I', [0])
+
+    def add(self, text):
+        number = self.numbers.get(text)
+        if number is None:
+            encoded = text.encode('utf-8')
+            number = self.numbers[text] = len(self.chunks)
+            self.chunks.append(encoded)
+            self.offsets.append(self.offsets[-1] + len(encoded))
+        return number
+
+    def build(self):
+        return StringPool(b''.join(self.chunks), self.offsets)
+
+
+class Column:
+    """Read-only sequence of ``values[codes[row]]``."""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+
+class CategoryColumn:
+    """Category name of each row, found from the category start offsets."""
+
+    __slots__ = ('categories', 'starts')
+
+    def __init__(self, categories, starts):
+        self.categories = categories
+        self.starts = starts
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.starts[-1]:
+            raise IndexError(row)
+        # Empty categories share their start with the next one; the last wins
+        return self.categories[bisect_right(self.starts, row) - 1]
+
+
+class LabelColumn:
+    """``"NN. name"`` labels of each row, with a ``"[category] "`` prefix if ``full``."""
+
+    __slots__ = ('table', 'full')
+
+    def __init__(self, table, full=False):
+        self.table = table
+        self.full = full
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, row):
+        table = self.table
+        label = f"{table.numbers[row]:02d}. {table.names[row]}"
+        return f"[{table.category_of[row]}] {label}" if self.full else label
+
+
+class ChannelTable:
+    """Channel rows grouped by category, in catalog ID order.
+
+    Every category is the contiguous row range
+    ``category_starts[i]:category_starts[i + 1]``, and the first strings of
+    the pool are the category names, in order. ``name_order`` lists the
+    rows sorted by name for ``find``. Mirror URLs are stored for channels
+    with more than one URL only, in compressed sparse rows:
+    ``mirror_channels`` (sorted IDs) and their slices of ``mirror_url_ids``.
+    ``tvg_id_ids`` holds the ``tvg-id`` of each row, ``NO_STRING`` if none.
+    ``source_digest`` is the SHA-1 of the playlist the table was built from.
+    """
+
+    __slots__ = ('pool', 'categories', 'category_starts', 'name_ids', 'url_ids', 'numbers', 'name_order',
+                 'mirror_channels', 'mirror_starts', 'mirror_url_ids', 'tvg_id_ids', 'source_digest',
+                 'names', 'urls', 'category_of', 'display_names', 'full_names', 'buffer')
+
+    def __init__(self, pool, categories, category_starts, name_ids, url_ids, numbers, name_order,
+                 mirror_channels, mirror_starts, mirror_url_ids, tvg_id_ids, source_digest=None, buffer=None):
+        self.pool = pool
+        self.categories = categories
+        self.category_starts = category_starts
+        self.name_ids = name_ids
+        self.url_ids = url_ids
+        self.numbers = numbers
+        self.name_order = name_order
+        self.mirror_channels = mirror_channels
+        self.mirror_starts = mirror_starts
+        self.mirror_url_ids = mirror_url_ids
+        self.tvg_id_ids = tvg_id_ids
+        self.source_digest = source_digest
+        self.names = Column(pool, name_ids)
+        self.urls = Column(pool, url_ids)
+        self.category_of = CategoryColumn(categories, category_starts)
+        self.display_names = LabelColumn(self)
+        self.full_names = LabelColumn(self, full=True)
+        # The mapping a loaded table reads from, kept open for its lifetime
+        self.buffer = buffer
+
+    @classmethod
+    def from_dicts(cls, channel_sources, channel_categories, clean_channels, mirrors=None, source_digest=None):
+        """Build a table from what ``parse_m3u_content`` returns.
+
+        ``mirrors`` maps full channel names to all of their URLs, as filled
+        in by ``build_channel_dicts``.
+        """
+        pool = StringPoolBuilder()
+        categories = tuple(channel_categories)
+        for category in categories:
+            pool.add(category)
+        category_starts = array('I', [0])
+        name_ids = array('I')
+        url_ids = array('I')
+        numbers = array('I')
+        mirror_channels = array('I')
+        mirror_starts = array('I', [0])
+        mirror_url_ids = array('I')
+        tvg_id_ids = array('I')
+        mirrors = mirrors or {}
+        row_names = []
+
+        for category, full_names in channel_categories.items():
+            prefix_length = len(category) + 3  # "[<category>] "
+            for full_name in full_names:
+                display_name = full_name[prefix_length:]
+                urls = mirrors.get(full_name)
+                if urls is not None and len(urls) > 1:
+                    mirror_channels.append(len(name_ids))
+                    mirror_url_ids.extend(pool.add(url) for url in urls)
+                    mirror_starts.append(len(mirror_url_ids))
+                entry = clean_channels[display_name]
+                name = entry.name
+                tvg_id = entry.tvg_id
+                tvg_id_ids.append(pool.add(tvg_id) if tvg_id else NO_STRING)
+                row_names.append(name)
+                name_ids.append(pool.add(name))
+                url_ids.append(pool.add(channel_sources[full_name]))
+                numbers.append(int(display_name[:display_name.index('.')]))
+            category_starts.append(len(name_ids))
+
+        # A stable sort keeps equal names in row order
+        name_order = array('I', sorted(range(len(row_names)), key=row_names.__getitem__))
+        return cls(pool.build(), categories, category_starts, name_ids, url_ids, numbers, name_order,
+                   mirror_channels, mirror_starts, mirror_url_ids, tvg_id_ids, source_digest)
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def category_range(self, index):
+        return range(self.category_starts[index], self.category_starts[index + 1])
+
+    def find(self, name):
+        """IDs of the channels named exactly ``name``, in ID order."""
+        key = self.names.__getitem__
+        start = bisect_left(self.name_order, name, key=key)
+        return list(self.name_order[start:bisect_right(self.name_order, name, start, key=key)])
+
+    def mirrors_of(self, row):
+        """Every URL of a channel with mirrors, primary first, or ``None``."""
+        position = bisect_left(self.mirror_channels, row)
+        if position == len(self.mirror_channels) or self.mirror_channels[position] != row:
+            return None
+        pool = self.pool
+        return tuple(pool[number] for number in self._mirror_url_ids(position))
+
+    def tvg_id(self, row):
+        """The ``tvg-id`` of a channel, or ``None``."""
+        number = self.tvg_id_ids[row]
+        return self.pool[number] if number != NO_STRING else None
+
+    def _mirror_url_ids(self, position):
+        return self.mirror_url_ids[self.mirror_starts[position]:self.mirror_starts[position + 1]]
+
+    def distinct_urls(self):
+        """Every distinct URL, mirrors included, in row order."""
+        numbers = dict.fromkeys(self.url_ids)
+        if self.mirror_channels:
+            # Keep each channel's mirrors right after its primary URL
+            numbers = {}
+            url_ids = self.url_ids
+            previous = 0
+            for position, row in enumerate(self.mirror_channels):
+                numbers.update(dict.fromkeys(url_ids[previous:row]))
+                numbers.update(dict.fromkeys(self._mirror_url_ids(position)))
+                previous = row + 1
+            numbers.update(dict.fromkeys(url_ids[previous:]))
+        pool = self.pool
+        return [pool[number] for number in numbers]
+
+    def to_bytes(self):
+        """Serialize the table; ``from_buffer`` maps it back without copying."""
+        pool = self.pool
+        sections = {
+            'source_digest': (self.source_digest or '').encode('ascii'),
+            'pool_offsets': array('I', pool.offsets).tobytes(),
+            'pool_data': bytes(pool.data),
+            'category_starts': array('I', self.category_starts).tobytes(),
+            'name_ids': array('I', self.name_ids).tobytes(),
+            'url_ids': array('I', self.url_ids).tobytes(),
+            'numbers': array('I', self.numbers).tobytes(),
+            'name_order': array('I', self.name_order).tobytes(),
+            'mirror_channels': array('I', self.mirror_channels).tobytes(),
+            'mirror_starts': array('I', self.mirror_starts).tobytes(),
+            'mirror_url_ids': array('I', self.mirror_url_ids).tobytes(),
+            'tvg_id_ids': array('I', self.tvg_id_ids).tobytes(),
+        }
+        return _pack(sections)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Table over ``buffer`` (``bytes`` or an ``mmap``); columns are views into it."""
+        view = memoryview(buffer)
+        sections = _unpack(view)
+
+        def ints(name):
+            return sections[name].cast('I')
+
+        pool = StringPool(sections['pool_data'], ints('pool_offsets'))
+        categories = tuple(pool[number] for number in range(len(ints('category_starts')) - 1))
+        return cls(pool, categories, ints('category_starts'), ints('name_ids'), ints('url_ids'), ints('numbers'),
+                   ints('name_order'), ints('mirror_channels'), ints('mirror_starts'), ints('mirror_url_ids'),
+                   ints('tvg_id_ids'), str(sections['source_digest'], 'ascii') or None, buffer=buffer)
+
+    def save(self, path):
+        """Write the table to ``path`` atomically: readers see the old file or the new one."""
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary_path = tempfile.mkstemp(prefix='.catalog-', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(self.to_bytes())
+            os.replace(temporary_path, path)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, source_digest=None):
+        """Memory-map a saved table; processes loading the same file share its pages.
+
+        With ``source_digest``, a table compiled from other playlist content
+        raises ``ValueError`` like a malformed file does.
+        """
+        with open(path, 'rb') as file:
+            table = cls.from_buffer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        if source_digest is not None and table.source_digest != source_digest:
+            raise ValueError("Stale catalog snapshot")
+        return table
+
+
+def _pack(sections):
+    body = []
+    layout = []
+    position = _HEADER.size
+    for name in _SECTIONS:
+        data = sections[name]
+        position += -position % 8
+        layout.extend((position, len(data)))
+        body.append(data)
+        position += len(data)
+    parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _BYTE_ORDER_MARK, len(_SECTIONS), *layout)]
+    written = _HEADER.size
+    for (offset, _), data in zip(zip(layout[::2], layout[1::2]), body):
+        parts.append(b'\0' * (offset - written))
+        parts.append(data)
+        written = offset + len(data)
+    return b''.join(parts)
+
+
+def _unpack(view):
+    if len(view) < _HEADER.size:
+        raise ValueError("Truncated catalog snapshot")
+    magic, version, byte_order, section_count, *layout = _HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a catalog snapshot")
+    if version != SNAPSHOT_VERSION or byte_order != _BYTE_ORDER_MARK or section_count != len(_SECTIONS):
+        raise ValueError(f"Unsupported catalog snapshot (version {version})")
+    sections = {}
+    for name, offset, size in zip(_SECTIONS, layout[::2], layout[1::2]):
+        if offset + size > len(view):
+            raise ValueError("Truncated catalog snapshot")
+        sections[name] = view[offset:offset + size]
+    return sections
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a playlist into a memory-mappable catalog snapshot.")
+    parser.add_argument('playlist', help="M3U playlist to compile")
+    parser.add_argument('--output', help="snapshot path (default: <playlist>%s)" % SNAPSHOT_SUFFIX)
+    parser.add_argument('--check', action='store_true', help="only report whether the snapshot is current")
+    args = parser.parse_args(argv)
+
+    # Imported here: catalog itself builds on this module
+    from catalog import file_digest, iter_m3u_file, parse_m3u_content
+
+    output = args.output or args.playlist + SNAPSHOT_SUFFIX
+    digest = file_digest(args.playlist)
+    if args.check:
+        try:
+            table = ChannelTable.load(output, digest)
+        except (OSError, ValueError) as e:
+            print(f"{output}: {e}")
+            return 1
+        print(f"{output}: current ({len(table)} channels, version {SNAPSHOT_VERSION})")
+        return 0
+
+    mirrors = {}
+    table = ChannelTable.from_dicts(*parse_m3u_content(iter_m3u_file(args.playlist), mirrors), mirrors, digest)
+    table.save(output)
+    print(f"{output}: {len(table)} channels, {len(table.categories)} categories, "
+          f"{len(table.pool)} distinct strings, {os.path.getsize(output):,} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""Programme guide (EPG) from XMLTV feeds, with now/next lookups.
+
+Set ``AAEC_EPG_SOURCES`` to a comma-separated list of local XMLTV files and
+``http(s)://`` feed URLs (plain or gzipped) to show what is on:
+
+    AAEC_EPG_SOURCES=https://provider.example/guide.xml.gz
+
+Feeds run to hundreds of MB, so they are never loaded whole: remote ones
+are streamed to a spool file (re-fetched with ``If-None-Match`` and
+``If-Modified-Since``), and every feed is read with ``iterparse``, each
+element cleared as soon as it is handled. Only programmes overlapping the
+next ``AAEC_EPG_HOURS`` hours are kept, per guide channel and sorted by
+start time in ``array`` columns, so ``now_next`` is a binary search. A
+daemon thread re-reads the feeds every ``AAEC_EPG_REFRESH`` seconds, which
+rolls the window forward, and publishes each new ``Guide`` with a single
+reference swap.
+
+Catalog channels are matched to guide channels by ``tvg-id``, falling back
+to their names with case, punctuation and quality tags like "HD" ignored.
+Run ``python epg.py GUIDE... --playlist list.m3u`` to check a feed.
+"""
+import argparse
+import calendar
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from metrics import metrics
+
+EPG_SOURCES = [location.strip() for location in os.environ.get('AAEC_EPG_SOURCES', '').split(',') if location.strip()]
+# Programmes further ahead than this are dropped while parsing
+EPG_WINDOW_HOURS = float(os.environ.get('AAEC_EPG_HOURS', '12'))
+EPG_REFRESH_SECONDS = float(os.environ.get('AAEC_EPG_REFRESH', '3600'))
+# Where remote feeds are spooled to between refreshes
+EPG_CACHE_DIR = os.environ.get('AAEC_EPG_CACHE_DIR') or tempfile.gettempdir()
+
+Programme = namedtuple('Programme', ['start', 'stop', 'title'])
+
+# Tags that tell renditions of one channel apart, not channels
+_QUALITY_RE = re.compile(r'\b(?:hd|fhd|uhd|sd|4k)\b')
+_NOT_ALNUM_RE = re.compile(r'[\W_]+')
+
+
+def channel_key(name):
+    """Lowercase letters and digits of a channel name without quality tags, for matching."""
+    return _NOT_ALNUM_RE.sub('', _QUALITY_RE.sub('', name.casefold()))
+
+
+def parse_xmltv_time(text):
+    """Epoch seconds of an XMLTV timestamp like ``20240101203000 +0100``, or ``None``."""
+    if not text:
+        return None
+    digits, _, offset = text.strip().partition(' ')
+    try:
+        seconds = calendar.timegm((int(digits[0:4]), int(digits[4:6] or 1), int(digits[6:8] or 1),
+                                   int(digits[8:10] or 0), int(digits[10:12] or 0), int(digits[12:14] or 0)))
+        if offset:
+            sign = -1 if offset[0] == '-' else 1
+            offset = offset.lstrip('+-')
+            seconds -= sign * (int(offset[0:2]) * 3600 + int(offset[2:4] or 0) * 60)
+    except ValueError:
+        return None
+    return seconds
+
+
+def open_feed(path):
+    """Open an XMLTV file for reading, decompressing it if it is gzipped."""
+    with open(path, 'rb') as file:
+        gzipped = file.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if gzipped else open(path, 'rb')
+
+
+def iter_xmltv(file):
+    """Yield ``('channel', id, display_names)`` and ``('programme', channel, start, stop, title)``.
+
+    Parses incrementally: every handled element is cleared from the tree
+    right away, so memory stays flat however large the feed is.
+    """
+    context = ElementTree.iterparse(file, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event != 'end':
+            continue
+        tag = element.tag
+        if tag == 'programme':
+            title = element.findtext('title')
+            yield ('programme', element.get('channel'), parse_xmltv_time(element.get('start')),
+                   parse_xmltv_time(element.get('stop')), title.strip() if title else '')
+            root.clear()
+        elif tag == 'channel':
+            yield ('channel', element.get('id'),
+                   [name.text.strip() for name in element.iterfind('display-name') if name.text])
+            root.clear()
+
+
+class GuideBuilder:
+    """Collects the programmes of one ingest that overlap ``[window_start, window_end)``."""
+
+    def __init__(self, window_start, window_end):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.slots = {}  # guide channel id -> slot
+        self.names = {}  # channel_key of a display name -> slot
+        self.rows = []  # per slot: start, stop, title number, repeated
+        self.titles = {}
+        self.skipped = 0
+
+    def _slot(self, channel_id):
+        slot = self.slots.get(channel_id)
+        if slot is None:
+            slot = self.slots[channel_id] = len(self.rows)
+            self.rows.append(array('q'))
+        return slot
+
+    def add(self, items):
+        """Fold in what ``iter_xmltv`` yields."""
+        for item in items:
+            if item[0] == 'channel':
+                _, channel_id, display_names = item
+                if not channel_id:
+                    continue
+                slot = self._slot(channel_id)
+                for name in display_names:
+                    self.names.setdefault(channel_key(name), slot)
+                continue
+            _, channel_id, start, stop, title = item
+            if not channel_id or start is None or start >= self.window_end:
+                self.skipped += 1
+                continue
+            if stop is None or stop <= start:
+                # Open-ended: lasts until the next one starts (set in ``build``)
+                stop = 0
+            elif stop <= self.window_start:
+                self.skipped += 1
+                continue
+            title_number = self.titles.get(title)
+            if title_number is None:
+                title_number = self.titles[title] = len(self.titles)
+            self.rows[self._slot(channel_id)].extend((start, stop, title_number))
+
+    def add_guide(self, guide):
+        """Fold in a ``Guide`` built before, such as a feed's last good one."""
+        slots = {old_slot: self._slot(channel_id) for channel_id, old_slot in guide.slots.items()}
+        for key, old_slot in guide.names.items():
+            self.names.setdefault(key, slots[old_slot])
+        for old_slot, slot in slots.items():
+            rows = self.rows[slot]
+            for position in range(guide.slot_starts[old_slot], guide.slot_starts[old_slot + 1]):
+                start, stop = guide.starts[position], guide.stops[position]
+                if start >= self.window_end or stop <= self.window_start:
+                    self.skipped += 1
+                    continue
+                title = guide.titles[guide.title_numbers[position]]
+                title_number = self.titles.get(title)
+                if title_number is None:
+                    title_number = self.titles[title] = len(self.titles)
+                rows.extend((start, stop, title_number))
+
+    def build(self):
+        """The ``Guide`` of everything added, sorted by start time per channel."""
+        slot_starts = array('I', [0])
+        starts = array('q')
+        stops = array('q')
+        title_numbers = array('I')
+        for rows in self.rows:
+            programmes = sorted(zip(rows[0::3], rows[1::3], rows[2::3]))
+            for position, (start, stop, title_number) in enumerate(programmes):
+                if not stop:
+                    stop = programmes[position + 1][0] if position + 1 < len(programmes) else self.window_end
+                if stop <= self.window_start:
+                    continue
+                starts.append(start)
+                stops.append(stop)
+                title_numbers.append(title_number)
+            slot_starts.append(len(starts))
+        # Names of ids like "StarSports1.in" match too, after display names
+        names = dict(self.names)
+        for channel_id, slot in self.slots.items():
+            names.setdefault(channel_key(channel_id.rsplit('.', 1)[0]), slot)
+        return Guide(self.slots, names, slot_starts, starts, stops, title_numbers, list(self.titles),
+                     self.window_start, self.window_end)
+
+
+class Guide:
+    """Immutable programmes per guide channel in compressed sparse rows.
+
+    The programmes of slot ``s`` are ``slot_starts[s]:slot_starts[s + 1]``
+    of the ``starts``, ``stops`` and ``title_numbers`` columns, by start time.
+    """
+
+    def __init__(self, slots, names, slot_starts, starts, stops, title_numbers, titles, window_start, window_end):
+        self.slots = slots
+        self.names = names
+        self.slot_starts = slot_starts
+        self.starts = starts
+        self.stops = stops
+        self.title_numbers = title_numbers
+        self.titles = titles
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def __len__(self):
+        return len(self.starts)
+
+    def slot_for(self, tvg_id, name):
+        """Slot of the guide channel matching a catalog channel, or ``None``."""
+        if tvg_id:
+            slot = self.slots.get(tvg_id)
+            if slot is not None:
+                return slot
+        return self.names.get(channel_key(name))
+
+    def _programme(self, position):
+        return Programme(self.starts[position], self.stops[position], self.titles[self.title_numbers[position]])
+
+    def now_next(self, slot, at):
+        """``(programme on at ``at``, the one after it)``; either may be ``None``."""
+        low, high = self.slot_starts[slot], self.slot_starts[slot + 1]
+        position = bisect_right(self.starts, at, low, high) - 1
+        current = None
+        if position >= low and self.stops[position] > at:
+            current = self._programme(position)
+        upcoming = self._programme(position + 1) if position + 1 < high else None
+        return current, upcoming
+
+
+class GuideSource:
+    """One configured XMLTV location; remote feeds are spooled to ``cache_dir``."""
+
+    def __init__(self, location, cache_dir=EPG_CACHE_DIR, timeout=60.0):
+        self.location = location
+        self.is_remote = '://' in location
+        self.timeout = timeout
+        self.path = location
+        if self.is_remote:
+            digest = hashlib.sha1(location.encode('utf-8')).hexdigest()[:16]
+            self.path = os.path.join(cache_dir, f'epg-{digest}.xml')
+        self.etag = None
+        self.last_modified = None
+        self.size = 0
+        self.error = None
+        # Guide of the last successful read, used while the feed fails
+        self.guide = None
+        self.skipped = 0
+        self.fetches = 0
+        self.not_modified = 0
+
+    def refresh(self):
+        """Bring the local copy up to date; only remote feeds need fetching."""
+        if not self.is_remote:
+            self.size = os.path.getsize(self.path)
+            return
+        headers = {}
+        if os.path.exists(self.path):
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+        self.fetches += 1
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(self.location, headers=headers),
+                                              timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and headers:
+                self.not_modified += 1
+                return
+            raise
+        with response:
+            # Streamed to disk and swapped in whole, so a reader never sees half a feed
+            descriptor, temporary_path = tempfile.mkstemp(prefix='.epg-', dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    shutil.copyfileobj(response, file, 1 << 16)
+                os.replace(temporary_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(temporary_path)
+                except OSError:
+                    pass
+                raise
+            self.etag = response.headers.get('etag')
+            self.last_modified = response.headers.get('last-modified')
+        self.size = os.path.getsize(self.path)
+
+
+class EPGStore:
+    """The current ``Guide`` of the configured feeds, re-read in the background."""
+
+    def __init__(self, locations, window_hours=EPG_WINDOW_HOURS, interval=EPG_REFRESH_SECONDS,
+                 cache_dir=EPG_CACHE_DIR):
+        self.sources = [GuideSource(location, cache_dir) for location in locations]
+        self.window_seconds = window_hours * 3600
+        self.interval = interval
+        self._guide = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.ingests = 0
+        self.skipped = 0
+        self.last_ingest_seconds = 0.0
+        self.warnings = []
+
+    def current(self):
+        """Return the last published ``Guide``, or ``None`` before the first ingest."""
+        return self._guide
+
+    def refresh_now(self, now=None):
+        """Re-read every feed and publish a new guide for the window starting at ``now``."""
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        window_start, window_end = int(now), int(now + self.window_seconds)
+        for source in self.sources:
+            try:
+                source.refresh()
+                source_builder = GuideBuilder(window_start, window_end)
+                with open_feed(source.path) as file:
+                    source_builder.add(iter_xmltv(file))
+                source.guide = source_builder.build()
+                source.skipped = source_builder.skipped
+            except Exception as e:
+                source.error = str(e) or e.__class__.__name__
+            else:
+                source.error = None
+        self.warnings = [f"Error reading EPG {source.location}: {source.error}" for source in self.sources
+                         if source.error]
+        # A feed that fails keeps contributing its last good programmes,
+        # trimmed to the new window, until it reads again
+        guides = [source.guide for source in self.sources if source.guide is not None]
+        if len(guides) == 1 and guides[0].window_start == window_start:
+            self._guide = guides[0]
+        else:
+            builder = GuideBuilder(window_start, window_end)
+            for guide in guides:
+                builder.add_guide(guide)
+            self._guide = builder.build()
+        self.skipped = sum(source.skipped for source in self.sources)
+        self.ingests += 1
+        self.last_ingest_seconds = time.perf_counter() - started
+        metrics.observe('epg_ingest', self.last_ingest_seconds)
+        return self._guide
+
+    def now_next(self, channel_index, channel_id, at=None):
+        """``(now, next)`` ``Programme``s of a catalog channel; ``(None, None)`` without a guide."""
+        guide = self._guide
+        if guide is None:
+            return None, None
+        slot = guide.slot_for(channel_index.table.tvg_id(channel_id), channel_index.original_names[channel_id])
+        if slot is None:
+            return None, None
+        return guide.now_next(slot, time.time() if at is None else at)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_now()
+            except Exception:
+                # A bad round must not kill the thread; the old guide stays
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start the background ingest once per process; later calls are no-ops."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='epg-refresh', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        guide = self._guide
+        return {
+            'ingests': self.ingests,
+            'programmes': len(guide) if guide is not None else 0,
+            'channels': len(guide.slots) if guide is not None else 0,
+            'titles': len(guide.titles) if guide is not None else 0,
+            'skipped': self.skipped,
+            'fetches': sum(source.fetches for source in self.sources),
+            'not_modified': sum(source.not_modified for source in self.sources),
+            'last_ingest_ms': round(self.last_ingest_seconds * 1000, 3),
+        }
+
+
+# Process-wide guide shared by all sessions (used when feeds are configured)
+epg_store = EPGStore(EPG_SOURCES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest XMLTV feeds and show now/next per channel.")
+    parser.add_argument('feeds', nargs='+', help="XMLTV files (plain or gzipped) and/or http(s) URLs")
+    parser.add_argument('--playlist', help="M3U playlist whose channels to match against the guide")
+    parser.add_argument('--hours', type=float, default=EPG_WINDOW_HOURS, help="programme window to keep")
+    parser.add_argument('--at', type=float, help="epoch seconds to look up (default: now)")
+    parser.add_argument('--limit', type=int, default=10, help="matched channels to print")
+    args = parser.parse_args(argv)
+
+    at = time.time() if args.at is None else args.at
+    store = EPGStore(args.feeds, args.hours)
+    guide = store.refresh_now(at)
+    for warning in store.warnings:
+        print(warning)
+    print(f"{len(guide.slots)} guide channels, {len(guide)} programmes in the next {args.hours:g} h "
+          f"({store.skipped} outside it), {len(guide.titles)} titles, "
+          f"ingested in {store.last_ingest_seconds:.2f} s")
+    if not args.playlist:
+        return 1 if store.warnings else 0
+
+    from catalog import CatalogCache
+
+    catalog = CatalogCache([args.playlist]).get()
+    if catalog is None:
+        print(f"{args.playlist}: no playlist found")
+        return 1
+    channel_index = catalog.index
+    matched = [channel_id for channel_id in channel_index.all
+               if guide.slot_for(channel_index.table.tvg_id(channel_id), channel_index.original_names[channel_id])
+               is not None]
+    print(f"{len(matched)} of {len(channel_index)} channels matched")
+    for channel_id in matched[:args.limit]:
+        current, upcoming = store.now_next(channel_index, channel_id, at)
+        print(f"  {channel_index.display_names[channel_id]}: "
+              f"now {current.title if current else '-'}, next {upcoming.title if upcoming else '-'}")
+    return 1 if store.warnings else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""Background stream health checks with TTL-cached up/down status.
+
+Channel manifests are probed concurrently on a private asyncio loop in a
+daemon thread, so a Streamlit rerun only ever reads the cached results:
+
+    health_checker.start(lambda: catalog_cache.get().index.stream_urls)
+    health_checker.status(url)  # StreamStatus or None while unknown
+    health_checker.rank(urls)   # a channel's mirrors, best first
+    health_checker.offline_channels(index)  # IDs of channels with every URL down
+
+Run ``python health.py list.m3u`` (or pass URLs) for a one-off check.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from httppool import ConnectionPool
+
+HEALTH_CHECK_ENABLED = os.environ.get('AAEC_HEALTH_CHECK', '1') != '0'
+
+StreamStatus = namedtuple('StreamStatus', ['up', 'latency_ms', 'checked_at', 'error'])
+
+
+class HealthChecker:
+    """Probes channel URLs and caches whether each one serves a playlist.
+
+    A URL is up when a GET returns 200 (or 206) with an ``#EXTM3U`` body
+    within ``timeout`` seconds. Probes ask for the first ``probe_bytes``
+    only and give up on longer bodies, so a URL that turns out to be a
+    media file isn't downloaded. At most ``concurrency`` probes run at
+    once, over keep-alive connections pooled per host; results expire
+    after ``ttl``.
+
+    Besides the latest status, every URL keeps an exponentially weighted
+    latency and error rate (weight ``smoothing`` for the newest sample) over
+    probes and player-reported failures, which ``rank`` orders mirrors by.
+    Every whole playlist a probe downloads is handed to the callables in
+    ``listeners`` as ``(url, final_url, body)``, so others needn't fetch it.
+    After each round, ``down`` is replaced by the set of URLs found down.
+    """
+
+    def __init__(self, ttl=120.0, interval=30.0, concurrency=16, timeout=5.0, limit_per_host=8,
+                 smoothing=0.3, probe_bytes=256 << 10):
+        self.ttl = ttl
+        self.probe_bytes = probe_bytes
+        self.interval = interval
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self.smoothing = smoothing
+        self._results = {}
+        # url -> (latency EWMA in ms or None, error rate EWMA)
+        self._rolling = {}
+        # URLs down as of the last round, replaced (never mutated) after each
+        self.down = frozenset()
+        # (channel index, down set it was built from, offline channel IDs)
+        self._offline = None
+        self.listeners = []
+        self._thread = None
+        self._lock = threading.Lock()
+        self.probes = 0
+        self.rounds = 0
+        self.failed_rounds = 0
+        self.last_error = None
+        self.last_round_seconds = 0.0
+
+    def status(self, url):
+        """Return the cached ``StreamStatus`` for ``url``, or ``None`` if unknown or expired."""
+        result = self._results.get(url)
+        if result is None or time.time() - result.checked_at > self.ttl:
+            return None
+        return result
+
+    def is_down(self, url):
+        result = self.status(url)
+        return result is not None and not result.up
+
+    def record(self, url, latency_ms=None, error=None):
+        """Fold one observation of ``url`` into its rolling latency and error rate.
+
+        Failures only move the error rate: their latency is a timeout, not
+        a measure of how fast the mirror serves.
+        """
+        alpha = self.smoothing
+        failed = 0.0 if error is None else 1.0
+        previous = self._rolling.get(url)
+        if previous is None:
+            self._rolling[url] = (latency_ms if error is None else None, failed)
+            return
+        latency, error_rate = previous
+        if error is None and latency_ms is not None:
+            latency = latency_ms if latency is None else latency + alpha * (latency_ms - latency)
+        self._rolling[url] = (latency, error_rate + alpha * (failed - error_rate))
+
+    def rank(self, urls):
+        """Return ``urls`` best first: not known down, fewest recent errors, lowest latency.
+
+        Unmeasured URLs sort after measured healthy ones; ties keep their
+        playlist order, so the primary URL wins until something is known.
+        """
+        def score(url):
+            latency, error_rate = self._rolling.get(url, (None, 0.0))
+            return (self.is_down(url), round(error_rate, 1), float('inf') if latency is None else latency)
+
+        return sorted(urls, key=score)
+
+    async def _probe(self, pool, semaphore, url):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # Servers that honour the range send only the head of what could be a media file
+                response = await asyncio.wait_for(
+                    pool.get(url, {'Range': f'bytes=0-{self.probe_bytes - 1}'}, max_body=self.probe_bytes),
+                    self.timeout,
+                )
+                if response.status not in (200, 206):
+                    error = f"HTTP {response.status}"
+                elif not response.body.lstrip().startswith(b'#EXTM3U'):
+                    error = "Not an HLS playlist"
+                else:
+                    error = None
+            except asyncio.TimeoutError:
+                error = "Timed out"
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.probes += 1
+            result = StreamStatus(error is None, round(latency_ms, 1), time.time(), error)
+            self._results[url] = result
+            self.record(url, latency_ms, error)
+            # A 206 as long as the range may have been cut short
+            if error is None and (response.status == 200 or len(response.body) < self.probe_bytes):
+                for listener in self.listeners:
+                    listener(url, response.url, response.body)
+            return url, result
+
+    async def check(self, urls, pool=None):
+        """Probe ``urls`` (deduplicated) concurrently and return ``{url: StreamStatus}``."""
+        own_pool = pool is None
+        if own_pool:
+            pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(self._probe(pool, semaphore, url) for url in dict.fromkeys(urls)))
+        finally:
+            if own_pool:
+                pool.close()
+        self.rounds += 1
+        self.last_round_seconds = time.perf_counter() - started
+        now = time.time()
+        down = frozenset(url for url, result in list(self._results.items())
+                         if not result.up and now - result.checked_at <= self.ttl)
+        if down != self.down:
+            self.down = down
+        return dict(results)
+
+    def offline_channels(self, channel_index):
+        """IDs of ``channel_index``'s channels with every URL in ``down``, rebuilt once per change."""
+        down = self.down
+        cached = self._offline
+        if cached is not None and cached[0] is channel_index and cached[1] is down:
+            return cached[2]
+        offline = frozenset()
+        if down:
+            offline = frozenset(
+                channel_id for channel_id, url in enumerate(channel_index.urls)
+                if url in down and all(mirror in down for mirror in channel_index.urls_for(channel_id))
+            )
+        self._offline = (channel_index, down, offline)
+        return offline
+
+    def check_now(self, urls):
+        """Blocking wrapper around ``check`` for scripts."""
+        return asyncio.run(self.check(urls))
+
+    async def _run(self, urls_provider):
+        pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        while True:
+            try:
+                now = time.time()
+                # Refresh entries a little before they expire so marks don't flicker
+                due = [
+                    url for url in dict.fromkeys(urls_provider() or [])
+                    if url not in self._results or now - self._results[url].checked_at > self.ttl - self.interval
+                ]
+                if due:
+                    await self.check(due, pool)
+            except Exception as e:
+                # A bad round (e.g. the catalog vanished) must not kill the thread
+                self.failed_rounds += 1
+                self.last_error = f"{e.__class__.__name__}: {e}"
+            await asyncio.sleep(self.interval)
+
+    def start(self, urls_provider):
+        """Start the background checker once per process; later calls are no-ops.
+
+        ``urls_provider`` is called every round so catalog reloads are picked up.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=asyncio.run, args=(self._run(urls_provider),), name='stream-health', daemon=True
+            )
+            self._thread.start()
+
+    def stats(self):
+        now = time.time()
+        fresh = [result for result in self._results.values() if now - result.checked_at <= self.ttl]
+        return {
+            'known': len(fresh),
+            'up': sum(1 for result in fresh if result.up),
+            'down': sum(1 for result in fresh if not result.up),
+            'probes': self.probes,
+            'rounds': self.rounds,
+            'failed_rounds': self.failed_rounds,
+            'last_error': self.last_error,
+            'last_round_ms': round(self.last_round_seconds * 1000, 1),
+        }
+
+
+# Process-wide checker shared by all sessions
+health_checker = HealthChecker()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check which channel streams are up.")
+    parser.add_argument('targets', nargs='+', help="playlist files and/or stream URLs")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    from catalog import iter_m3u_entries, iter_m3u_file
+
+    urls = []
+    for target in args.targets:
+        if '://' in target:
+            urls.append(target)
+        else:
+            urls.extend(entry.url for entry in iter_m3u_entries(iter_m3u_file(target)) if not isinstance(entry, str))
+
+    checker = HealthChecker(concurrency=args.concurrency, timeout=args.timeout)
+    results = checker.check_now(urls)
+    for url, result in results.items():
+        state = 'UP  ' if result.up else 'DOWN'
+        print(f"{state} {result.latency_ms:8.1f} ms  {url}" + (f"  ({result.error})" if result.error else ''))
+    print(f"{sum(r.up for r in results.values())}/{len(results)} up in {checker.last_round_seconds:.2f}s",
+          file=sys.stderr)
+    return 0 if all(result.up for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Minimal asyncio HTTP/1.1 client with per-host keep-alive connection pools.
+
+Nearly every channel lives on the same upstream host, so reusing a handful
+of persistent connections avoids a TCP (and TLS) handshake per request.
+Only what the app needs is implemented: GET/HEAD, Content-Length and
+chunked bodies, and a bounded number of redirects.
+"""
+import asyncio
+import ssl
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+Response = namedtuple('Response', ['status', 'headers', 'body', 'url'])
+
+
+class HTTPError(Exception):
+    """Raised for malformed responses and oversized bodies."""
+
+
+def _split(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise HTTPError(f"Unsupported URL scheme: {url}")
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    return (parts.scheme, parts.hostname, port), parts.netloc, target
+
+
+class ConnectionPool:
+    """Keep-alive connections grouped by (scheme, host, port).
+
+    A pool belongs to the event loop it is first used on. ``limit_per_host``
+    caps concurrent connections to one origin; idle connections beyond
+    ``max_idle_per_host`` are closed instead of kept.
+    """
+
+    def __init__(self, limit_per_host=8, max_idle_per_host=8, user_agent='aaec-player'):
+        self.limit_per_host = limit_per_host
+        self.max_idle_per_host = max_idle_per_host
+        self.user_agent = user_agent
+        self._idle = {}
+        self._limits = {}
+        self._ssl = None
+        self.connections_opened = 0
+        self.requests = 0
+
+    def _limit(self, key):
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.limit_per_host)
+        return limit
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https' and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        self.connections_opened += 1
+        return await asyncio.open_connection(host, port, ssl=self._ssl if scheme == 'https' else None)
+
+    def _release(self, key, connection, keep_alive):
+        idle = self._idle.setdefault(key, [])
+        if keep_alive and len(idle) < self.max_idle_per_host and not connection[1].is_closing():
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def request(self, method, url, headers=None, max_body=8 << 20, max_redirects=3):
+        """Send one request and return a ``Response`` with the full body."""
+        for _ in range(max_redirects + 1):
+            response = await self._request_once(method, url, headers, max_body)
+            location = response.headers.get('location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            return response
+        raise HTTPError(f"Too many redirects for {url}")
+
+    async def get(self, url, headers=None, max_body=8 << 20):
+        return await self.request('GET', url, headers, max_body)
+
+    async def _request_once(self, method, url, headers, max_body):
+        key, netloc, target = _split(url)
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {netloc}", f"User-Agent: {self.user_agent}",
+                 "Accept: */*", "Connection: keep-alive"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        async with self._limit(key):
+            idle = self._idle.get(key)
+            reused = bool(idle)
+            connection = idle.pop() if idle else await self._connect(key)
+            try:
+                try:
+                    return await self._exchange(key, connection, method, url, payload, max_body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                # The server closed an idle connection; retry once on a fresh one
+                connection[1].close()
+                connection = await self._connect(key)
+                return await self._exchange(key, connection, method, url, payload, max_body)
+            except BaseException:
+                connection[1].close()
+                raise
+
+    async def _exchange(self, key, connection, method, url, payload, max_body):
+        reader, writer = connection
+        self.requests += 1
+        writer.write(payload)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response")
+        parts = status_line.decode('latin-1').split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise HTTPError(f"Malformed status line from {url}: {status_line!r}")
+        version, status = parts[0], int(parts[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            total = 0
+            while True:
+                size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+                if size == 0:
+                    # Skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                total += size
+                if total > max_body:
+                    raise HTTPError(f"Response body from {url} exceeds {max_body} bytes")
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > max_body:
+                raise HTTPError(f"Response body from {url} exceeds {max_body} bytes")
+            body = await reader.readexactly(length)
+        else:
+            # No framing: the body runs until the server closes the connection
+            chunks = []
+            total = 0
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                total += len(data)
+                if total > max_body:
+                    raise HTTPError(f"Response body from {url} exceeds {max_body} bytes")
+                chunks.append(data)
+            body = b''.join(chunks)
+            keep_alive = False
+
+        self._release(key, connection, keep_alive)
+        return Response(status, headers, body, url)
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
@@ -0,0 +1,402 @@
+"""Load test: many concurrent simulated viewers against a running app.
+
+Starts ``streamlit run main.py`` (or targets a server given with ``--url``)
+and opens one websocket per simulated session, speaking the protocol the
+browser does: each session reruns the script with its widget states, and
+between think times changes category, clicks quick access and prev/next
+(fragment reruns, like the real buttons) and switches between the desktop
+and mobile layouts (``?layout=``). A rerun's latency runs from sending it
+to the server's ``script_finished``.
+
+Session counts are stepped up, adding sessions to the ones already
+connected. Per step the report has rerun latency percentiles, overall and
+per action, and the server's CPU use and RSS (read from ``/proc``, so only
+for a server this tool started or one given with ``--pid``). RSS growth
+per added session and the capacity, the most sessions whose p90 rerun
+stays within ``--target-ms`` without errors, go into a JSON report that a
+later run can be compared against:
+
+    python loadtest.py --sessions 10 50 100 --duration 30 --output load.json
+    python loadtest.py --sessions 10 50 100 --duration 30 --compare load.json
+
+The simulated sessions run in this process, so give it its own cores (or
+machine) when measuring a server near its limit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# Relative weights of what a simulated viewer does next
+ACTIONS = {'category': 2, 'quick_access': 3, 'next': 4, 'previous': 2, 'layout': 1}
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list, or ``None`` if empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))]
+
+
+def latency_summary(seconds):
+    values = sorted(seconds)
+    summary = {'count': len(values)}
+    for q in PERCENTILES:
+        value = percentile(values, q)
+        summary[f'p{q}_ms'] = round(value * 1000, 1) if value is not None else None
+    summary['max_ms'] = round(values[-1] * 1000, 1) if values else None
+    return summary
+
+
+class ProcessStats:
+    """CPU seconds and RSS of a local process, from ``/proc``."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+
+    def cpu_seconds(self):
+        with open(f'/proc/{self.pid}/stat') as file:
+            # Fields after the parenthesized command name; utime and stime are 14 and 15
+            fields = file.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self):
+        with open(f'/proc/{self.pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+
+class AppServer:
+    """``streamlit run main.py`` on a free local port, for the duration of a test."""
+
+    def __init__(self, script=APP_SCRIPT, env=None):
+        self.script = script
+        self.env = env
+        self.port = None
+        self.process = None
+
+    def __enter__(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', self.script, '--server.headless', 'true',
+             '--server.port', str(self.port), '--server.fileWatcherType', 'none',
+             '--browser.gatherUsageStats', 'false'],
+            env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(f'{self.url}/_stcore/health', timeout=2):
+                    return self
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__()
+                    raise RuntimeError("The app server did not start")
+                time.sleep(0.25)
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+
+class SimulatedSession:
+    """One viewer: a websocket session that reruns the app like a browser tab.
+
+    Widgets are found by the key at the end of their element ID (or their
+    label when they have none). Values this session set are resent with
+    every rerun, as the browser does; button clicks are sent once.
+    """
+
+    def __init__(self, url, rng, mobile=False):
+        self.url = 'ws' + url[len('http'):] + '/_stcore/stream'
+        self.rng = rng
+        self.mobile = mobile
+        self.websocket = None
+        self.page_script_hash = ''
+        self.widgets = {}
+        self.values = {}
+        self.latencies = {}
+        self.errors = 0
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, subprotocols=['streamlit'], max_size=None)
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def rerun(self, action, triggers=(), fragment_id=''):
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = 'layout=mobile' if self.mobile else 'layout=desktop'
+        client_state.page_script_hash = self.page_script_hash
+        client_state.fragment_id = fragment_id
+        for state in list(self.values.values()) + list(triggers):
+            client_state.widget_states.widgets.add().CopyFrom(state)
+        if not fragment_id:
+            self.widgets = {}
+
+        started = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.websocket.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_script_hash = forward.new_session.page_script_hash or self.page_script_hash
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                self._track(forward.delta.new_element, forward.delta.fragment_id)
+            elif kind == 'script_finished':
+                break
+        self.latencies.setdefault(action, []).append(time.perf_counter() - started)
+
+    def _track(self, element, fragment_id):
+        kind = element.WhichOneof('type')
+        if kind == 'exception':
+            self.errors += 1
+            return
+        proto = getattr(element, kind)
+        widget_id = getattr(proto, 'id', '')
+        if not widget_id:
+            return
+        key = widget_id.rsplit('-', 1)[-1]
+        if key == 'None':
+            key = getattr(proto, 'label', '')
+        self.widgets[key] = (widget_id, proto, fragment_id)
+
+    async def click(self, action, key):
+        widget = self.widgets.get(key)
+        if widget is None or widget[1].disabled:
+            return False
+        widget_id, _, fragment_id = widget
+        trigger = BackMsg().rerun_script.widget_states.widgets.add()
+        trigger.id = widget_id
+        trigger.trigger_value = True
+        await self.rerun(action, [trigger], fragment_id)
+        return True
+
+    async def select(self, action, key):
+        widget = self.widgets.get(key)
+        if widget is None or not widget[1].options:
+            return False
+        widget_id, proto, fragment_id = widget
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = widget_id
+        state.string_value = self.rng.choice(list(proto.options))
+        self.values[widget_id] = state
+        await self.rerun(action, (), fragment_id)
+        return True
+
+    async def act(self):
+        """Do one weighted-random viewer action."""
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == 'layout':
+            # The other layout's widgets are gone: start over with its defaults
+            self.mobile = not self.mobile
+            self.values = {}
+            await self.rerun(action)
+        elif action == 'category':
+            await self.select(action, 'mobile_category' if self.mobile else 'desktop_category')
+        elif action == 'quick_access':
+            await self.click(action, f'main_quick_{self.rng.randrange(6)}')
+        elif self.mobile:
+            await self.click(action, '➡️ Next' if action == 'next' else '⬅️ Previous')
+        else:
+            await self.click(action, 'nav_next' if action == 'next' else 'nav_prev')
+
+    async def run(self, deadline, think_seconds):
+        """Act until ``deadline`` (a ``time.monotonic()``), waiting around ``think_seconds`` in between."""
+        try:
+            if self.websocket is None:
+                await self.connect()
+                await self.rerun('load')
+            while True:
+                await asyncio.sleep(self.rng.expovariate(1 / think_seconds) if think_seconds else 0)
+                if time.monotonic() >= deadline:
+                    return
+                await self.act()
+        except (OSError, websockets.ConnectionClosed):
+            self.errors += 1
+            self.websocket = None
+
+    def take_latencies(self):
+        latencies, self.latencies = self.latencies, {}
+        return latencies
+
+
+async def run_steps(url, steps, duration, think_seconds, mobile_share, process_stats, seed):
+    rng = random.Random(seed)
+    # One throwaway session first, so one-off startup (catalog load, imports)
+    # isn't counted as the first step's per-session growth
+    warmup = SimulatedSession(url, random.Random(seed))
+    await warmup.connect()
+    await warmup.rerun('load')
+    await warmup.close()
+    sessions = []
+    results = []
+    for count in steps:
+        rss_before = process_stats.rss_bytes() if process_stats else None
+        added = max(0, count - len(sessions))
+        sessions.extend(
+            SimulatedSession(url, random.Random(rng.random()), rng.random() < mobile_share) for _ in range(added)
+        )
+        errors_before = sum(session.errors for session in sessions)
+        cpu_before = process_stats.cpu_seconds() if process_stats else None
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(session.run(deadline, think_seconds) for session in sessions[:count]))
+        elapsed = time.monotonic() - started
+
+        by_action = {}
+        for session in sessions[:count]:
+            for action, seconds in session.take_latencies().items():
+                by_action.setdefault(action, []).extend(seconds)
+        every = [value for values in by_action.values() for value in values]
+        step = {
+            'sessions': count,
+            'seconds': round(elapsed, 2),
+            'reruns': len(every),
+            'reruns_per_second': round(len(every) / elapsed, 2),
+            'errors': sum(session.errors for session in sessions) - errors_before,
+            'latency': latency_summary(every),
+            'latency_by_action': {action: latency_summary(values) for action, values in sorted(by_action.items())},
+        }
+        if process_stats:
+            rss_after = process_stats.rss_bytes()
+            step['cpu_percent'] = round((process_stats.cpu_seconds() - cpu_before) / elapsed * 100, 1)
+            step['rss_mb'] = round(rss_after / 1e6, 1)
+            step['rss_growth_per_session_kb'] = round((rss_after - rss_before) / added / 1e3, 1) if added else None
+        results.append(step)
+        print(f"{count:>5} sessions: {step['reruns_per_second']:7.2f} reruns/s, "
+              f"p50 {step['latency']['p50_ms']} ms, p90 {step['latency']['p90_ms']} ms, "
+              f"p99 {step['latency']['p99_ms']} ms, {step['errors']} errors"
+              + (f", CPU {step['cpu_percent']}%, RSS {step['rss_mb']} MB" if process_stats else ''),
+              file=sys.stderr)
+    await asyncio.gather(*(session.close() for session in sessions))
+    return results
+
+
+def capacity(steps, target_ms):
+    """Most sessions of a step whose p90 rerun met ``target_ms`` without errors (0 if none)."""
+    passing = [step['sessions'] for step in steps
+               if not step['errors'] and step['latency']['p90_ms'] is not None
+               and step['latency']['p90_ms'] <= target_ms]
+    return max(passing, default=0)
+
+
+def compare(current, baseline, threshold):
+    """Print per-step ratios of p90 latency and CPU; return the number of regressions."""
+    previous = {step['sessions']: step for step in baseline['steps']}
+    regressions = 0
+    for step in current['steps']:
+        old = previous.get(step['sessions'])
+        if old is None:
+            continue
+        for name, value, old_value in (
+            ('p90_latency', step['latency']['p90_ms'], old['latency']['p90_ms']),
+            ('cpu_percent', step.get('cpu_percent'), old.get('cpu_percent')),
+        ):
+            if not value or not old_value:
+                continue
+            ratio = value / old_value
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{step['sessions']:>5} {name:<12} {ratio:6.2f}x{flag}", file=sys.stderr)
+    print(f"capacity: {baseline['capacity_sessions']} -> {current['capacity_sessions']} sessions", file=sys.stderr)
+    if current['capacity_sessions'] < baseline['capacity_sessions']:
+        regressions += 1
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 25, 50, 100],
+                        help="concurrent session counts to step through")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds per step")
+    parser.add_argument('--think', type=float, default=2.0, help="mean seconds between a session's actions")
+    parser.add_argument('--mobile-share', type=float, default=0.3, help="share of sessions starting on mobile")
+    parser.add_argument('--target-ms', type=float, default=500.0, help="p90 rerun latency a step must meet")
+    parser.add_argument('--url', help="test a running app instead of starting one")
+    parser.add_argument('--pid', type=int, help="process ID of the --url server, for CPU and RSS")
+    parser.add_argument('--live-checks', action='store_true',
+                        help="keep the background health checks and playlist analysis on in the started app")
+    parser.add_argument('--seed', type=int, default=1, help="random seed of the simulated viewers")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON report of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+    steps = sorted(set(args.sessions))
+
+    def run(url, process_stats):
+        return asyncio.run(run_steps(url, steps, args.duration, args.think, args.mobile_share, process_stats,
+                                     args.seed))
+
+    if args.url:
+        results = run(args.url.rstrip('/'), ProcessStats(args.pid) if args.pid else None)
+    else:
+        env = dict(os.environ)
+        if not args.live_checks:
+            # Outbound probing would measure the network more than the app
+            env.setdefault('AAEC_HEALTH_CHECK', '0')
+            env.setdefault('AAEC_MANIFEST_ANALYSIS', '0')
+        with AppServer(env=env) as server:
+            results = run(server.url, ProcessStats(server.process.pid))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.time(),
+        'config': {
+            'duration': args.duration, 'think': args.think, 'mobile_share': args.mobile_share,
+            'target_ms': args.target_ms, 'seed': args.seed, 'cpus': os.cpu_count(),
+        },
+        'capacity_sessions': capacity(results, args.target_ms),
+        'steps': results,
+    }
+    print(f"capacity: {report['capacity_sessions']} sessions within a p90 of {args.target_ms:g} ms",
+          file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
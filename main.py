@@ -1,6 +1,9 @@
+import time
+
 import streamlit as st
 from streamlit.components.v1 import html
-import re
+
+from metrics import DEBUG_PANEL, METRICS_PORT, metrics
 
 st.set_page_config(
     layout="wide",
@@ -9,6 +12,13 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
+# Timed to the end of the script; fragment reruns are timed separately
+rerun_started = time.perf_counter()
+metrics.inc('reruns')
+if 'metrics_session' not in st.session_state:
+    st.session_state.metrics_session = True
+    metrics.inc('sessions')
+
 # Add responsive CSS
 st.markdown("""
 <style>
@@ -85,36 +95,34 @@ st.markdown("""
 
 st.title("Live TV")
 
-# Read M3U8 content from file
+# Read M3U8 content from file (cached process-wide, rebuilt only on change)
 import os
+from collections import deque
+from itertools import chain
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from catalog import catalog_cache
+from sources import PLAYLIST_SOURCES, source_catalog
+from health import HEALTH_CHECK_ENABLED, health_checker
+from manifest import MANIFEST_ANALYSIS_ENABLED, manifest_analyzer, start_config
+from proxy import PROXY_ENABLED, hls_proxy
+from qoe import QOE_ENABLED, qoe_stats
+from search import search_cache
+from epg import EPG_SOURCES, epg_store
+from timeshift import TIMESHIFT_ENABLED, TIMESHIFT_MINUTES, timeshift
+from channel_list import ChannelListState
+from assets import ASSETS_URL, player_assets
+from player import (PERSISTENT_PLAYER, PREFETCH_ENABLED, build_player_html, hls_player, multiview_player,
+                    prefetch_options)
 
-# Try multiple possible locations for the M3U file
-possible_paths = [
-    'list.m3u',  # Current directory
-    './list.m3u',  # Explicit current directory
-    os.path.join(os.path.dirname(__file__), 'list.m3u'),  # Same directory as script
-    'data/list.m3u',  # Data subdirectory
-    './data/list.m3u',  # Explicit data subdirectory
-]
-
-m3u_content = None
-found_file = None
-
-for file_path in possible_paths:
-    if not isinstance(file_path, str):
-        continue
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            m3u_content = file.read()
-            found_file = file_path
-            break
-    except FileNotFoundError:
-        continue
-    except Exception as e:
-        st.warning(f"Error reading {file_path}: {e}")
-        continue
+# Merged provider playlists when configured, else the local list.m3u
+catalog_provider = source_catalog if PLAYLIST_SOURCES else catalog_cache
+with metrics.span('catalog_lookup'):
+    catalog = catalog_provider.get()
+for warning in catalog_provider.warnings:
+    st.warning(warning)
 
-if m3u_content is None:
+if catalog is None:
     st.error("""
     **M3U file not found!** 
     
@@ -142,56 +150,544 @@ if m3u_content is None:
     st.stop()
 
 
-# Function to parse M3U content into a dictionary with categories
-def parse_m3u_content(content):
-    channels = {}
-    categories = {}
-    clean_channels = {}  # For display without category prefix
-    lines = content.strip().split('\n')
-    current_channel_name = None
-    current_category = "General"
-    channel_number = 1
+# The compact channel table is shared read-only across sessions; a session
+# only keeps the IDs of its selected channels
+channel_index = catalog.index
+
+# Probe streams in the background; reruns only read the cached status
+if HEALTH_CHECK_ENABLED:
+    health_checker.start(lambda: catalog_provider.current().index.stream_urls)
+
+# Analyse master playlists in the background to start players on a fitting level
+if MANIFEST_ANALYSIS_ENABLED:
+    # Fed the playlists the health probes download, when those run
+    manifest_analyzer.start(lambda: catalog_provider.current().index.stream_urls,
+                            health_checker if HEALTH_CHECK_ENABLED else None)
+
+# Optionally serve streams through the local fan-out proxy
+if PROXY_ENABLED:
+    hls_proxy.start(lambda: catalog_provider.current().index.upstream_hosts)
+
+# Record recently watched channels for timeshift, inside the proxy
+if TIMESHIFT_ENABLED:
+    timeshift.start()
+
+# Serve hls.js and the player script under hashed names with long-lived
+# cache headers, when the asset server has a public URL
+if ASSETS_URL:
+    player_assets.start_server()
+
+# Ingest the programme guide in the background; reruns only look it up
+if EPG_SOURCES:
+    epg_store.start()
+
+# Index channel names for search off the request path
+search_cache.prepare(catalog)
+
+# Subsystem stats become gauges on the metrics endpoint
+metrics.register_stats('catalog', catalog_provider.stats)
+metrics.register_stats('search', search_cache.stats)
+if EPG_SOURCES:
+    metrics.register_stats('epg', epg_store.stats)
+if HEALTH_CHECK_ENABLED:
+    metrics.register_stats('health', health_checker.stats)
+if MANIFEST_ANALYSIS_ENABLED:
+    metrics.register_stats('manifest', manifest_analyzer.stats)
+if PROXY_ENABLED:
+    metrics.register_stats('proxy', hls_proxy.stats)
+    metrics.register_stats('segments', hls_proxy.segments.stats)
+if TIMESHIFT_ENABLED:
+    metrics.register_stats('timeshift', timeshift.stats)
+if QOE_ENABLED:
+    metrics.register_stats('qoe', qoe_stats.stats)
+if ASSETS_URL:
+    metrics.register_stats('assets', player_assets.stats)
+if METRICS_PORT:
+    metrics.start_server(METRICS_PORT)
+
+
+# Navigation controls live in fragments (st.fragment): a click there reruns
+# only the fragment, reusing the arguments of the last full run, so the CSS,
+# mobile detection, catalog lookup and sidebar above are not redone.
+
+# Switch times kept per session for the prefetch comparison caption
+SWITCH_HISTORY = 50
+# Search results listed under a search box
+SEARCH_RESULTS = 8
+# Multi-view layouts and their number of tiles
+MULTIVIEW_LAYOUTS = {"Single": 1, "2×2": 4, "3×3": 9}
+# Timeshift offsets offered, in minutes back from live
+TIMESHIFT_STEPS = [0] + [minutes for minutes in (1, 2, 5, 10, 15, 30, 45, 60, 90, 120, 180, 240)
+                         if minutes < TIMESHIFT_MINUTES] + ([TIMESHIFT_MINUTES] if TIMESHIFT_MINUTES > 0 else [])
+
+
+def select_channel(key, channel_id):
+    """Select a channel from a callback, which runs before any widget is created."""
+    st.session_state[key] = channel_id
+
+
+def select_category_channel(category_key, category, channel_key, channel_id):
+    """Select a channel together with its category, e.g. from a search result."""
+    st.session_state[category_key] = category
+    st.session_state[channel_key] = channel_id
+
+
+def search_results(query):
+    """IDs of the channels best matching ``query``."""
+    with metrics.span('channel_search'):
+        return search_cache.get(catalog).search(query, SEARCH_RESULTS)
+
+
+def render_programme_guide(slot, channel_id):
+    """Now/next from the programme guide into ``slot``, in the viewer's time zone."""
+    with metrics.span('epg_lookup'):
+        current, upcoming = epg_store.now_next(channel_index, channel_id)
+    if current is None and upcoming is None:
+        return
+    offset_minutes = st.context.timezone_offset
+    viewer_timezone = timezone(-timedelta(minutes=offset_minutes)) if offset_minutes is not None else None
     
-    for line in lines:
-        line = line.strip()
-        
-        # Skip empty lines and comments that aren't channel info
-        if not line or line.startswith('//') or line == '#EXTM3U':
-            continue
-            
-        # Check for category headers
-        if line.startswith('#========') and line.endswith('=========='):
-            current_category = line.replace('#========', '').replace('==========', '').strip()
-            if current_category not in categories:
-                categories[current_category] = []
-            continue
-            
-        # Check for channel info
-        if line.startswith('#EXTINF:'):
-            match = re.search(r'#EXTINF:0,(.*)', line)
-            if match:
-                current_channel_name = match.group(1).strip()
-        elif line.startswith('http') and current_channel_name:
-            # Create user-friendly channel name with number
-            clean_name = f"{channel_number:02d}. {current_channel_name}"
-            full_channel_name = f"[{current_category}] {clean_name}"
-            
-            channels[full_channel_name] = line.strip()
-            clean_channels[clean_name] = {
-                'url': line.strip(),
-                'category': current_category,
-                'original_name': current_channel_name
-            }
-            categories[current_category].append(full_channel_name)
-            current_channel_name = None
-            channel_number += 1
-            
-    return channels, categories, clean_channels
-
-# Parse the channels
-channel_sources, channel_categories, clean_channels = parse_m3u_content(m3u_content)
-
-if not channel_sources:
+    def clock(seconds):
+        return datetime.fromtimestamp(seconds, viewer_timezone).strftime('%H:%M')
+    
+    parts = []
+    if current is not None:
+        parts.append(f"🕒 Now: **{current.title}** ({clock(current.start)}–{clock(current.stop)})")
+    if upcoming is not None:
+        parts.append(f"Next: {upcoming.title} at {clock(upcoming.start)}")
+    slot.caption(" · ".join(parts))
+
+
+def render_timeshift(channel_id):
+    """Timeshift slider for ``channel_id``; returns the catch-up playlist to play, or ``None`` for live."""
+    # Record the mirror the player is on; until it reports one, the one it starts with
+    urls = ranked_urls(channel_id)
+    playing = st.session_state.get('playing_mirror')
+    url = playing['url'] if playing is not None and playing['channel'] == channel_id and playing['url'] in urls else urls[0]
+    # Selecting a channel is what gets it recorded
+    timeshift.request(url)
+    choice = st.session_state.get('timeshift')
+    if choice is not None and choice['channel'] != channel_id:
+        # Another channel starts live
+        choice = st.session_state.timeshift = None
+        st.session_state.timeshift_minutes = 0
+    
+    def seek():
+        minutes = st.session_state.timeshift_minutes
+        catchup_url = timeshift.catchup_url(url, minutes * 60) if minutes else None
+        if minutes and catchup_url is None:
+            # Nothing recorded yet
+            st.session_state.timeshift_minutes = 0
+        st.session_state.timeshift = {'channel': channel_id, 'url': catchup_url} if catchup_url else None
+    
+    st.select_slider(
+        "⏪ Timeshift", TIMESHIFT_STEPS, key="timeshift_minutes", on_change=seek,
+        format_func=lambda minutes: f"−{minutes} min" if minutes else "Live",
+        help=f"{timeshift.recorded_seconds(url) / 60:.0f} min of this channel recorded so far"
+    )
+    return choice['url'] if choice is not None else None
+
+
+def reload_player():
+    st.session_state.player_reload = st.session_state.get('player_reload', 0) + 1
+
+
+def ranked_urls(channel_id):
+    """A channel's URLs with the fastest healthy mirror first."""
+    urls = channel_index.urls_for(channel_id)
+    if HEALTH_CHECK_ENABLED and len(urls) > 1:
+        return health_checker.rank(urls)
+    return urls
+
+
+def upstream_url(url):
+    """Map a player URL, proxied or not, back to the upstream URL."""
+    if PROXY_ENABLED and url.startswith(hls_proxy.public_url + '/hls/'):
+        return hls_proxy.upstream_url(urlsplit(url).path) or url
+    return url
+
+
+def render_debug_panel():
+    """Span timings and counters of this process, for ``AAEC_DEBUG_PANEL=1`` or ``?debug=1``."""
+    if not (DEBUG_PANEL or st.query_params.get('debug') == '1'):
+        return
+    with st.expander("🛠 Debug: server timings"):
+        span_rows = metrics.span_rows()
+        if span_rows:
+            st.dataframe(span_rows, hide_index=True, use_container_width=True)
+        st.caption(" · ".join(f"{name}: {value}" for name, value in sorted(metrics.counters.items())))
+
+
+@metrics.timed('player_render')
+def render_player(selected_id, available_channels, current_index, is_mobile):
+    """Render the persistent player (or the iframe fallback) for ``selected_id``."""
+    selected_channel_name = channel_index.full_names[selected_id]
+    display_name = channel_index.display_names[selected_id]
+    
+    # The best mirror plays; the rest are fallbacks the player tries by itself
+    mirror_urls = {
+        hls_proxy.proxied_url(url) if PROXY_ENABLED else url: url for url in ranked_urls(selected_id)
+    }
+    player_url, *fallback_urls = mirror_urls
+    
+    # Start level and buffer sizes from the cached playlist analysis and the
+    # throughput this viewer's player last measured
+    start = None
+    if MANIFEST_ANALYSIS_ENABLED:
+        start = start_config(manifest_analyzer.info(mirror_urls[player_url]), st.session_state.get('throughput_bps'))
+    
+    # Play the channel's recording from where the viewer seeked back to
+    if TIMESHIFT_ENABLED:
+        catchup_url = render_timeshift(selected_id)
+        if catchup_url is not None:
+            player_url, fallback_urls, start = catchup_url, [], None
+    
+    # HLS.js integration for robust HLS playback with mobile responsiveness
+    if PERSISTENT_PLAYER:
+        prefetch = None
+        if st.session_state.get('prefetch', PREFETCH_ENABLED):
+            # Most likely next: the neighbours in the list, then quick access
+            candidate_ids = []
+            if current_index + 1 < len(available_channels):
+                candidate_ids.append(available_channels[current_index + 1])
+            if current_index > 0:
+                candidate_ids.append(available_channels[current_index - 1])
+            candidate_ids.extend(channel_index.quick_access_ids[:3])
+            candidate_urls = [ranked_urls(channel_id)[0] for channel_id in candidate_ids if channel_id != selected_id]
+            if PROXY_ENABLED:
+                candidate_urls = [hls_proxy.proxied_url(url) for url in candidate_urls]
+            prefetch = prefetch_options(candidate_urls)
+        
+        # Stays mounted across reruns; a channel change only sends the new URL
+        switch_report = hls_player(
+            player_url, display_name, is_mobile, st.session_state.get('player_reload', 0), prefetch, fallback_urls,
+            start, QOE_ENABLED, selected_id
+        )
+        # Each batch of playback quality events is resent until replaced; fold it in once
+        if QOE_ENABLED and switch_report and switch_report.get('qoe_seq') not in (None, st.session_state.get('last_qoe_seq')):
+            st.session_state.last_qoe_seq = switch_report['qoe_seq']
+            qoe_stats.ingest(switch_report.get('qoe') or (), upstream_url)
+        if switch_report and switch_report.get('mirror') in mirror_urls:
+            st.session_state.playing_mirror = {'channel': selected_id, 'url': mirror_urls[switch_report['mirror']]}
+        if switch_report and switch_report.get('url') in mirror_urls:
+            # Keep this session's switch times to compare with and without prefetch
+            switch_times = st.session_state.setdefault(
+                'switch_times', {True: deque(maxlen=SWITCH_HISTORY), False: deque(maxlen=SWITCH_HISTORY)}
+            )
+            if switch_report['seq'] != st.session_state.get('last_switch_seq'):
+                st.session_state.last_switch_seq = switch_report['seq']
+                switch_times[bool(switch_report['prefetched'])].append(switch_report['switch_ms'])
+                if switch_report.get('bandwidth'):
+                    st.session_state.throughput_bps = switch_report['bandwidth']
+                # Mirrors the player gave up on count against them in the ranking
+                if HEALTH_CHECK_ENABLED:
+                    for url in switch_report.get('failed') or ():
+                        health_checker.record(mirror_urls.get(url, url), error="Player failover")
+            summary = " · ".join(
+                f"median {sorted(times)[len(times) // 2]} ms {label} ({len(times)})"
+                for label, times in (("prefetched", switch_times[True]), ("cold", switch_times[False])) if times
+            )
+            st.caption(
+                f"⚡ Switched to {switch_report['name']} in {switch_report['switch_ms']} ms"
+                f"{' (prefetched)' if switch_report['prefetched'] else ''} · {summary}"
+            )
+    else:
+        hls_player_html = build_player_html(selected_channel_name, player_url, is_mobile, start)
+        st.components.v1.html(hls_player_html, height=620, scrolling=False)
+
+
+@metrics.timed('multiview_render')
+def render_multiview(selected_id, tile_count, select):
+    """Render a grid of ``tile_count`` channels whose focused tile shows ``selected_id``.
+
+    The grid's channels persist in the session; a channel picked elsewhere
+    replaces the focused tile's, and the free tiles are filled with quick
+    access channels. Clicking a tile calls ``select`` with its channel.
+    """
+    tile_ids = [channel_id for channel_id in st.session_state.get('multiview_ids', ())
+                if channel_id < len(channel_index)][:tile_count]
+    focus = min(st.session_state.get('multiview_focus', 0), tile_count - 1)
+    if selected_id in tile_ids:
+        focus = tile_ids.index(selected_id)
+    elif focus < len(tile_ids):
+        tile_ids[focus] = selected_id
+    else:
+        focus = len(tile_ids)
+        tile_ids.append(selected_id)
+    for channel_id in chain(channel_index.quick_access_ids, channel_index.all):
+        if len(tile_ids) >= tile_count:
+            break
+        if channel_id not in tile_ids:
+            tile_ids.append(channel_id)
+    st.session_state.multiview_ids = tile_ids
+    st.session_state.multiview_focus = focus
+    
+    tiles = []
+    for channel_id in tile_ids:
+        urls = ranked_urls(channel_id)
+        if PROXY_ENABLED:
+            urls = [hls_proxy.proxied_url(url) for url in urls]
+        tiles.append({'channel': channel_id, 'url': urls[0], 'name': channel_index.display_names[channel_id],
+                      'fallbacks': urls[1:]})
+    
+    def focus_tile():
+        event = st.session_state.multiview_player
+        if not isinstance(event, dict) or event.get('event') != 'focus':
+            return
+        index = event.get('index')
+        if isinstance(index, int) and 0 <= index < len(tile_ids):
+            st.session_state.multiview_focus = index
+            if event.get('bandwidth'):
+                st.session_state.throughput_bps = event['bandwidth']
+            select(tile_ids[index])
+    
+    multiview_player(tiles, focus, st.session_state.get('throughput_bps'), on_change=focus_tile)
+    st.caption(f"🔲 {len(tiles)} channels · 🔊 {tiles[focus]['name']} · click a tile to give it sound and full quality")
+
+
+@st.fragment
+@metrics.timed('mobile_fragment')
+def mobile_player():
+    # Mobile layout - stack vertically
+    # Channel selection at top
+    st.subheader("📺 Select Channel")
+    
+    # Simplified category selection for mobile
+    category_options = ["All"] + list(channel_index.categories)
+    
+    # Typo-tolerant search; a result switches to its category as well
+    search_query = st.text_input("🔍 Search channels", key="mobile_search", placeholder="e.g. starsports1")
+    if search_query:
+        results = search_results(search_query)
+        for channel_id in results:
+            st.button(channel_index.display_names[channel_id], key=f"mobile_search_{channel_id}",
+                      use_container_width=True, on_click=select_category_channel,
+                      args=("mobile_category", channel_index.category_of[channel_id], "mobile_channel", channel_id))
+        if not results:
+            st.caption("No matching channels.")
+    
+    # Keyed so a search result can switch to its channel's category
+    if st.session_state.get('mobile_category') not in category_options:
+        st.session_state.mobile_category = "SPORTS" if "SPORTS" in category_options else "All"
+    selected_category = st.selectbox(
+        "Category:",
+        category_options,
+        key="mobile_category"
+    )
+    
+    # Filter channels: a view is a contiguous range of channel IDs
+    category_key = None if selected_category == "All" else selected_category
+    with metrics.span('channel_filter'):
+        available_channels = channel_index.view(category_key)
+    
+    # Mobile-friendly channel list, defaulting to StarSports 1 HD; only
+    # the rows around the selection go to the browser
+    if st.session_state.get('mobile_channel') not in available_channels:
+        st.session_state.mobile_channel = channel_index.default_id(category_key)
+    ChannelListState(st.session_state, "mobile_channel_list", "mobile_channel").render(
+        available_channels, channel_index.display_names.__getitem__, view=selected_category, height=240
+    )
+    selected_id = st.session_state.mobile_channel
+    current_index = available_channels.index(selected_id)
+    
+    # Navigation buttons for mobile
+    nav_col1, nav_col2, nav_col3 = st.columns(3)
+    with nav_col1:
+        st.button("⬅️ Previous", disabled=current_index == 0, use_container_width=True,
+                  on_click=select_channel, args=("mobile_channel", available_channels[current_index - 1]))
+    with nav_col2:
+        import random
+        st.button("🎲 Random", use_container_width=True,
+                  on_click=select_channel, args=("mobile_channel", random.choice(available_channels)))
+    with nav_col3:
+        st.button("➡️ Next", disabled=current_index == len(available_channels) - 1, use_container_width=True,
+                  on_click=select_channel,
+                  args=("mobile_channel", available_channels[min(current_index + 1, len(available_channels) - 1)]))
+    
+    display_name = channel_index.display_names[selected_id]
+    
+    # Create main header with channel info
+    st.subheader(f"📺 Now Playing: **{display_name}**")
+    
+    # Always reserve the slots so the player below keeps its position in the page
+    status_slot = st.empty()
+    if EPG_SOURCES:
+        render_programme_guide(st.empty(), selected_id)
+    stream_status = health_checker.status(ranked_urls(selected_id)[0]) if HEALTH_CHECK_ENABLED else None
+    if stream_status is not None and not stream_status.up:
+        status_slot.warning(f"This stream looks offline ({stream_status.error}); it may not start.")
+    
+    render_player(selected_id, available_channels, current_index, True)
+    
+    # Mobile controls - simplified
+    st.markdown("---")
+    
+    mobile_control_col1, mobile_control_col2 = st.columns(2)
+    with mobile_control_col1:
+        st.button("🔄 Reload", use_container_width=True, on_click=reload_player)
+    with mobile_control_col2:
+        if st.button("📊 Info", use_container_width=True):
+            st.info(f"**{display_name}** | Category: {selected_category} | {current_index + 1}/{len(available_channels)}")
+    
+    # Simplified footer for mobile
+    st.markdown("---")
+    st.caption(f"📺 {display_name} | {selected_category} | {current_index + 1}/{len(available_channels)}")
+    render_debug_panel()
+
+
+@st.fragment
+@metrics.timed('channel_list_fragment')
+def channel_list_panel(available_channels, channel_caption, view):
+    """The sidebar's virtualized channel list.
+
+    Scrolling it to another window reruns only this fragment; a picked
+    channel has to reach the player, so it reruns the whole app once.
+    """
+    event = ChannelListState(st.session_state, "channel_list", "desktop_channel").render(
+        available_channels, channel_index.display_names.__getitem__, channel_caption, view=view
+    )
+    # Each event is resent until replaced; act on a pick once
+    if isinstance(event, dict) and event.get('event') == 'select':
+        if event.get('seq') != st.session_state.get('last_list_select'):
+            st.session_state.last_list_select = event.get('seq')
+            st.rerun()
+
+
+@st.fragment
+@metrics.timed('desktop_fragment')
+def desktop_player(available_channels, category_labels):
+    """Header, quick access, navigation and player for the desktop layout.
+
+    The sidebar channel list shares the ``desktop_channel`` state, so the
+    buttons here switch channels without rerunning it; its highlight catches
+    up on the next full run.
+    """
+    selected_id = st.session_state.desktop_channel
+    if selected_id not in available_channels:
+        # Quick access picked a channel outside this view: the sidebar has to
+        # switch category, which only a full run can do
+        st.rerun()
+    
+    # O(1) for an unfiltered view, which is a range of IDs
+    current_index = available_channels.index(selected_id)
+    
+    # Clean channel name for display
+    display_name = channel_index.display_names[selected_id]
+    
+    # Create main header with channel info
+    st.subheader(f"📺 Now Playing: **{display_name}**")
+    
+    # Always reserve the slots so the player below keeps its position in the page
+    status_slot = st.empty()
+    if EPG_SOURCES:
+        render_programme_guide(st.empty(), selected_id)
+    stream_status = health_checker.status(ranked_urls(selected_id)[0]) if HEALTH_CHECK_ENABLED else None
+    if stream_status is not None and not stream_status.up:
+        status_slot.warning(f"This stream looks offline ({stream_status.error}); it may not start.")
+    
+    # Quick access channels - moved from sidebar to main page
+    st.markdown("**⭐ Quick Access**")
+    
+    # Matching channels are precomputed once per catalog
+    with metrics.span('quick_access'):
+        quick_access_channels = []
+        for channel_id in channel_index.quick_access_ids[:6]:
+            display_name_short = channel_index.original_names[channel_id]
+            if len(display_name_short) > 15:
+                display_name_short = display_name_short[:12] + "..."
+            quick_access_channels.append((channel_id, display_name_short))
+    
+    def select_quick_access(channel_id):
+        st.session_state.desktop_channel = channel_id
+        if channel_id not in available_channels:
+            st.session_state.desktop_category = category_labels[channel_index.category_of[channel_id]]
+    
+    # Display up to 6 quick access channels
+    if quick_access_channels:
+        num_cols = min(6, len(quick_access_channels))
+        quick_cols = st.columns(num_cols)
+        for i, (channel_id, display_name_short) in enumerate(quick_access_channels):
+            with quick_cols[i]:
+                st.button(display_name_short, key=f"main_quick_{i}", use_container_width=True,
+                          on_click=select_quick_access, args=(channel_id,))
+    
+    # Add small navigation buttons below quick access
+    nav_spacer1, nav_col1, nav_spacer2, nav_col2, nav_spacer3 = st.columns([2, 0.5, 0.2, 0.5, 2])
+    
+    with nav_col1:
+        st.button("⬅️", disabled=current_index == 0, key="nav_prev", help="Previous channel",
+                  on_click=select_channel, args=("desktop_channel", available_channels[current_index - 1]))
+    with nav_col2:
+        st.button("➡️", disabled=current_index == len(available_channels) - 1, key="nav_next", help="Next channel",
+                  on_click=select_channel,
+                  args=("desktop_channel", available_channels[min(current_index + 1, len(available_channels) - 1)]))
+    
+    tile_count = MULTIVIEW_LAYOUTS.get(st.session_state.get('multiview_layout'), 1) if PERSISTENT_PLAYER else 1
+    if tile_count > 1:
+        render_multiview(selected_id, tile_count, select_quick_access)
+    else:
+        render_player(selected_id, available_channels, current_index, False)
+    
+    # Desktop controls - full feature set
+    
+    # Footer
+    st.markdown("---")
+    st.caption(" AAEC Custom Player")
+    cache_stats = catalog_provider.stats()
+    st.caption(
+        f"Catalog cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+        f"last rebuild {cache_stats['last_rebuild_ms']} ms"
+    )
+    if HEALTH_CHECK_ENABLED:
+        health_stats = health_checker.stats()
+        st.caption(
+            f"Stream health: {health_stats['up']} up · {health_stats['down']} down · "
+            f"{health_stats['known']} checked"
+        )
+    if MANIFEST_ANALYSIS_ENABLED:
+        manifest_stats = manifest_analyzer.stats()
+        st.caption(
+            f"Playlist analysis: {manifest_stats['known']} analysed · "
+            f"{manifest_stats['multi_variant']} multi-bitrate · {manifest_stats['failures']} failed"
+        )
+    if QOE_ENABLED and st.toggle("📈 Playback quality", key="qoe_panel"):
+        qoe_group = st.radio("Group by", ["channel", "host"], horizontal=True, key="qoe_group")
+        qoe_rows = qoe_stats.rows(qoe_group)
+        if qoe_rows:
+            st.dataframe(qoe_rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No playback reports yet.")
+        export_col1, export_col2 = st.columns(2)
+        with export_col1:
+            st.download_button("Export CSV", qoe_stats.export_csv(qoe_group), file_name=f"qoe_by_{qoe_group}.csv",
+                               mime="text/csv", on_click="ignore", use_container_width=True)
+        with export_col2:
+            st.download_button("Export JSON", qoe_stats.export_json(), file_name="qoe.json",
+                               mime="application/json", on_click="ignore", use_container_width=True)
+    if PROXY_ENABLED:
+        proxy_stats = hls_proxy.stats()
+        st.caption(
+            f"Proxy: {proxy_stats['requests']} requests · {proxy_stats['upstream_fetches']} upstream fetches · "
+            f"{proxy_stats['coalesced']} coalesced · {proxy_stats['cache_hits']} cache hits"
+        )
+        segment_stats = hls_proxy.segments.stats()
+        st.caption(
+            f"Segment cache: {segment_stats['hit_ratio']:.0%} hit ratio · "
+            f"{segment_stats['bytes_served'] / 1e6:.1f} MB served · "
+            f"{segment_stats['memory_entries']} in memory · {segment_stats['disk_entries']} on disk · "
+            f"{segment_stats['evictions']} evicted"
+        )
+    if TIMESHIFT_ENABLED:
+        timeshift_stats = timeshift.stats()
+        st.caption(
+            f"Timeshift: {timeshift_stats['recordings']} channels recording · "
+            f"{timeshift_stats['recorded_seconds'] / 60:.0f} min recorded · "
+            f"{timeshift_stats['segments_served']} segments served"
+        )
+    render_debug_panel()
+
+
+if not len(channel_index):
     st.error("No channels found in the provided M3U content. Please check the format.")
 else:
     # Create responsive layout based on screen size
@@ -213,70 +709,18 @@ else:
     """
     st.components.v1.html(mobile_detection_script, height=0)
     
-    # Initialize mobile state
-    if 'is_mobile' not in st.session_state:
+    # Initialize mobile state; ?layout=mobile or ?layout=desktop picks one explicitly
+    layout = st.query_params.get('layout')
+    if layout in ('mobile', 'desktop'):
+        st.session_state.is_mobile = layout == 'mobile'
+    elif 'is_mobile' not in st.session_state:
         st.session_state.is_mobile = False
     
     # Create adaptive layout
     is_mobile = st.session_state.get('is_mobile', False)
     
     if is_mobile:
-        # Mobile layout - stack vertically
-        # Channel selection at top
-        st.subheader("📺 Select Channel")
-        
-        # Simplified category selection for mobile
-        category_options = ["All"] + list(channel_categories.keys())
-        selected_category = st.selectbox(
-            "Category:",
-            category_options,
-            index=next((i for i, cat in enumerate(category_options) if cat == "SPORTS"), 0),
-            key="mobile_category"
-        )
-        
-        # Filter channels
-        if selected_category == "All":
-            available_channels = list(channel_sources.keys())
-        else:
-            available_channels = channel_categories[selected_category]
-        
-        # Mobile-friendly channel selector
-        channel_names = [x.split('] ')[1] if '] ' in x else x for x in available_channels]
-        
-        # Find StarSports 1 HD as default for mobile
-        default_mobile_index = 0
-        for i, channel in enumerate(available_channels):
-            channel_name = channel.split('] ')[1] if '] ' in channel else channel
-            clean_channel_name = channel_name.split('. ', 1)[1] if '. ' in channel_name else channel_name
-            if "StarSports 1 HD" in clean_channel_name:
-                default_mobile_index = i
-                break
-        
-        selected_index = st.selectbox(
-            "Channel:",
-            range(len(available_channels)),
-            format_func=lambda x: channel_names[x],
-            index=default_mobile_index,
-            key="mobile_channel"
-        )
-        selected_channel_name = available_channels[selected_index]
-        
-        # Navigation buttons for mobile
-        nav_col1, nav_col2, nav_col3 = st.columns(3)
-        with nav_col1:
-            if st.button("⬅️ Previous", disabled=selected_index == 0, use_container_width=True):
-                st.session_state.mobile_channel = selected_index - 1
-                st.rerun()
-        with nav_col2:
-            if st.button("🎲 Random", use_container_width=True):
-                import random
-                random_index = random.randint(0, len(available_channels) - 1)
-                st.session_state.mobile_channel = random_index
-                st.rerun()
-        with nav_col3:
-            if st.button("➡️ Next", disabled=selected_index == len(available_channels) - 1, use_container_width=True):
-                st.session_state.mobile_channel = selected_index + 1
-                st.rerun()
+        mobile_player()
     
     else:
         # Desktop layout - use sidebar
@@ -294,350 +738,96 @@ else:
             "NEPALI": "🇳🇵"
         }
         
-        category_options = ["All"] + list(channel_categories.keys())
-        category_display = []
+        category_options = ["All"] + list(channel_index.categories)
+        category_labels = {}
         for cat in category_options:
             if cat == "All":
-                category_display.append("🌐 All Categories")
+                category_labels[cat] = "🌐 All Categories"
             else:
                 icon = category_icons.get(cat, "📻")
-                category_display.append(f"{icon} {cat}")
-        
+                category_labels[cat] = f"{icon} {cat}"
+        category_display = list(category_labels.values())
+        
+        # Typo-tolerant search; a result switches to its category as well
+        search_query = st.sidebar.text_input("🔍 Search channels", key="channel_search",
+                                             placeholder="e.g. starsports1")
+        if search_query:
+            results = search_results(search_query)
+            for channel_id in results:
+                st.sidebar.button(
+                    channel_index.display_names[channel_id], key=f"search_{channel_id}", use_container_width=True,
+                    on_click=select_category_channel,
+                    args=("desktop_category", category_labels[channel_index.category_of[channel_id]],
+                          "desktop_channel", channel_id)
+                )
+            if not results:
+                st.sidebar.caption("No matching channels.")
+        
+        # Keyed so quick access can switch to a channel's own category
+        if st.session_state.get('desktop_category') not in category_display:
+            st.session_state.desktop_category = category_labels.get("SPORTS", category_display[0])
         selected_category_display = st.sidebar.selectbox(
             "Filter by category:",
             category_display,
-            index=next((i for i, cat in enumerate(category_options) if cat == "SPORTS"), 0)
+            key="desktop_category"
         )
         
         selected_category = category_options[category_display.index(selected_category_display)]
         st.sidebar.markdown("---")
         
-        # Filter channels based on category
-        if selected_category == "All":
-            available_channels = list(channel_sources.keys())
-        else:
-            available_channels = channel_categories[selected_category]
+        # Filter channels based on category: a view is a contiguous range of channel IDs
+        category_key = None if selected_category == "All" else selected_category
+        with metrics.span('channel_filter'):
+            available_channels = channel_index.view(category_key)
+            default_id = channel_index.default_id(category_key)
+        
+        # Dead streams are known from the background health check's last round
+        offline = health_checker.offline_channels(channel_index) if HEALTH_CHECK_ENABLED else frozenset()
+        if HEALTH_CHECK_ENABLED and st.sidebar.checkbox("Hide offline channels", key="hide_offline") and offline:
+            with metrics.span('offline_filter'):
+                # Filtered once per view and health round, not on every rerun
+                online_view = st.session_state.get('online_view')
+                if online_view is None or online_view[:2] != (category_key, offline):
+                    online_view = st.session_state.online_view = (category_key, offline, [
+                        channel_id for channel_id in available_channels if channel_id not in offline
+                    ])
+                online_channels = online_view[2]
+            if online_channels:
+                available_channels = online_channels
+                if default_id not in available_channels:
+                    default_id = available_channels[0]
         
         st.sidebar.write(f"**{len(available_channels)} channels available**")
         
-        # Find StarSports 1 HD as default
-        default_index = 0
-        for i, channel in enumerate(available_channels):
-            channel_name = channel.split('] ')[1] if '] ' in channel else channel
-            clean_channel_name = channel_name.split('. ', 1)[1] if '. ' in channel_name else channel_name
-            if "StarSports 1 HD" in clean_channel_name:
-                default_index = i
-                break
-        
-        selected_channel_name = st.sidebar.radio(
-            "Choose a channel to watch:",
-            available_channels,
-            index=default_index,
-            format_func=lambda x: x.split('] ')[1] if '] ' in x else x
-        )
+        # StarSports 1 HD is the default, precomputed per view. The list is
+        # virtualized: only a window of rows (and their health captions) is
+        # sent, however many channels the view has.
+        if st.session_state.get('desktop_channel') not in available_channels:
+            st.session_state.desktop_channel = default_id
+        channel_caption = None
+        if HEALTH_CHECK_ENABLED:
+            def channel_caption(channel_id):
+                return "🔴 offline" if channel_id in offline else ""
+        st.sidebar.markdown("Choose a channel to watch:")
+        with st.sidebar:
+            channel_list_panel(available_channels, channel_caption, f"{selected_category}|{len(available_channels)}")
         
         # Quick access for desktop
         st.sidebar.markdown("---")
         st.sidebar.subheader("⭐ Quick Access")
         
-        if st.sidebar.button("🔄 Reload Player", use_container_width=True):
-            st.rerun()
-        
-        if 'selected_channel' in st.session_state and st.session_state.selected_channel in available_channels:
-            selected_channel_name = st.session_state.selected_channel
-
-    # Get the URL for the selected channel
-    selected_channel_url = channel_sources[selected_channel_name]
-    
-    # Extract clean channel name for display
-    display_name = selected_channel_name.split('] ')[1] if '] ' in selected_channel_name else selected_channel_name
-    
-    # Create main header with channel info
-    st.subheader(f"📺 Now Playing: **{display_name}**")
-    
-    # Quick access channels - moved from sidebar to main page
-    if not is_mobile:  # Only show on desktop
-        st.markdown("**⭐ Quick Access**")
-        
-        # Define preferred sports channels for quick access
-        preferred_channels = [
-            "StarSports 1 HD",
-            "StarSports 2 HD", 
-            "StarSports 3 HD",
-            "StarSports SELECT 1 HD",
-            "StarSports SELECT 2 HD",
-            "StarSports SELECT 1",
-            "StarSports SELECT 2",
-            "Sony Ten 1 HD",
-            "Sony Ten 2 HD",
-            "Sony Ten 3 HD",
-            "StarSports 1 HD HINDI"
-        ]
-        
-        # Find matching channels from all available channels
-        quick_access_channels = []
-        for channel_full in channel_sources.keys():
-            channel_name = channel_full.split('] ')[1] if '] ' in channel_full else channel_full
-            # Remove channel number prefix for matching
-            clean_channel_name = channel_name.split('. ', 1)[1] if '. ' in channel_name else channel_name
-            
-            if clean_channel_name in preferred_channels:
-                display_name = clean_channel_name
-                if len(display_name) > 15:
-                    display_name = display_name[:12] + "..."
-                quick_access_channels.append((channel_full, display_name))
-        
-        # Display up to 6 quick access channels
-        if quick_access_channels:
-            num_cols = min(6, len(quick_access_channels))
-            quick_cols = st.columns(num_cols)
-            for i, (full_name, display_name_short) in enumerate(quick_access_channels[:6]):
-                with quick_cols[i]:
-                    if st.button(display_name_short, key=f"main_quick_{i}", use_container_width=True):
-                        st.session_state.selected_channel = full_name
-                        st.rerun()
-        
-        # Add small navigation buttons below quick access
-        current_index = available_channels.index(selected_channel_name)
-        nav_spacer1, nav_col1, nav_spacer2, nav_col2, nav_spacer3 = st.columns([2, 0.5, 0.2, 0.5, 2])
+        if PERSISTENT_PLAYER:
+            st.sidebar.selectbox(
+                "🔲 Multi-view", list(MULTIVIEW_LAYOUTS), key="multiview_layout",
+                help="Watch several channels at once; the focused tile gets sound and full quality"
+            )
+            st.sidebar.checkbox(
+                "⚡ Prefetch nearby channels", value=PREFETCH_ENABLED, key="prefetch",
+                help="Warm the next, previous and quick-access channels for faster switching"
+            )
         
-        with nav_col1:
-            if st.button("⬅️", disabled=current_index == 0, key="nav_prev", help="Previous channel"):
-                prev_channel = available_channels[current_index - 1]
-                st.session_state.selected_channel = prev_channel
-                st.rerun()
-        with nav_col2:
-            if st.button("➡️", disabled=current_index == len(available_channels) - 1, key="nav_next", help="Next channel"):
-                next_channel = available_channels[current_index + 1]
-                st.session_state.selected_channel = next_channel
-                st.rerun()
-    # HLS.js integration for robust HLS playback with mobile responsiveness
-    mobile_aspect_ratio = "75%" if is_mobile else "56.25%"
-    
-    hls_player_html = f"""
-    <div id="player-container" class="video-container" style="position: relative; padding-bottom: {mobile_aspect_ratio}; height: 0; overflow: hidden; max-width: 100%; background-color: #000; border-radius: 12px; box-shadow: 0 8px 32px rgba(0,0,0,0.3);">
-        <video id="video" controls style="position: absolute; top: 0; left: 0; width: 100%; height: 100%; border-radius: 12px;"></video>
-    </div>
-    <script src="https://cdn.jsdelivr.net/npm/hls.js@1.4.14/dist/hls.min.js"></script>
-    <script>
-      console.log('Loading channel: {selected_channel_name}');
-      console.log('URL: {selected_channel_url}');
-      
-      var video = document.getElementById('video');
-      
-      // Mobile-specific optimizations
-      var isMobile = window.innerWidth <= 768;
-      if (isMobile) {{
-        video.setAttribute('playsinline', true);
-        video.setAttribute('webkit-playsinline', true);
-      }}
-      
-      // Destroy any existing HLS instance
-      if (window.currentHls) {{
-        window.currentHls.destroy();
-        window.currentHls = null;
-      }}
-      
-      // Reset video element
-      video.pause();
-      video.src = '';
-      video.load();
-      
-      var hlsConfig = {{
-        debug: false,
-        enableWorker: true,
-        lowLatencyMode: false,
-        backBufferLength: 30,
-        maxBufferLength: 30,
-        maxMaxBufferLength: 60,
-        startLevel: -1,
-        autoStartLoad: true
-      }};
-      
-      if (Hls.isSupported()) {{
-        var hls = new Hls(hlsConfig);
-        window.currentHls = hls;
-
-        hls.on(Hls.Events.MANIFEST_PARSED, function() {{
-          console.log('Manifest parsed, starting playback');
-          setTimeout(() => {{
-            video.play().catch(e => {{
-              console.log('Autoplay failed, user interaction required:', e);
-            }});
-          }}, 500);
-        }});
-        
-        hls.on(Hls.Events.FRAG_LOADED, function() {{
-          console.log('First fragment loaded, attempting play');
-          setTimeout(() => {{
-            if (video.paused) {{
-              video.play().catch(e => {{
-                console.log('Autoplay failed on fragment load:', e);
-              }});
-            }}
-          }}, 100);
-        }});
-        
-        hls.on(Hls.Events.ERROR, function (event, data) {{
-          console.error('HLS error:', data);
-          if (data.fatal) {{
-            switch(data.type) {{
-              case Hls.ErrorTypes.NETWORK_ERROR:
-                console.error("Network error, trying to recover");
-                setTimeout(() => {{
-                  if (hls) {{
-                    hls.startLoad();
-                  }}
-                }}, 1000);
-                break;
-              case Hls.ErrorTypes.MEDIA_ERROR:
-                console.error("Media error, trying to recover");
-                setTimeout(() => {{
-                  if (hls) {{
-                    hls.recoverMediaError();
-                  }}
-                }}, 1000);
-                break;
-              default:
-                console.error("Fatal error, destroying HLS instance");
-                hls.destroy();
-                window.currentHls = null;
-                // Try direct video source as fallback
-                video.src = '{selected_channel_url}';
-                video.play().catch(e => console.log('Direct playback failed:', e));
-                break;
-            }}
-          }}
-        }});
+        st.sidebar.button("🔄 Reload Player", use_container_width=True, on_click=reload_player)
         
-        // Load source and attach media
-        hls.loadSource('{selected_channel_url}');
-        hls.attachMedia(video);
-        
-        // Additional autoplay attempt after attachment
-        setTimeout(() => {{
-          if (video.paused && video.readyState >= 2) {{
-            console.log('Attempting autoplay after media attachment');
-            video.play().catch(e => {{
-              console.log('Post-attachment autoplay failed:', e);
-            }});
-          }}
-        }}, 1000);
-        
-      }} else if (video.canPlayType('application/vnd.apple.mpegurl')) {{
-        console.log('Using native HLS support');
-        video.src = '{selected_channel_url}';
-        video.addEventListener('loadedmetadata', function() {{
-          setTimeout(() => {{
-            video.play().catch(e => console.log('Autoplay failed:', e));
-          }}, 500);
-        }});
-        video.addEventListener('canplay', function() {{
-          setTimeout(() => {{
-            if (video.paused) {{
-              video.play().catch(e => console.log('Can play autoplay failed:', e));
-            }}
-          }}, 200);
-        }});
-      }} else {{
-        console.error('HLS not supported');
-        document.getElementById('player-container').innerHTML = '<p style="color: white; text-align: center; padding: 20px;">Your browser does not support HLS video playback. Please try using Chrome, Firefox, or Safari.</p>';
-      }}
-      
-      // Add general video event listeners for better autoplay handling
-      video.addEventListener('loadeddata', function() {{
-        console.log('Video loaded data, attempting autoplay');
-        setTimeout(() => {{
-          if (video.paused) {{
-            video.play().catch(e => console.log('Loadeddata autoplay failed:', e));
-          }}
-        }}, 300);
-      }});
-      
-      video.addEventListener('canplaythrough', function() {{
-        console.log('Video can play through, attempting autoplay');
-        setTimeout(() => {{
-          if (video.paused) {{
-            video.play().catch(e => console.log('Canplaythrough autoplay failed:', e));
-          }}
-        }}, 100);
-      }});
-      
-      // Add click to play functionality
-      video.addEventListener('click', function() {{
-        if (video.paused) {{
-          video.play();
-        }} else {{
-          video.pause();
-        }}
-      }});
-      
-      // Try autoplay after a short delay when everything is loaded
-      setTimeout(() => {{
-        if (video.paused && video.readyState >= 2) {{
-          console.log('Final autoplay attempt');
-          video.play().catch(e => {{
-            console.log('Final autoplay failed, user interaction required:', e);
-            // Show a subtle play button overlay if autoplay fails
-            var playButton = document.createElement('div');
-            playButton.innerHTML = '▶️ Click to Play';
-            playButton.style.cssText = 'position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); background: rgba(0,0,0,0.7); color: white; padding: 10px 20px; border-radius: 5px; cursor: pointer; font-size: 16px; z-index: 1000;';
-            playButton.onclick = function() {{
-              video.play();
-              playButton.remove();
-            }};
-            document.getElementById('player-container').appendChild(playButton);
-          }});
-        }}
-      }}, 2000);
-      
-      // Mobile-specific touch controls
-      if (isMobile) {{
-        var touchStartTime = 0;
-        video.addEventListener('touchstart', function(e) {{
-          touchStartTime = Date.now();
-        }});
-        
-        video.addEventListener('touchend', function(e) {{
-          var touchDuration = Date.now() - touchStartTime;
-          if (touchDuration < 200) {{ // Quick tap
-            if (video.paused) {{
-              video.play();
-            }} else {{
-              video.pause();
-            }}
-          }}
-        }});
-      }}
-    </script>
-    """
-    st.components.v1.html(hls_player_html, height=620, scrolling=False)
-    
-    # Responsive controls section
-    if not is_mobile:
-        # Desktop controls - full feature set
+        desktop_player(available_channels, category_labels)
 
-        
-        # Footer
-        st.markdown("---")
-        st.caption(" AAEC Custom Player")
-  
-    
-    else:
-        # Mobile controls - simplified
-        st.markdown("---")
-        
-        mobile_control_col1, mobile_control_col2 = st.columns(2)
-        with mobile_control_col1:
-            if st.button("🔄 Reload", use_container_width=True):
-                st.rerun()
-        with mobile_control_col2:
-            if st.button("📊 Info", use_container_width=True):
-                st.info(f"**{display_name}** | Category: {selected_category} | {current_index + 1}/{len(available_channels)}")
-        
-        # Simplified footer for mobile
-        st.markdown("---")
-        st.caption(f"📺 {display_name} | {selected_category} | {current_index + 1}/{len(available_channels)}")
-    
-
-    
+metrics.observe('rerun', time.perf_counter() - rerun_started)
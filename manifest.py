@@ -0,0 +1,301 @@
+"""Master/variant playlist analysis for a fast, informed player start.
+
+With ``startLevel: -1`` hls.js first downloads a fragment of the lowest
+level to measure bandwidth, then jumps, and HD channels often stall on the
+way. Instead, each channel's master playlist (and its first variant) is
+analysed in the background, and the player is told which level to start on
+for the viewer's last measured throughput, plus buffer sizes that fit the
+stream:
+
+    manifest_analyzer.start(lambda: catalog_cache.get().index.stream_urls, health_checker)
+    info = manifest_analyzer.info(url)        # ManifestInfo or None
+    start_config(info, throughput_bps)         # hls.js config overrides
+
+With the health checker passed to ``start``, the analyzer reuses the
+playlists its probes download instead of fetching each one a second time;
+only the first variant of a master playlist is fetched here.
+
+Only the start is decided here; ABR stays automatic once playback runs.
+Run ``python manifest.py URL... --throughput-kbps 3000`` to inspect streams.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from httppool import ConnectionPool
+
+MANIFEST_ANALYSIS_ENABLED = os.environ.get('AAEC_MANIFEST_ANALYSIS', '1') != '0'
+
+# Assumed throughput before the player has reported a measurement
+DEFAULT_THROUGHPUT_BPS = 1_500_000
+
+Variant = namedtuple('Variant', ['bandwidth', 'resolution', 'url'])
+ManifestInfo = namedtuple('ManifestInfo', ['variants', 'target_duration', 'live', 'window_seconds', 'analyzed_at'])
+
+_BANDWIDTH_RE = re.compile(r'[:,]BANDWIDTH=(\d+)')
+_RESOLUTION_RE = re.compile(r'[:,]RESOLUTION=(\d+x\d+)')
+_TARGET_DURATION_RE = re.compile(r'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+_EXTINF_DURATION_RE = re.compile(r'#EXTINF:\s*(\d+(?:\.\d+)?)')
+
+
+def parse_master(text, base_url):
+    """Return the variants of a master playlist, lowest bandwidth first.
+
+    hls.js orders its levels by bitrate too, so a position in this list is
+    a level index as long as every variant is playable.
+    """
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            bandwidth = _BANDWIDTH_RE.search(line)
+            resolution = _RESOLUTION_RE.search(line)
+            pending = (int(bandwidth.group(1)) if bandwidth else 0, resolution.group(1) if resolution else None)
+        elif pending is not None and line and not line.startswith('#'):
+            variants.append(Variant(pending[0], pending[1], urljoin(base_url, line)))
+            pending = None
+    variants.sort(key=lambda variant: variant.bandwidth)
+    return variants
+
+
+def parse_media(text):
+    """Return ``(target_duration, live, window_seconds)`` of a media playlist."""
+    match = _TARGET_DURATION_RE.search(text)
+    target_duration = float(match.group(1)) if match else None
+    window_seconds = sum(float(duration) for duration in _EXTINF_DURATION_RE.findall(text))
+    return target_duration, '#EXT-X-ENDLIST' not in text, window_seconds
+
+
+def start_config(info, throughput_bps=None, safety=0.7):
+    """hls.js config overrides for starting the stream described by ``info``.
+
+    The start level is the best variant that fits in ``safety`` times the
+    throughput (hls.js uses the same factor when switching up); buffers of
+    live streams are capped by what the live window can ever hold. Returns
+    ``{}`` when nothing is known about the stream.
+    """
+    if info is None:
+        return {}
+    throughput = throughput_bps or DEFAULT_THROUGHPUT_BPS
+    config = {'abrEwmaDefaultEstimate': int(throughput)}
+
+    if len(info.variants) > 1:
+        budget = throughput * safety
+        level = 0
+        for index, variant in enumerate(info.variants):
+            if variant.bandwidth <= budget:
+                level = index
+        config['startLevel'] = level
+        # Lets the player map the choice onto its own level list
+        config['startBitrate'] = info.variants[level].bandwidth
+
+    if info.live and info.target_duration:
+        # Buffering ahead stops at the live edge anyway
+        window = max(info.window_seconds, 3 * info.target_duration)
+        config['maxBufferLength'] = round(max(2 * info.target_duration, min(30.0, window)), 1)
+        config['maxMaxBufferLength'] = round(max(config['maxBufferLength'], min(60.0, 2 * window)), 1)
+
+    top_bandwidth = info.variants[-1].bandwidth if info.variants else 0
+    if top_bandwidth:
+        # Enough bytes for the longest buffer at the top bitrate, within hls.js's 60 MB default
+        seconds = config.get('maxMaxBufferLength', 60.0)
+        config['maxBufferSize'] = int(min(60 << 20, max(8 << 20, top_bandwidth / 8 * seconds * 1.5)))
+    return config
+
+
+class ManifestAnalyzer:
+    """Fetches and caches ``ManifestInfo`` per channel URL.
+
+    Master playlists rarely change, so results live for ``ttl`` seconds and
+    are refreshed in background rounds, like the health checks; ``info``
+    never fetches. Playlists ``feed`` hands in are picked up every
+    ``feed_interval`` seconds.
+    """
+
+    def __init__(self, ttl=900.0, interval=300.0, concurrency=8, timeout=5.0, limit_per_host=4,
+                 feed_interval=5.0):
+        self.ttl = ttl
+        self.interval = interval
+        self.feed_interval = feed_interval
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self._results = {}
+        # Master playlist URL -> variants fed in, awaiting their first variant's fetch
+        self._pending = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self.analyses = 0
+        self.failures = 0
+        self.fed = 0
+
+    def info(self, url):
+        """Return the cached ``ManifestInfo`` for ``url``, or ``None`` if unknown or expired."""
+        result = self._results.get(url)
+        if result is None or time.time() - result.analyzed_at > self.ttl:
+            return None
+        return result
+
+    def _due(self, url, now):
+        result = self._results.get(url)
+        return result is None or now - result.analyzed_at > self.ttl - self.interval
+
+    def _store(self, url, variants, media_text):
+        target_duration, live, window_seconds = parse_media(media_text)
+        result = ManifestInfo(tuple(variants), target_duration, live, window_seconds, time.time())
+        self._results[url] = result
+        self.analyses += 1
+        return result
+
+    def feed(self, url, final_url, body):
+        """Analyse a playlist of ``url`` downloaded elsewhere (a health probe) instead of fetching it.
+
+        Safe to call from any thread. A media playlist is analysed on the
+        spot; a master's first variant is fetched in the next round.
+        """
+        if not self._due(url, time.time()):
+            return
+        self.fed += 1
+        text = body.decode('utf-8', 'replace')
+        variants = parse_master(text, final_url) if '#EXT-X-STREAM-INF' in text else []
+        if not variants:
+            self._store(url, variants, text)
+            return
+        with self._lock:
+            self._pending[url] = variants
+
+    async def _fetch_text(self, pool, url):
+        response = await asyncio.wait_for(pool.get(url, max_body=1 << 20), self.timeout)
+        if response.status != 200:
+            raise ValueError(f"HTTP {response.status}")
+        return response.body.decode('utf-8', 'replace'), response.url
+
+    async def analyze(self, pool, url, variants=None):
+        """Fetch ``url`` (and its first variant if it is a master) and cache the result.
+
+        With ``variants`` of a master playlist fetched before, only the first
+        variant is fetched.
+        """
+        if variants is None:
+            text, final_url = await self._fetch_text(pool, url)
+            variants = parse_master(text, final_url) if '#EXT-X-STREAM-INF' in text else []
+        if variants:
+            # Variants of one channel share their segment timing
+            text, _ = await self._fetch_text(pool, variants[0].url)
+        return self._store(url, variants, text)
+
+    async def check(self, urls, pool=None, variants=None):
+        """Analyse ``urls`` (deduplicated) concurrently and return ``{url: ManifestInfo}``.
+
+        ``variants`` maps master playlist URLs to variants already known.
+        """
+        own_pool = pool is None
+        if own_pool:
+            pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def analyze_one(url):
+            async with semaphore:
+                try:
+                    return url, await self.analyze(pool, url, variants.get(url) if variants else None)
+                except Exception:
+                    self.failures += 1
+                    return url, None
+
+        try:
+            results = await asyncio.gather(*(analyze_one(url) for url in dict.fromkeys(urls)))
+        finally:
+            if own_pool:
+                pool.close()
+        return {url: result for url, result in results if result is not None}
+
+    async def _run(self, urls_provider):
+        pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        while True:
+            try:
+                now = time.time()
+                due = [url for url in dict.fromkeys(urls_provider() or []) if self._due(url, now)]
+                if due:
+                    await self.check(due, pool)
+            except Exception:
+                # A bad round (e.g. the catalog vanished) must not kill the thread
+                pass
+            await asyncio.sleep(self.interval)
+
+    async def _run_fed(self):
+        pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            try:
+                if pending:
+                    await self.check(pending, pool, pending)
+            except Exception:
+                pass
+            await asyncio.sleep(self.feed_interval)
+
+    def start(self, urls_provider, health_checker=None):
+        """Start background analysis once per process; later calls are no-ops.
+
+        With ``health_checker``, the playlists come from its probes and
+        ``urls_provider`` isn't used.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if health_checker is not None:
+                health_checker.listeners.append(self.feed)
+                run = self._run_fed()
+            else:
+                run = self._run(urls_provider)
+            self._thread = threading.Thread(target=asyncio.run, args=(run,), name='manifest-analysis', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        now = time.time()
+        fresh = [result for result in self._results.values() if now - result.analyzed_at <= self.ttl]
+        return {
+            'known': len(fresh),
+            'multi_variant': sum(1 for result in fresh if len(result.variants) > 1),
+            'analyses': self.analyses,
+            'failures': self.failures,
+            'fed': self.fed,
+        }
+
+
+# Process-wide analyzer shared by all sessions
+manifest_analyzer = ManifestAnalyzer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse HLS playlists and show the player start config.")
+    parser.add_argument('urls', nargs='+', help="master or media playlist URLs")
+    parser.add_argument('--throughput-kbps', type=float, default=None,
+                        help="viewer throughput to plan for (default: %d)" % (DEFAULT_THROUGHPUT_BPS // 1000))
+    args = parser.parse_args(argv)
+
+    analyzer = ManifestAnalyzer()
+    results = asyncio.run(analyzer.check(args.urls))
+    throughput = args.throughput_kbps * 1000 if args.throughput_kbps else None
+    for url in dict.fromkeys(args.urls):
+        info = results.get(url)
+        if info is None:
+            print(f"FAILED  {url}")
+            continue
+        kind = 'live' if info.live else 'vod'
+        print(f"{url}\n  {kind}, target duration {info.target_duration}s, window {info.window_seconds:.1f}s")
+        for variant in info.variants:
+            print(f"  {variant.bandwidth / 1000:8.0f} kbps  {variant.resolution or '?':>9}  {variant.url}")
+        print(f"  start config: {start_config(info, throughput)}")
+    return 0 if len(results) == len(set(args.urls)) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Low-overhead timing spans and counters, exposed in Prometheus text format.
+
+Hot paths are wrapped in spans and notable events counted, process-wide:
+
+    with metrics.span('channel_filter'):
+        ...
+    metrics.inc('reruns')
+
+A span costs two ``perf_counter`` calls and one bucket increment, so they
+stay on permanently. ``metrics.register_stats(prefix, stats)`` exports the
+numeric values of an existing ``stats()`` dict as gauges. Set
+``AAEC_METRICS_PORT`` to serve everything at ``http://<host>:<port>/metrics``.
+"""
+import http.server
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+METRICS_PORT = int(os.environ.get('AAEC_METRICS_PORT', '0'))
+METRICS_HOST = os.environ.get('AAEC_METRICS_HOST', '0.0.0.0')
+DEBUG_PANEL = os.environ.get('AAEC_DEBUG_PANEL', '0') == '1'
+
+SPAN_BOUNDS_SECONDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts per fixed bucket (``bounds`` are upper edges, plus an overflow bucket)."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'maximum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def quantile(self, q):
+        """Upper edge of the bucket holding the ``q`` quantile (the maximum for overflow)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.bounds[index] if index < len(self.bounds) else self.maximum
+        return self.maximum
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': round(self.total, 1),
+            'max': round(self.maximum, 1),
+        }
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'started')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Span histograms, counters and registered stats collectors for one process."""
+
+    def __init__(self, namespace='aaec'):
+        self.namespace = namespace
+        self.spans = {}
+        self.counters = {}
+        self.collectors = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.started_at = time.time()
+
+    def span(self, name):
+        """Context manager timing the enclosed block into span ``name``."""
+        return _Span(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function into span ``name``."""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with _Span(self, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = Histogram(SPAN_BOUNDS_SECONDS)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_stats(self, prefix, stats):
+        """Export the numeric values of ``stats()`` as ``<namespace>_<prefix>_<key>`` gauges."""
+        self.collectors[prefix] = stats
+
+    def span_rows(self):
+        """One summary row per span, slowest total first, for the debug panel."""
+        with self._lock:
+            rows = [
+                {
+                    'span': name,
+                    'count': histogram.count,
+                    'mean_ms': round(histogram.mean() * 1000, 3),
+                    'p90_ms': round(histogram.quantile(0.9) * 1000, 3),
+                    'max_ms': round(histogram.maximum * 1000, 3),
+                    'total_s': round(histogram.total, 3),
+                }
+                for name, histogram in self.spans.items() if histogram.count
+            ]
+        rows.sort(key=lambda row: -row['total_s'])
+        return rows
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        namespace = self.namespace
+        lines = []
+        with self._lock:
+            spans = [(name, list(h.counts), h.count, h.total) for name, h in sorted(self.spans.items())]
+            counters = sorted(self.counters.items())
+
+        lines.append(f"# HELP {namespace}_span_seconds Time spent in instrumented code paths.")
+        lines.append(f"# TYPE {namespace}_span_seconds histogram")
+        for name, counts, count, total in spans:
+            label = f'span="{_escape(name)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(SPAN_BOUNDS_SECONDS, counts):
+                cumulative += bucket_count
+                lines.append(f'{namespace}_span_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{namespace}_span_seconds_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{namespace}_span_seconds_sum{{{label}}} {total:.6f}')
+            lines.append(f'{namespace}_span_seconds_count{{{label}}} {count}')
+
+        for name, value in counters:
+            lines.append(f"# TYPE {namespace}_{name}_total counter")
+            lines.append(f"{namespace}_{name}_total {value}")
+
+        for prefix, stats in sorted(self.collectors.items()):
+            try:
+                values = stats()
+            except Exception:
+                # A collector whose subsystem isn't ready yet is skipped
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {namespace}_{prefix}_{key} gauge")
+                lines.append(f"{namespace}_{prefix}_{key} {value}")
+
+        lines.append(f"# TYPE {namespace}_uptime_seconds gauge")
+        lines.append(f"{namespace}_uptime_seconds {time.time() - self.started_at:.0f}")
+        return '\n'.join(lines) + '\n'
+
+    def start_server(self, port=METRICS_PORT, host=METRICS_HOST):
+        """Serve ``/metrics`` from a daemon thread once per process."""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        with self._lock:
+            if self._server is not None:
+                return
+            self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+
+
+# Process-wide registry shared by all sessions
+metrics = MetricsRegistry()
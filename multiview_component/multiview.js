@@ -0,0 +1,272 @@
+// Multi-view grid component: several channels in one iframe.
+//
+// Every tile is a <video> with its own Hls instance, but they share this
+// page's single copy of hls.js and a small pool of transmuxing workers:
+// only the first few instances get a worker, the rest transmux on the main
+// thread, which is cheap at the low levels they are held to.
+//
+// The focused tile plays with sound and uncapped quality. The other tiles
+// are muted, keep short buffers and are capped to the highest level that
+// fits both their share of the bandwidth left over by the focused tile and
+// their size on screen, so adding tiles adds little bandwidth and decoding
+// work. Clicking a tile focuses it and sends its index back as the
+// component value.
+(function () {
+  var grid = document.getElementById('grid');
+
+  var tiles = [];
+  var focus = 0;
+  var serverFocus = null;
+  var workerPool = 2;
+  var workersInUse = 0;
+  var bandwidthHint = 0;
+  var lastHeight = 0;
+  var eventCount = 0;
+  var rebalanceTimer = null;
+
+  // Share of the estimated bandwidth the grid plans to use
+  var SAFETY = 0.8;
+  var DEFAULT_BANDWIDTH = 5000000;
+
+  var baseConfig = {
+    debug: false,
+    lowLatencyMode: false,
+    autoStartLoad: true
+  };
+  var FOCUSED = { maxBufferLength: 30, maxMaxBufferLength: 60, backBufferLength: 30 };
+  var BACKGROUND = { maxBufferLength: 8, maxMaxBufferLength: 16, backBufferLength: 0 };
+
+  function send(type, data) {
+    var message = { isStreamlitMessage: true, type: type };
+    for (var key in data) { message[key] = data[key]; }
+    window.parent.postMessage(message, '*');
+  }
+
+  function sendEvent(value) {
+    // Unique across remounts of the iframe, so every event changes the value
+    eventCount += 1;
+    value.seq = Date.now() * 1000 + eventCount % 1000;
+    send('streamlit:setComponentValue', { value: value, dataType: 'json' });
+  }
+
+  function setFrameHeight() {
+    var height = Math.ceil(document.body.getBoundingClientRect().height);
+    if (height !== lastHeight) {
+      lastHeight = height;
+      send('streamlit:setFrameHeight', { height: height });
+    }
+  }
+
+  function estimateBandwidth() {
+    var estimate = bandwidthHint;
+    tiles.forEach(function (tile) {
+      if (tile.hls && tile.hls.bandwidthEstimate > estimate) { estimate = tile.hls.bandwidthEstimate; }
+    });
+    return estimate || DEFAULT_BANDWIDTH;
+  }
+
+  // Highest level within ``budget`` bps and not much taller than the tile
+  function cappedLevel(tile, budget) {
+    var levels = tile.hls.levels;
+    if (!levels || levels.length < 2) { return -1; }
+    var maxHeight = tile.video.clientHeight * (window.devicePixelRatio || 1) * 1.25;
+    var chosen = 0;
+    levels.forEach(function (level, index) {
+      if (level.bitrate <= budget && (!level.height || level.height <= maxHeight) &&
+          level.bitrate > levels[chosen].bitrate) {
+        chosen = index;
+      }
+    });
+    return chosen;
+  }
+
+  function rebalance() {
+    var focusedTile = tiles[focus];
+    var focusedBitrate = 0;
+    if (focusedTile && focusedTile.hls && focusedTile.hls.levels) {
+      var level = focusedTile.hls.levels[focusedTile.hls.currentLevel];
+      focusedBitrate = level ? level.bitrate : 0;
+    }
+    var others = tiles.length - 1;
+    var share = others > 0 ? Math.max(0, estimateBandwidth() * SAFETY - focusedBitrate) / others : 0;
+    tiles.forEach(function (tile, index) {
+      var focused = index === focus;
+      tile.element.classList.toggle('focused', focused);
+      if (focused !== !tile.video.muted) {
+        tile.video.muted = !focused;
+        if (focused) { play(tile); }
+      }
+      if (!tile.hls) { return; }
+      // Buffer sizes are read by hls.js as it loads, so they apply at once
+      Object.assign(tile.hls.config, focused ? FOCUSED : BACKGROUND);
+      tile.hls.autoLevelCapping = focused ? -1 : cappedLevel(tile, share);
+    });
+  }
+
+  function scheduleRebalance() {
+    if (rebalanceTimer === null) {
+      rebalanceTimer = setTimeout(function () { rebalanceTimer = null; rebalance(); }, 250);
+    }
+  }
+
+  function play(tile) {
+    tile.video.play().catch(function () {
+      // Sound needs a user gesture: play muted until the tile is clicked
+      if (!tile.video.muted) {
+        tile.video.muted = true;
+        tile.video.play().catch(function () {});
+      }
+    });
+  }
+
+  function createHls(tile, focused) {
+    var config = Object.assign({}, baseConfig, focused ? FOCUSED : BACKGROUND);
+    config.startLevel = focused ? -1 : 0;
+    config.enableWorker = workersInUse < workerPool;
+    if (config.enableWorker) {
+      workersInUse += 1;
+      tile.worker = true;
+    }
+    var hls = tile.hls = new Hls(config);
+    hls.on(Hls.Events.MANIFEST_PARSED, function () {
+      scheduleRebalance();
+      play(tile);
+    });
+    hls.on(Hls.Events.LEVEL_SWITCHED, scheduleRebalance);
+    hls.on(Hls.Events.ERROR, function (event, data) {
+      if (!data.fatal) { return; }
+      console.error('HLS error on ' + tile.name + ':', data);
+      if (data.type === Hls.ErrorTypes.MEDIA_ERROR) {
+        hls.recoverMediaError();
+      } else if (tile.sourceIndex + 1 < tile.sources.length) {
+        // Next mirror of the same channel
+        tile.sourceIndex += 1;
+        hls.loadSource(tile.sources[tile.sourceIndex]);
+      } else if (data.type === Hls.ErrorTypes.NETWORK_ERROR) {
+        setTimeout(function () { if (tile.hls === hls) { hls.startLoad(); } }, 2000);
+      }
+    });
+    hls.attachMedia(tile.video);
+  }
+
+  function destroyHls(tile) {
+    if (!tile.hls) { return; }
+    tile.hls.destroy();
+    tile.hls = null;
+    if (tile.worker) {
+      workersInUse -= 1;
+      tile.worker = false;
+    }
+  }
+
+  function load(tile, spec, focused) {
+    tile.name = spec.name || spec.url;
+    tile.channel = spec.channel;
+    tile.sources = [spec.url].concat(spec.fallbacks || []);
+    tile.sourceIndex = 0;
+    tile.label.textContent = tile.name;
+    if (window.Hls && Hls.isSupported()) {
+      if (!tile.hls) { createHls(tile, focused); } else { tile.hls.stopLoad(); }
+      tile.hls.loadSource(spec.url);
+    } else if (tile.video.canPlayType('application/vnd.apple.mpegurl')) {
+      tile.video.src = spec.url;
+      play(tile);
+    }
+  }
+
+  function createTile(index) {
+    var element = document.createElement('div');
+    element.className = 'tile';
+    var video = document.createElement('video');
+    video.muted = true;
+    video.playsInline = true;
+    video.setAttribute('webkit-playsinline', '');
+    var label = document.createElement('div');
+    label.className = 'label';
+    element.appendChild(video);
+    element.appendChild(label);
+    grid.appendChild(element);
+    var tile = { element: element, video: video, label: label, hls: null, worker: false, sources: [], name: '',
+                 channel: null };
+    element.addEventListener('click', function () {
+      var position = tiles.indexOf(tile);
+      if (position < 0) { return; }
+      if (position === focus) {
+        // The click is the gesture that allows sound
+        tile.video.muted = false;
+        play(tile);
+        return;
+      }
+      focus = position;
+      rebalance();
+      sendEvent({ event: 'focus', index: position, bandwidth: Math.round(estimateBandwidth()) });
+    });
+    return tile;
+  }
+
+  function render(args) {
+    var specs = args.tiles || [];
+    workerPool = args.workers || workerPool;
+    bandwidthHint = args.bandwidth_bps || 0;
+    if (args.focus !== serverFocus) {
+      serverFocus = args.focus;
+      focus = Math.min(args.focus || 0, Math.max(0, specs.length - 1));
+    }
+    grid.style.gridTemplateColumns = 'repeat(' + (specs.length <= 1 ? 1 : specs.length <= 4 ? 2 : 3) + ', 1fr)';
+
+    while (tiles.length > specs.length) {
+      var removed = tiles.pop();
+      destroyHls(removed);
+      removed.element.remove();
+    }
+    specs.forEach(function (spec, index) {
+      var tile = tiles[index];
+      if (!tile) { tile = tiles[index] = createTile(index); }
+      // A new order of the same channel's mirrors is not a channel change,
+      // but another channel is, even when its URL is one of the mirrors
+      if (tile.channel !== spec.channel || tile.sources.indexOf(spec.url) < 0) { load(tile, spec, index === focus); }
+    });
+    rebalance();
+    setFrameHeight();
+  }
+
+  setInterval(rebalance, 5000);
+
+  // hls.js comes from the URL the server passes (see assets.py), loaded
+  // once; until it is in, renders wait in order
+  var hlsWaiting = null;
+  var hlsTried = false;
+  function withHls(src, integrity, callback) {
+    if (window.Hls || !src || hlsTried) { callback(); return; }
+    if (hlsWaiting) { hlsWaiting.push(callback); return; }
+    hlsWaiting = [callback];
+    var script = document.createElement('script');
+    if (integrity) {
+      // The CDN fallback, checked against the pinned hash
+      script.integrity = integrity;
+      script.crossOrigin = 'anonymous';
+    }
+    script.src = src;
+    // Without hls.js, playback falls back to native HLS
+    script.onload = script.onerror = function () {
+      hlsTried = true;
+      var callbacks = hlsWaiting;
+      hlsWaiting = null;
+      callbacks.forEach(function (waiting) { waiting(); });
+    };
+    document.head.appendChild(script);
+  }
+
+  window.addEventListener('message', function (event) {
+    var data = event.data;
+    if (event.source !== window.parent || !data || data.type !== 'streamlit:render') { return; }
+    var args = data.args || {};
+    withHls(args.hls_src, args.hls_integrity, function () { render(args); });
+  });
+
+  window.addEventListener('resize', function () {
+    setFrameHeight();
+    scheduleRebalance();
+  });
+  send('streamlit:componentReady', { apiVersion: 1 });
+})();
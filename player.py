@@ -0,0 +1,132 @@
+"""The hls.js player embedded by ``main.py``.
+
+``hls_player`` renders the persistent player component in
+``player_component/``: its iframe stays mounted across reruns and switches
+channels in place. ``build_player_html`` is the self-contained one-shot
+iframe used when that is disabled with ``AAEC_PERSISTENT_PLAYER=0``: a
+fixed page around a small JSON config, whose script and hls.js are
+cached assets (see ``assets.py``). ``multiview_player`` plays a grid of
+channels in one component from ``multiview_component/``.
+Streamlit is only imported when the component is first rendered, so the
+markup can be generated (and benchmarked) without a running app.
+"""
+import html
+import json
+import os
+
+from assets import player_assets
+from metrics import metrics
+
+PERSISTENT_PLAYER = os.environ.get('AAEC_PERSISTENT_PLAYER', '1') != '0'
+# Opt-in warming of likely next channels, within a bandwidth budget
+PREFETCH_ENABLED = os.environ.get('AAEC_PREFETCH', '0') == '1'
+PREFETCH_BUDGET_KBPS = int(os.environ.get('AAEC_PREFETCH_KBPS', '2000'))
+PREFETCH_SEGMENTS = os.environ.get('AAEC_PREFETCH_SEGMENTS', '0') == '1'
+PLAYER_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'player_component')
+# Hls instances of a multi-view grid that get a transmuxing worker
+MULTIVIEW_WORKERS = int(os.environ.get('AAEC_MULTIVIEW_WORKERS', '2'))
+MULTIVIEW_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'multiview_component')
+
+_player_component = None
+_multiview_component = None
+# hls.js URL and the iframe page before and after its config, with the asset URLs filled in
+_iframe_page = (None, None)
+
+_IFRAME_TEMPLATE = """
+    <div id="player-container" class="video-container" style="position: relative; padding-bottom: 56.25%; height: 0; overflow: hidden; max-width: 100%; background-color: #000; border-radius: 12px; box-shadow: 0 8px 32px rgba(0,0,0,0.3);">
+        <video id="video" controls style="position: absolute; top: 0; left: 0; width: 100%; height: 100%; border-radius: 12px;"></video>
+    </div>
+    <script type="application/json" id="player-config">{config}</script>
+    <script src="{hls_src}"{hls_integrity}></script>
+    <script src="{player_src}"></script>
+    """
+
+
+def script_json(value):
+    """``value`` as JSON that can't end the ``<script>`` element it is embedded in."""
+    text = json.dumps(value, separators=(',', ':'))
+    return text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+def prefetch_options(urls, budget_kbps=PREFETCH_BUDGET_KBPS, segments=PREFETCH_SEGMENTS):
+    """Player ``prefetch`` argument warming ``urls`` (most likely first)."""
+    return {'urls': list(dict.fromkeys(urls)), 'budget_kbps': budget_kbps, 'segments': segments}
+
+
+def hls_player(url, name, is_mobile=False, reload=0, prefetch=None, fallbacks=None, start=None,
+               qoe=True, channel=None, key='hls_player'):
+    """Render the persistent player and return its last report, if any.
+
+    The report is ``{'event': 'first_frame', 'url', 'name', 'switch_ms',
+    'prefetched', 'seq', 'prefetch_bytes', 'mirror', 'failed'}``, sent once
+    the first frame of a newly selected channel is on screen; ``prefetched``
+    says whether its manifest came from the prefetch store. Bumping
+    ``reload`` reloads the current channel; ``prefetch`` comes from
+    ``prefetch_options``. ``fallbacks`` are the channel's other mirror URLs
+    in order: the player fails over to them on its own, and reports the one
+    that played as ``mirror`` and the ones it gave up on as ``failed``.
+    ``start`` holds hls.js config overrides from ``manifest.start_config``;
+    the report's ``bandwidth`` is the player's throughput estimate in bps.
+    ``channel`` identifies the channel, so switching to another one whose
+    URL is among the current one's mirrors still loads it.
+
+    With ``qoe`` on, the player also sends batches of playback quality
+    events (see ``qoe.py``): such a value carries ``qoe`` (the events) and
+    ``qoe_seq`` on top of the last first-frame report, or ``event: 'qoe'``
+    before any first frame.
+    """
+    global _player_component
+    if _player_component is None:
+        # Declared on first use: registration needs a running script
+        from streamlit.components.v1 import declare_component
+        _player_component = declare_component('hls_player', path=PLAYER_COMPONENT_DIR)
+    with metrics.span('player_component'):
+        return _player_component(url=url, name=name, is_mobile=is_mobile, reload=reload,
+                                 prefetch=prefetch, fallbacks=list(fallbacks or ()), start=start or {},
+                                 qoe=qoe, channel=channel, hls_src=player_assets.url('hls.js'),
+                                 hls_integrity=player_assets.integrity('hls.js'), key=key, default=None)
+
+
+def multiview_player(tiles, focus=0, bandwidth_bps=None, workers=MULTIVIEW_WORKERS, key='multiview_player',
+                     on_change=None):
+    """Render a grid of players in one component and return its last event, if any.
+
+    ``tiles`` are ``{'channel', 'url', 'name', 'fallbacks'}`` dicts, laid out two or
+    three to a row. Tile ``focus`` plays with sound at full quality; the
+    others are muted, with short buffers, and capped to their share of the
+    bandwidth (``bandwidth_bps``, or the players' own estimate) left over
+    by the focused one and to their size on screen. Only ``workers`` of the
+    tiles transmux in a worker. The event is ``{'event': 'focus', 'index',
+    'bandwidth', 'seq'}`` when the viewer clicks another tile.
+    """
+    global _multiview_component
+    if _multiview_component is None:
+        # Declared on first use: registration needs a running script
+        from streamlit.components.v1 import declare_component
+        _multiview_component = declare_component('multiview_player', path=MULTIVIEW_COMPONENT_DIR)
+    with metrics.span('multiview_component'):
+        return _multiview_component(tiles=list(tiles), focus=focus, bandwidth_bps=bandwidth_bps, workers=workers,
+                                    hls_src=player_assets.url('hls.js'),
+                                    hls_integrity=player_assets.integrity('hls.js'), key=key, on_change=on_change,
+                                    default=None)
+
+
+@metrics.timed('player_html')
+def build_player_html(selected_channel_name, selected_channel_url, is_mobile=False, start=None):
+    global _iframe_page
+    hls_src = player_assets.url('hls.js')
+    # Rebuilt only when hls.js moves from the CDN to the vendored copy
+    if _iframe_page[0] != hls_src:
+        integrity = player_assets.integrity('hls.js')
+        page = _IFRAME_TEMPLATE.replace('{hls_src}', html.escape(hls_src)).replace(
+            '{hls_integrity}', f' integrity="{html.escape(integrity)}" crossorigin="anonymous"' if integrity else ''
+        ).replace('{player_src}', html.escape(player_assets.url('iframe_player.js')))
+        _iframe_page = (hls_src, page.split('{config}'))
+    config = {
+        'url': selected_channel_url,
+        'name': selected_channel_name,
+        'is_mobile': is_mobile,
+        # Server-picked start level and buffer sizes (hls.js config keys only)
+        'start': {key: value for key, value in (start or {}).items() if key != 'startBitrate'},
+    }
+    return script_json(config).join(_iframe_page[1])
@@ -0,0 +1,203 @@
+// One-shot player for the iframe fallback (AAEC_PERSISTENT_PLAYER=0).
+//
+// The page around it is a fixed template from player.py; all that changes
+// per channel is the JSON config in #player-config ({url, name, is_mobile,
+// start}), so this script is cached by the browser like hls.js itself.
+(function () {
+  var config = JSON.parse(document.getElementById('player-config').textContent);
+  console.log('Loading channel: ' + config.name);
+  console.log('URL: ' + config.url);
+
+  var video = document.getElementById('video');
+
+  // Squarer aspect ratio on mobile
+  if (config.is_mobile) {
+    document.getElementById('player-container').style.paddingBottom = '75%';
+  }
+
+  // Mobile-specific optimizations
+  var isMobile = window.innerWidth <= 768;
+  if (isMobile) {
+    video.setAttribute('playsinline', true);
+    video.setAttribute('webkit-playsinline', true);
+  }
+
+  // Destroy any existing HLS instance
+  if (window.currentHls) {
+    window.currentHls.destroy();
+    window.currentHls = null;
+  }
+
+  // Reset video element
+  video.pause();
+  video.src = '';
+  video.load();
+
+  var hlsConfig = {
+    debug: false,
+    enableWorker: true,
+    lowLatencyMode: false,
+    backBufferLength: 30,
+    maxBufferLength: 30,
+    maxMaxBufferLength: 60,
+    startLevel: -1,
+    autoStartLoad: true
+  };
+  Object.assign(hlsConfig, config.start);
+
+  if (window.Hls && Hls.isSupported()) {
+    var hls = new Hls(hlsConfig);
+    window.currentHls = hls;
+
+    hls.on(Hls.Events.MANIFEST_PARSED, function() {
+      console.log('Manifest parsed, starting playback');
+      setTimeout(() => {
+        video.play().catch(e => {
+          console.log('Autoplay failed, user interaction required:', e);
+        });
+      }, 500);
+    });
+
+    hls.on(Hls.Events.FRAG_LOADED, function() {
+      console.log('First fragment loaded, attempting play');
+      setTimeout(() => {
+        if (video.paused) {
+          video.play().catch(e => {
+            console.log('Autoplay failed on fragment load:', e);
+          });
+        }
+      }, 100);
+    });
+
+    hls.on(Hls.Events.ERROR, function (event, data) {
+      console.error('HLS error:', data);
+      if (data.fatal) {
+        switch(data.type) {
+          case Hls.ErrorTypes.NETWORK_ERROR:
+            console.error("Network error, trying to recover");
+            setTimeout(() => {
+              if (hls) {
+                hls.startLoad();
+              }
+            }, 1000);
+            break;
+          case Hls.ErrorTypes.MEDIA_ERROR:
+            console.error("Media error, trying to recover");
+            setTimeout(() => {
+              if (hls) {
+                hls.recoverMediaError();
+              }
+            }, 1000);
+            break;
+          default:
+            console.error("Fatal error, destroying HLS instance");
+            hls.destroy();
+            window.currentHls = null;
+            // Try direct video source as fallback
+            video.src = config.url;
+            video.play().catch(e => console.log('Direct playback failed:', e));
+            break;
+        }
+      }
+    });
+
+    // Load source and attach media
+    hls.loadSource(config.url);
+    hls.attachMedia(video);
+
+    // Additional autoplay attempt after attachment
+    setTimeout(() => {
+      if (video.paused && video.readyState >= 2) {
+        console.log('Attempting autoplay after media attachment');
+        video.play().catch(e => {
+          console.log('Post-attachment autoplay failed:', e);
+        });
+      }
+    }, 1000);
+
+  } else if (video.canPlayType('application/vnd.apple.mpegurl')) {
+    console.log('Using native HLS support');
+    video.src = config.url;
+    video.addEventListener('loadedmetadata', function() {
+      setTimeout(() => {
+        video.play().catch(e => console.log('Autoplay failed:', e));
+      }, 500);
+    });
+    video.addEventListener('canplay', function() {
+      setTimeout(() => {
+        if (video.paused) {
+          video.play().catch(e => console.log('Can play autoplay failed:', e));
+        }
+      }, 200);
+    });
+  } else {
+    console.error('HLS not supported');
+    document.getElementById('player-container').innerHTML = '<p style="color: white; text-align: center; padding: 20px;">Your browser does not support HLS video playback. Please try using Chrome, Firefox, or Safari.</p>';
+  }
+
+  // Add general video event listeners for better autoplay handling
+  video.addEventListener('loadeddata', function() {
+    console.log('Video loaded data, attempting autoplay');
+    setTimeout(() => {
+      if (video.paused) {
+        video.play().catch(e => console.log('Loadeddata autoplay failed:', e));
+      }
+    }, 300);
+  });
+
+  video.addEventListener('canplaythrough', function() {
+    console.log('Video can play through, attempting autoplay');
+    setTimeout(() => {
+      if (video.paused) {
+        video.play().catch(e => console.log('Canplaythrough autoplay failed:', e));
+      }
+    }, 100);
+  });
+
+  // Add click to play functionality
+  video.addEventListener('click', function() {
+    if (video.paused) {
+      video.play();
+    } else {
+      video.pause();
+    }
+  });
+
+  // Try autoplay after a short delay when everything is loaded
+  setTimeout(() => {
+    if (video.paused && video.readyState >= 2) {
+      console.log('Final autoplay attempt');
+      video.play().catch(e => {
+        console.log('Final autoplay failed, user interaction required:', e);
+        // Show a subtle play button overlay if autoplay fails
+        var playButton = document.createElement('div');
+        playButton.innerHTML = '▶️ Click to Play';
+        playButton.style.cssText = 'position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); background: rgba(0,0,0,0.7); color: white; padding: 10px 20px; border-radius: 5px; cursor: pointer; font-size: 16px; z-index: 1000;';
+        playButton.onclick = function() {
+          video.play();
+          playButton.remove();
+        };
+        document.getElementById('player-container').appendChild(playButton);
+      });
+    }
+  }, 2000);
+
+  // Mobile-specific touch controls
+  if (isMobile) {
+    var touchStartTime = 0;
+    video.addEventListener('touchstart', function(e) {
+      touchStartTime = Date.now();
+    });
+
+    video.addEventListener('touchend', function(e) {
+      var touchDuration = Date.now() - touchStartTime;
+      if (touchDuration < 200) { // Quick tap
+        if (video.paused) {
+          video.play();
+        } else {
+          video.pause();
+        }
+      }
+    });
+  }
+})();
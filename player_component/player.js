@@ -0,0 +1,507 @@
+// Persistent HLS player component.
+//
+// The iframe stays mounted across Streamlit reruns: a channel change arrives
+// as a new "streamlit:render" message and is applied with loadSource() on
+// the same Hls instance, so hls.js is downloaded and parsed only once. When
+// the first frame of a new channel is shown the switch time is sent back as
+// the component value.
+//
+// The server's analysis of the channel's playlists comes with each channel
+// as "start" config: the level to start on and buffer sizes, applied to the
+// shared instance per load (ABR takes over after the start).
+//
+// Playback quality events (startup time, stalls, level switches, fatal
+// errors, the autoplay path that worked) are batched and sent back with
+// the component value, at most every few seconds and never while idle.
+//
+// A channel comes with an ordered list of mirror URLs, best first. On a
+// fatal error the player moves on to the next mirror by itself, without a
+// round trip to the server, and reports which mirrors failed.
+//
+// With prefetch enabled, manifests (and optionally the first segment) of
+// the channels the viewer is most likely to switch to next are fetched in
+// the background within a bandwidth budget, and served to hls.js from
+// memory when the switch happens.
+(function () {
+  var video = document.getElementById('video');
+  var container = document.getElementById('player-container');
+  var playButton = document.getElementById('play-button');
+
+  var hls = null;
+  var currentUrl = null;
+  var currentName = null;
+  var currentSources = [];
+  var currentChannel = null;
+  var sourceIndex = 0;
+  var currentStart = {};
+  var switchStartedAt = 0;
+  var firstFrameReported = true;
+  var lastHeight = 0;
+  var lastReload = null;
+  var loadGeneration = 0;
+  var reportCount = 0;
+
+  // Prefetch store: url -> { data, at }; refilled by a token bucket of
+  // budgetBytesPerSecond with a ten-second burst
+  var prefetch = {
+    urls: [],
+    segments: false,
+    budgetBytesPerSecond: 0,
+    refreshMs: 6000,
+    manifestMaxAgeMs: 5000,
+    segmentMaxAgeMs: 20000,
+    tokens: 0,
+    refilledAt: performance.now(),
+    entries: new Map(),
+    timer: null,
+    options: '',
+    usedForCurrent: false,
+    bytes: 0
+  };
+
+  // QoE events waiting to be sent; lastFirstFrame is resent with each batch
+  // because the component value is replaced as a whole
+  var qoe = {
+    enabled: true,
+    events: [],
+    maxEvents: 200,
+    flushMs: 15000,
+    timer: null,
+    seq: 0,
+    stallStartedAt: 0,
+    autoplayReported: true,
+    levelReported: false
+  };
+  var lastFirstFrame = null;
+
+  function send(type, data) {
+    var message = { isStreamlitMessage: true, type: type };
+    for (var key in data) { message[key] = data[key]; }
+    window.parent.postMessage(message, '*');
+  }
+
+  function setFrameHeight() {
+    var height = Math.ceil(document.body.getBoundingClientRect().height);
+    if (height !== lastHeight) {
+      lastHeight = height;
+      send('streamlit:setFrameHeight', { height: height });
+    }
+  }
+
+  function qoeEvent(type, fields) {
+    if (!qoe.enabled) { return; }
+    var event = { type: type, name: currentName, url: currentSources[sourceIndex] || currentUrl };
+    for (var key in fields) { event[key] = fields[key]; }
+    if (qoe.events.length >= qoe.maxEvents) { qoe.events.shift(); }
+    qoe.events.push(event);
+    if (!qoe.timer) { qoe.timer = setTimeout(flushQoe, qoe.flushMs); }
+  }
+
+  function sendReport() {
+    if (qoe.timer) { clearTimeout(qoe.timer); qoe.timer = null; }
+    var value = Object.assign({ event: 'qoe' }, lastFirstFrame);
+    if (qoe.events.length) {
+      qoe.seq += 1;
+      value.qoe = qoe.events;
+      value.qoe_seq = qoe.seq;
+      qoe.events = [];
+    }
+    send('streamlit:setComponentValue', { value: value, dataType: 'json' });
+  }
+
+  function flushQoe() {
+    qoe.timer = null;
+    if (qoe.events.length) { sendReport(); }
+  }
+
+  // Credits the first play() that succeeds after a load with getting playback going
+  function playFrom(path) {
+    return video.play().then(function () {
+      playButton.style.display = 'none';
+      if (!qoe.autoplayReported) {
+        qoe.autoplayReported = true;
+        qoeEvent('autoplay', { path: path });
+      }
+    });
+  }
+
+  function tryPlay(reason) {
+    if (!video.paused) { return; }
+    playFrom(reason).catch(function (e) {
+      console.log('Autoplay failed (' + reason + '):', e);
+    });
+  }
+
+  function reportFirstFrame() {
+    if (firstFrameReported) { return; }
+    firstFrameReported = true;
+    var switchMs = Math.round(performance.now() - switchStartedAt);
+    console.log('First frame of ' + currentName + ' after ' + switchMs + ' ms');
+    reportCount += 1;
+    lastFirstFrame = {
+      event: 'first_frame', url: currentUrl, name: currentName, switch_ms: switchMs,
+      prefetched: prefetch.usedForCurrent, seq: reportCount, prefetch_bytes: prefetch.bytes,
+      mirror: currentSources[sourceIndex], failed: currentSources.slice(0, sourceIndex),
+      bandwidth: hls && hls.bandwidthEstimate > 0 ? Math.round(hls.bandwidthEstimate) : null
+    };
+    qoeEvent('startup', { ms: switchMs });
+    sendReport();
+    // Only warm other channels once this one is playing
+    schedulePrefetch();
+  }
+
+  function refillTokens() {
+    var now = performance.now();
+    var rate = prefetch.budgetBytesPerSecond;
+    prefetch.tokens = Math.min(rate * 10, prefetch.tokens + (now - prefetch.refilledAt) / 1000 * rate);
+    prefetch.refilledAt = now;
+  }
+
+  function takeTokens(estimate) {
+    refillTokens();
+    if (prefetch.tokens < estimate) { return false; }
+    prefetch.tokens -= estimate;
+    return true;
+  }
+
+  function storePrefetched(url, data, estimate) {
+    var size = typeof data === 'string' ? data.length : data.byteLength;
+    prefetch.tokens -= Math.max(0, size - estimate);
+    prefetch.bytes += size;
+    prefetch.entries.set(url, { data: data, at: performance.now() });
+  }
+
+  function takePrefetched(url, maxAgeMs) {
+    var entry = prefetch.entries.get(url);
+    if (!entry) { return null; }
+    prefetch.entries.delete(url);
+    return performance.now() - entry.at <= maxAgeMs ? entry.data : null;
+  }
+
+  function playlistUris(text) {
+    return text.split('\n').map(function (line) { return line.trim(); })
+      .filter(function (line) { return line && line.charAt(0) !== '#'; });
+  }
+
+  function prefetchUrl(url, isSegment) {
+    var estimate = isSegment ? 1 << 20 : 4096;
+    if (!takeTokens(estimate)) { return; }
+    fetch(url, { cache: 'no-store' }).then(function (response) {
+      if (!response.ok) { throw new Error('HTTP ' + response.status); }
+      return isSegment ? response.arrayBuffer() : response.text();
+    }).then(function (data) {
+      storePrefetched(url, data, estimate);
+      if (isSegment) { return; }
+      var uris = playlistUris(data);
+      if (!uris.length) { return; }
+      if (data.indexOf('#EXT-X-STREAM-INF') >= 0) {
+        // Master playlist: hls.js starts on the first listed variant
+        prefetchUrl(new URL(uris[0], url).href, false);
+      } else if (prefetch.segments) {
+        // Live playback starts about three segments from the end
+        var segment = new URL(uris[Math.max(0, uris.length - 3)], url).href;
+        if (!prefetch.entries.has(segment)) { prefetchUrl(segment, true); }
+      }
+    }).catch(function (e) {
+      console.log('Prefetch of ' + url + ' failed:', e);
+    });
+  }
+
+  function runPrefetch() {
+    // Live segments slide out of the window; forget anything too old to use
+    var now = performance.now();
+    prefetch.entries.forEach(function (entry, url) {
+      if (now - entry.at > prefetch.segmentMaxAgeMs) { prefetch.entries.delete(url); }
+    });
+    prefetch.urls.forEach(function (url) {
+      if (url !== currentUrl) { prefetchUrl(url, false); }
+    });
+  }
+
+  function schedulePrefetch() {
+    if (prefetch.timer) { clearInterval(prefetch.timer); prefetch.timer = null; }
+    if (!prefetch.urls.length || !prefetch.budgetBytesPerSecond) { return; }
+    runPrefetch();
+    prefetch.timer = setInterval(runPrefetch, prefetch.refreshMs);
+  }
+
+  function configurePrefetch(options) {
+    options = options || {};
+    var key = JSON.stringify(options);
+    if (key === prefetch.options) { return; }
+    prefetch.options = key;
+    prefetch.urls = options.urls || [];
+    prefetch.segments = !!options.segments;
+    prefetch.budgetBytesPerSecond = (options.budget_kbps || 0) * 1000 / 8;
+    if (!prefetch.urls.length) { prefetch.entries.clear(); }
+    if (firstFrameReported) { schedulePrefetch(); }
+  }
+
+  // hls.js loader that answers from the prefetch store before the network
+  function prefetchLoader(maxAgeKey, isCurrentManifest) {
+    return class extends Hls.DefaultConfig.loader {
+      load(context, config, callbacks) {
+        var data = takePrefetched(context.url, prefetch[maxAgeKey]);
+        if (data === null) { return super.load(context, config, callbacks); }
+        if (isCurrentManifest && context.url === currentUrl) { prefetch.usedForCurrent = true; }
+        var now = performance.now();
+        var size = typeof data === 'string' ? data.length : data.byteLength;
+        this.context = context;
+        this.stats.loading.start = this.stats.loading.first = this.stats.loading.end = now;
+        this.stats.loaded = this.stats.total = size;
+        callbacks.onSuccess({ url: context.url, data: data }, this.stats, context, null);
+      }
+    };
+  }
+
+  // Called once data of the new source is buffered, so a frame still on
+  // screen from the previous channel isn't mistaken for the first new one
+  function watchFirstFrame() {
+    if (firstFrameReported || !video.requestVideoFrameCallback) { return; }
+    var generation = loadGeneration;
+    video.requestVideoFrameCallback(function () {
+      if (generation === loadGeneration) { reportFirstFrame(); }
+    });
+  }
+
+  var hlsConfig = {
+    debug: false,
+    enableWorker: true,
+    lowLatencyMode: false,
+    backBufferLength: 30,
+    maxBufferLength: 30,
+    maxMaxBufferLength: 60,
+    startLevel: -1,
+    autoStartLoad: true
+  };
+
+  // Settings the per-channel start config may override
+  var TUNABLE = ['maxBufferLength', 'maxMaxBufferLength', 'maxBufferSize', 'abrEwmaDefaultEstimate'];
+
+  function applyStartConfig(config) {
+    TUNABLE.forEach(function (key) {
+      config[key] = key in currentStart ? currentStart[key] : hlsConfig[key];
+    });
+  }
+
+  // The level whose bitrate the server picked; indexes can differ when
+  // hls.js drops variants it can't play
+  function startLevelFor(levels) {
+    var bitrate = currentStart.startBitrate;
+    if (!bitrate || !levels || levels.length < 2) { return hlsConfig.startLevel; }
+    var chosen = -1;
+    levels.forEach(function (level, index) {
+      if (level.bitrate <= bitrate && (chosen < 0 || level.bitrate >= levels[chosen].bitrate)) { chosen = index; }
+    });
+    return chosen < 0 ? 0 : chosen;
+  }
+
+  function createHls() {
+    var config = Object.assign({}, hlsConfig);
+    applyStartConfig(config);
+    config.pLoader = prefetchLoader('manifestMaxAgeMs', true);
+    config.fLoader = prefetchLoader('segmentMaxAgeMs', false);
+    hls = new Hls(config);
+
+    hls.on(Hls.Events.MANIFEST_PARSED, function (event, data) {
+      // Loading starts right after this event, at hls.startLevel
+      hls.startLevel = startLevelFor(data.levels);
+      console.log('Manifest parsed, starting playback at level ' + hls.startLevel);
+      tryPlay('manifest parsed');
+    });
+
+    hls.on(Hls.Events.FRAG_BUFFERED, watchFirstFrame);
+
+    hls.on(Hls.Events.LEVEL_SWITCHED, function (event, data) {
+      var level = hls.levels[data.level] || {};
+      qoeEvent('level', { bitrate: level.bitrate || null, height: level.height || null, initial: !qoe.levelReported });
+      qoe.levelReported = true;
+    });
+
+    hls.on(Hls.Events.FRAG_LOADED, function () {
+      if (video.paused) { setTimeout(function () { tryPlay('fragment loaded'); }, 100); }
+    });
+
+    hls.on(Hls.Events.ERROR, function (event, data) {
+      console.error('HLS error:', data);
+      if (!data.fatal) { return; }
+      qoeEvent('error', { error: data.type, details: data.details });
+      switch (data.type) {
+        case Hls.ErrorTypes.NETWORK_ERROR:
+          if (failover('Network error')) { break; }
+          console.error('Network error, trying to recover');
+          setTimeout(function () { if (hls) { hls.startLoad(); } }, 1000);
+          break;
+        case Hls.ErrorTypes.MEDIA_ERROR:
+          console.error('Media error, trying to recover');
+          setTimeout(function () { if (hls) { hls.recoverMediaError(); } }, 1000);
+          break;
+        default:
+          // Rebuilt for the next mirror or switch; try direct playback meanwhile
+          console.error('Fatal error, destroying HLS instance');
+          hls.destroy();
+          hls = null;
+          if (failover('Fatal error')) { break; }
+          video.src = currentSources[sourceIndex];
+          tryPlay('direct fallback');
+          break;
+      }
+    });
+
+    hls.attachMedia(video);
+  }
+
+  function playSource() {
+    var url = currentSources[sourceIndex];
+    if (window.Hls && Hls.isSupported()) {
+      if (!hls) {
+        video.removeAttribute('src');
+        createHls();
+      } else {
+        hls.stopLoad();
+        applyStartConfig(hls.config);
+      }
+      // Same instance, same MediaSource attachment: only the source changes
+      hls.loadSource(url);
+    } else if (video.canPlayType('application/vnd.apple.mpegurl')) {
+      console.log('Using native HLS support');
+      video.src = url;
+    } else {
+      console.error('HLS not supported');
+      container.innerHTML = '<p style="color: white; text-align: center; padding: 20px;">Your browser does not support HLS video playback. Please try using Chrome, Firefox, or Safari.</p>';
+      return false;
+    }
+    return true;
+  }
+
+  // Move on to the next mirror of the current channel, if there is one
+  function failover(reason) {
+    if (sourceIndex + 1 >= currentSources.length) { return false; }
+    sourceIndex += 1;
+    console.error(reason + ', switching to mirror ' + (sourceIndex + 1) + ' of ' + currentSources.length);
+    loadGeneration += 1;
+    playSource();
+    return true;
+  }
+
+  function load(url, name, fallbacks, start) {
+    console.log('Loading channel: ' + name);
+    console.log('URL: ' + url);
+    currentUrl = url;
+    currentName = name;
+    currentSources = [url].concat(fallbacks || []);
+    currentStart = start || {};
+    sourceIndex = 0;
+    switchStartedAt = performance.now();
+    firstFrameReported = false;
+    loadGeneration += 1;
+    prefetch.usedForCurrent = false;
+    // A stall cut short by switching away is not rebuffering
+    qoe.stallStartedAt = 0;
+    qoe.autoplayReported = false;
+    qoe.levelReported = false;
+    if (prefetch.timer) { clearInterval(prefetch.timer); prefetch.timer = null; }
+
+    if (!playSource()) { return; }
+
+    // Show a subtle play button if autoplay still hasn't worked
+    setTimeout(function () {
+      if (currentUrl === url && video.paused) {
+        playFrom('delayed retry').catch(function () { playButton.style.display = 'block'; });
+      }
+    }, 2000);
+  }
+
+  // General video event listeners for better autoplay handling
+  video.addEventListener('loadedmetadata', function () { tryPlay('loadedmetadata'); });
+  video.addEventListener('loadeddata', function () {
+    if (!hls) { watchFirstFrame(); } // Native HLS has no fragment events
+    setTimeout(function () { tryPlay('loadeddata'); }, 300);
+  });
+  video.addEventListener('canplaythrough', function () { setTimeout(function () { tryPlay('canplaythrough'); }, 100); });
+  video.addEventListener('error', function () {
+    // hls.js reports its own errors; this is native HLS or direct playback
+    if (!hls && currentSources.length) { failover('Playback error'); }
+  });
+  video.addEventListener('waiting', function () {
+    if (firstFrameReported && !video.seeking && !qoe.stallStartedAt) { qoe.stallStartedAt = performance.now(); }
+  });
+  video.addEventListener('playing', function () {
+    playButton.style.display = 'none';
+    if (qoe.stallStartedAt) {
+      qoeEvent('stall', { ms: Math.round(performance.now() - qoe.stallStartedAt) });
+      qoe.stallStartedAt = 0;
+    }
+    // Fallback where requestVideoFrameCallback is unavailable
+    if (!video.requestVideoFrameCallback) { reportFirstFrame(); }
+  });
+
+  playButton.addEventListener('click', function () {
+    playFrom('play button');
+    playButton.style.display = 'none';
+  });
+
+  // Add click to play functionality
+  video.addEventListener('click', function () {
+    if (video.paused) { playFrom('click'); } else { video.pause(); }
+  });
+
+  // Mobile-specific touch controls
+  var touchStartTime = 0;
+  video.addEventListener('touchstart', function () { touchStartTime = Date.now(); });
+  video.addEventListener('touchend', function () {
+    if (Date.now() - touchStartTime < 200) { // Quick tap
+      if (video.paused) { playFrom('tap'); } else { video.pause(); }
+    }
+  });
+
+  // hls.js comes from the URL the server passes (see assets.py), loaded
+  // once; until it is in, renders wait in order
+  var hlsWaiting = null;
+  var hlsTried = false;
+  function withHls(src, integrity, callback) {
+    if (window.Hls || !src || hlsTried) { callback(); return; }
+    if (hlsWaiting) { hlsWaiting.push(callback); return; }
+    hlsWaiting = [callback];
+    var script = document.createElement('script');
+    if (integrity) {
+      // The CDN fallback, checked against the pinned hash
+      script.integrity = integrity;
+      script.crossOrigin = 'anonymous';
+    }
+    script.src = src;
+    // Without hls.js, playback falls back to native HLS
+    script.onload = script.onerror = function () {
+      hlsTried = true;
+      var callbacks = hlsWaiting;
+      hlsWaiting = null;
+      callbacks.forEach(function (waiting) { waiting(); });
+    };
+    document.head.appendChild(script);
+  }
+
+  window.addEventListener('message', function (event) {
+    var data = event.data;
+    if (event.source !== window.parent || !data || data.type !== 'streamlit:render') { return; }
+    var args = data.args || {};
+    container.classList.toggle('mobile', !!args.is_mobile);
+    setFrameHeight();
+    withHls(args.hls_src, args.hls_integrity, function () {
+      qoe.enabled = args.qoe !== false;
+      // A changed reload counter forces a fresh load of the same channel
+      var reload = lastReload !== null && args.reload !== lastReload;
+      lastReload = args.reload;
+      // A new order of the same channel's mirrors is not a channel switch,
+      // but another channel is, even when its URL is one of the mirrors
+      var switched = args.channel !== currentChannel || currentSources.indexOf(args.url) < 0;
+      if (args.url && (switched || reload)) {
+        currentChannel = args.channel;
+        load(args.url, args.name || args.url, args.fallbacks, args.start);
+      }
+      configurePrefetch(args.prefetch);
+    });
+  });
+
+  window.addEventListener('resize', setFrameHeight);
+  send('streamlit:componentReady', { apiVersion: 1 });
+})();
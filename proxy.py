@@ -0,0 +1,412 @@
+"""Optional local HLS proxy that fans one upstream fetch out to many viewers.
+
+With ``AAEC_PROXY=1`` the player is handed proxied channel URLs instead of
+upstream ones. Concurrent requests for the same manifest or segment are
+coalesced into a single upstream fetch, and responses are kept for a short
+while (segments in a ``SegmentCache``), so upstream traffic stays flat as
+the number of viewers grows.
+
+Proxied paths mirror the upstream URL (``/hls/http/host:port/path``), so
+relative segment URIs in manifests resolve through the proxy untouched;
+only absolute and root-relative URIs are rewritten. Other services can
+``mount`` their own paths on the proxy's server and event loop.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urljoin, urlsplit
+
+from httppool import ConnectionPool
+from segment_cache import SegmentCache
+
+PROXY_ENABLED = os.environ.get('AAEC_PROXY', '0') == '1'
+PROXY_HOST = os.environ.get('AAEC_PROXY_HOST', '0.0.0.0')
+PROXY_PORT = int(os.environ.get('AAEC_PROXY_PORT', '8765'))
+# Base URL the browser uses to reach the proxy
+PROXY_URL = os.environ.get('AAEC_PROXY_URL', f'http://localhost:{PROXY_PORT}')
+
+# A response body sent straight from a file with sendfile(), without copies
+FileRange = namedtuple('FileRange', ['file', 'offset', 'count'])
+
+# Largest request body skipped to keep a connection alive
+_MAX_DRAINED_BODY = 64 << 10
+
+_URI_ATTRIBUTE_RE = re.compile(r'URI="([^"]*)"')
+
+_REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+            405: 'Method Not Allowed', 502: 'Bad Gateway', 504: 'Gateway Timeout'}
+
+
+def is_manifest(url, content_type=''):
+    return urlsplit(url).path.endswith(('.m3u8', '.m3u')) or 'mpegurl' in content_type.lower()
+
+
+class ResponseCache:
+    """A small TTL cache of upstream manifests, bounded by total body bytes."""
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(url)
+            return None
+        self._entries.move_to_end(url)
+        return entry[1]
+
+    def put(self, url, response, ttl):
+        if ttl <= 0 or len(response[2]) > self.max_bytes:
+            return
+        if url in self._entries:
+            self._remove(url)
+        self._entries[url] = (time.monotonic() + ttl, response)
+        self.size += len(response[2])
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, url):
+        _, response = self._entries.pop(url)
+        self.size -= len(response[2])
+
+
+class HLSProxy:
+    """Serves ``/hls/<scheme>/<netloc>/<path>`` from coalesced upstream fetches.
+
+    Only hosts returned by the ``allowed_hosts`` callable (the catalog's
+    upstream origins), and the hosts their manifests redirect or link to,
+    are proxied, so this is never an open proxy. A linked host stays allowed
+    for ``linked_host_ttl`` seconds after it was last linked or requested,
+    and at most ``max_linked_hosts`` of them are kept.
+    """
+
+    def __init__(self, public_url=PROXY_URL, manifest_ttl=1.0, timeout=10.0,
+                 cache=None, segments=None, limit_per_host=16, linked_host_ttl=600.0, max_linked_hosts=1024,
+                 max_manifest_urls=4096):
+        self.public_url = public_url.rstrip('/')
+        self.manifest_ttl = manifest_ttl
+        self.timeout = timeout
+        self.cache = cache if cache is not None else ResponseCache()
+        self.segments = segments if segments is not None else SegmentCache()
+        self.limit_per_host = limit_per_host
+        self.allowed_hosts = lambda: ()
+        self.linked_host_ttl = linked_host_ttl
+        self.max_linked_hosts = max_linked_hosts
+        # (scheme, netloc) of redirect targets and of URIs rewritten onto the
+        # proxy -> when it stops being allowed, least recently used first
+        self.linked_hosts = OrderedDict()
+        # Manifest URLs without a manifest extension, known from their content type
+        self._manifest_urls = OrderedDict()
+        self.max_manifest_urls = max_manifest_urls
+        self._pool = None
+        self._in_flight = {}
+        self._flush = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._mounts = {}
+        self._background = []
+        self._tasks = []
+        self.requests = 0
+        self.upstream_fetches = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.upstream_bytes = 0
+        self.served_bytes = 0
+
+    # URL mapping
+
+    def proxied_url(self, url):
+        """Return the proxy URL the player should use for upstream ``url``."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return url
+        proxied = f"{self.public_url}/hls/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+        if parts.query:
+            proxied += '?' + parts.query
+        return proxied
+
+    @staticmethod
+    def upstream_url(path):
+        """Map a proxy request path back to the upstream URL, or ``None``."""
+        parts = path.split('/', 4)
+        if len(parts) < 4 or parts[1] != 'hls' or parts[2] not in ('http', 'https') or not parts[3]:
+            return None
+        return f"{parts[2]}://{parts[3]}/{parts[4] if len(parts) > 4 else ''}"
+
+    def rewrite_manifest(self, body, url, redirected=False):
+        """Point absolute and root-relative URIs of a manifest at the proxy.
+
+        Relative URIs already resolve through the proxy, unless the upstream
+        redirected and ``url`` is no longer the path the player asked for.
+        """
+        expires_at = time.monotonic() + self.linked_host_ttl
+
+        def rewrite(uri):
+            if redirected or '://' in uri or uri.startswith('/'):
+                absolute = urljoin(url, uri)
+                parts = urlsplit(absolute)
+                self._link((parts.scheme, parts.netloc), expires_at)
+                return self.proxied_url(absolute)
+            return uri
+
+        lines = []
+        for line in body.decode('utf-8', 'replace').splitlines():
+            stripped = line.strip()
+            if stripped.startswith('#'):
+                if 'URI="' in stripped:
+                    line = _URI_ATTRIBUTE_RE.sub(lambda m: f'URI="{rewrite(m.group(1))}"', line)
+            elif stripped:
+                line = rewrite(stripped)
+            lines.append(line)
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _link(self, host, expires_at=None):
+        """Allow ``host`` for another ``linked_host_ttl``, evicting the least recently used beyond the cap."""
+        linked_hosts = self.linked_hosts
+        linked_hosts[host] = time.monotonic() + self.linked_host_ttl if expires_at is None else expires_at
+        linked_hosts.move_to_end(host)
+        if len(linked_hosts) > self.max_linked_hosts:
+            linked_hosts.popitem(last=False)
+
+    def _linked(self, host):
+        expires_at = self.linked_hosts.get(host)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self.linked_hosts[host]
+            return False
+        # Still in use (a long VOD playlist, say): keep it allowed
+        self._link(host)
+        return True
+
+    # Upstream fetching
+
+    def _is_manifest(self, url, content_type=''):
+        """``is_manifest``, also for URLs whose earlier response was a manifest, so both tiers agree."""
+        if is_manifest(url):
+            return True
+        if url in self._manifest_urls:
+            self._manifest_urls.move_to_end(url)
+            return True
+        if 'mpegurl' in content_type.lower():
+            self._manifest_urls[url] = None
+            if len(self._manifest_urls) > self.max_manifest_urls:
+                self._manifest_urls.popitem(last=False)
+            return True
+        return False
+
+    async def fetch(self, url):
+        """Return ``(status, content_type, body)``, sharing one fetch per URL."""
+        if self._is_manifest(url):
+            cached = self.cache.get(url)
+        else:
+            cached = self.segments.get(url)
+            if cached is not None:
+                cached = (200,) + cached
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        future = self._in_flight.get(url)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # The leading request was cancelled (a stopped recording, say),
+            # not this one: fetch again rather than fail with it
+            return await self.fetch(url)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[url] = future
+        try:
+            response = await self._fetch_upstream(url)
+            future.set_result(response)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited failure isn't logged
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[url]
+        return response
+
+    async def _fetch_upstream(self, url):
+        if self._pool is None:
+            self._pool = ConnectionPool(limit_per_host=self.limit_per_host, max_idle_per_host=self.limit_per_host)
+        self.upstream_fetches += 1
+        upstream = await asyncio.wait_for(self._pool.get(url), self.timeout)
+        self.upstream_bytes += len(upstream.body)
+        content_type = upstream.headers.get('content-type', 'application/octet-stream')
+        body = upstream.body
+        if upstream.url != url:
+            parts = urlsplit(upstream.url)
+            self._link((parts.scheme, parts.netloc))
+        manifest = self._is_manifest(url, content_type)
+        if upstream.status == 200 and manifest:
+            if b'#EXTINF' in body:
+                # A media playlist: its live window sets the segment lifetime
+                self.segments.note_manifest(upstream.url, body)
+            body = self.rewrite_manifest(body, upstream.url, upstream.url != url)
+            content_type = 'application/vnd.apple.mpegurl'
+        response = (upstream.status, content_type, body)
+        if upstream.status == 200:
+            if manifest:
+                self.cache.put(url, response, self.manifest_ttl)
+            else:
+                self.segments.put(url, content_type, body)
+                if self.segments.pending() and (self._flush is None or self._flush.done()):
+                    # Spills are written in the background, never ahead of this response
+                    self._flush = asyncio.create_task(self.segments.flush())
+        return response
+
+    # Serving
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                if len(parts) < 3:
+                    break
+                method, target, version = parts[0], parts[1], parts[2]
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if keep_alive:
+                    # Nothing here reads request bodies, but the next request
+                    # starts after this one's: skip small ones, else hang up
+                    length = headers.get('content-length', '0')
+                    if 'transfer-encoding' in headers or not length.isdigit() or int(length) > _MAX_DRAINED_BODY:
+                        keep_alive = False
+                    elif int(length):
+                        await reader.readexactly(int(length))
+                status, content_type, body = await self._respond(method, target)
+                length = body.count if isinstance(body, FileRange) else len(body)
+                self.served_bytes += length
+                head = [
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {length}",
+                    "Access-Control-Allow-Origin: *",
+                    "Access-Control-Allow-Headers: *",
+                    "Cache-Control: " + ("no-cache" if 'mpegurl' in content_type else "max-age=30"),
+                    "Connection: " + ("keep-alive" if keep_alive else "close"),
+                ]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    if isinstance(body, FileRange):
+                        await writer.drain()
+                        await asyncio.get_running_loop().sendfile(writer.transport, body.file, body.offset, body.count)
+                    else:
+                        writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, target):
+        if method == 'OPTIONS':
+            return 204, 'text/plain', b''
+        if method not in ('GET', 'HEAD'):
+            return 405, 'text/plain', b'Method not allowed'
+        self.requests += 1
+        for prefix, handler in self._mounts.items():
+            if target.startswith(prefix):
+                return await handler(method, target)
+        url = self.upstream_url(target)
+        if url is None:
+            return 404, 'text/plain', b'Not found'
+        parts = urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        if host not in self.allowed_hosts() and not self._linked(host):
+            return 403, 'text/plain', b'Upstream host not in the channel catalog'
+        try:
+            status, content_type, body = await self.fetch(url)
+        except asyncio.TimeoutError:
+            return 504, 'text/plain', b'Upstream timed out'
+        except Exception as e:
+            return 502, 'text/plain', str(e).encode('utf-8', 'replace')
+        if status != 200:
+            return status if 400 <= status < 500 else 502, content_type, body
+        return status, content_type, body
+
+    async def serve(self, host=PROXY_HOST, port=PROXY_PORT):
+        server = await asyncio.start_server(self._handle, host, port)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._tasks.extend(asyncio.create_task(background()) for background in self._background)
+        async with server:
+            await server.serve_forever()
+
+    def mount(self, prefix, handler, background=None):
+        """Serve request paths starting with ``prefix`` with ``handler`` instead of proxying them.
+
+        ``handler(method, target)`` is a coroutine function returning
+        ``(status, content_type, body)``, where ``body`` may be a
+        ``FileRange``. ``background``, a coroutine function, runs in the
+        proxy's event loop alongside. Mounting a prefix again is a no-op.
+        """
+        with self._lock:
+            if prefix in self._mounts:
+                return
+            self._mounts = {**self._mounts, prefix: handler}
+            if background is None:
+                return
+            if self._loop is not None:
+                self._tasks.append(asyncio.run_coroutine_threadsafe(background(), self._loop))
+            else:
+                self._background.append(background)
+
+    def start(self, allowed_hosts, host=PROXY_HOST, port=PROXY_PORT):
+        """Run the proxy in a daemon thread once per process.
+
+        ``allowed_hosts`` returns a set of ``(scheme, netloc)`` pairs and is
+        called per request, so catalog reloads take effect immediately.
+        """
+        with self._lock:
+            self.allowed_hosts = allowed_hosts
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=asyncio.run, args=(self.serve(host, port),), name='hls-proxy', daemon=True
+            )
+            self._thread.start()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'upstream_fetches': self.upstream_fetches,
+            'coalesced': self.coalesced,
+            'cache_hits': self.cache_hits,
+            'upstream_bytes': self.upstream_bytes,
+            'served_bytes': self.served_bytes,
+            'linked_hosts': len(self.linked_hosts),
+        }
+
+
+# Process-wide proxy shared by all sessions
+hls_proxy = HLSProxy()
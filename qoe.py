@@ -0,0 +1,227 @@
+"""Playback quality (QoE) telemetry aggregated from the players.
+
+The player component batches events and sends them back with its
+component value; ``main.py`` hands each batch to ``qoe_stats.ingest``.
+Events are plain dicts with a ``type`` and the channel ``name`` and ``url``:
+
+    startup   ms            time from selecting the channel to its first frame
+    stall     ms            one rebuffering episode and its duration
+    level     bitrate, height, initial   a quality level switch
+    error     error, details             a fatal hls.js error
+    autoplay  path          which autoplay retry path got playback going
+
+They are folded into per-channel and per-upstream-host aggregates made of
+fixed-bucket histograms and capped counters, so memory stays bounded no
+matter how long the process runs or what clients send.
+"""
+import csv
+import io
+import json
+import math
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import Histogram
+
+QOE_ENABLED = os.environ.get('AAEC_QOE', '1') != '0'
+
+STARTUP_BOUNDS_MS = (250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 20000)
+STALL_BOUNDS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 30000)
+BITRATE_BOUNDS_KBPS = (300, 600, 1000, 1500, 2500, 4000, 6000, 8000, 12000)
+
+
+def normalize(event):
+    """Return ``(type, value)`` for a player event; raises on malformed ones."""
+    kind = event['type']
+    if kind in ('startup', 'stall'):
+        value = float(event['ms'])
+        if not 0 <= value < 86_400_000:
+            raise ValueError(f"Implausible duration: {value}")
+        return kind, value
+    if kind == 'level':
+        bitrate = None
+        if event.get('bitrate'):
+            bitrate = float(event['bitrate'])
+            if not math.isfinite(bitrate) or bitrate < 0:
+                raise ValueError(f"Implausible bitrate: {bitrate}")
+            bitrate /= 1000
+        return kind, (bitrate, bool(event.get('initial')))
+    if kind == 'error':
+        return kind, f"{event.get('error')}: {event.get('details')}"
+    if kind == 'autoplay':
+        return kind, str(event.get('path'))
+    raise ValueError(f"Unknown event type: {kind!r}")
+
+
+class CappedCounter(dict):
+    """A ``dict`` of counts that folds new keys into ``'other'`` beyond ``limit`` keys."""
+
+    def __init__(self, limit=16):
+        super().__init__()
+        self.limit = limit
+
+    def add(self, key, amount=1):
+        key = str(key)[:64]
+        if key not in self and len(self) >= self.limit:
+            key = 'other'
+        self[key] = self.get(key, 0) + amount
+
+
+class QoEStats:
+    """Aggregates for one channel or one upstream host."""
+
+    __slots__ = ('startup_ms', 'stall_ms', 'bitrate_kbps', 'level_switches', 'errors', 'autoplay', 'last_seen')
+
+    def __init__(self):
+        self.startup_ms = Histogram(STARTUP_BOUNDS_MS)
+        self.stall_ms = Histogram(STALL_BOUNDS_MS)
+        self.bitrate_kbps = Histogram(BITRATE_BOUNDS_KBPS)
+        self.level_switches = 0
+        self.errors = CappedCounter()
+        self.autoplay = CappedCounter()
+        self.last_seen = 0.0
+
+    def add(self, kind, value):
+        """Fold in one event as returned by ``normalize``."""
+        if kind == 'startup':
+            self.startup_ms.observe(value)
+        elif kind == 'stall':
+            self.stall_ms.observe(value)
+        elif kind == 'level':
+            bitrate_kbps, initial = value
+            if bitrate_kbps:
+                self.bitrate_kbps.observe(bitrate_kbps)
+            if not initial:
+                self.level_switches += 1
+        elif kind == 'error':
+            self.errors.add(value)
+        elif kind == 'autoplay':
+            self.autoplay.add(value)
+        self.last_seen = time.time()
+
+    def summary(self):
+        """A flat row for tables and CSV export."""
+        plays = self.startup_ms.count
+        return {
+            'plays': plays,
+            'startup_p50_ms': self.startup_ms.quantile(0.5),
+            'startup_p90_ms': self.startup_ms.quantile(0.9),
+            'stalls': self.stall_ms.count,
+            'stalls_per_play': round(self.stall_ms.count / plays, 2) if plays else None,
+            'stall_seconds': round(self.stall_ms.total / 1000, 1),
+            'level_switches': self.level_switches,
+            'bitrate_p50_kbps': self.bitrate_kbps.quantile(0.5),
+            'fatal_errors': sum(self.errors.values()),
+            'top_autoplay_path': max(self.autoplay, key=self.autoplay.get) if self.autoplay else None,
+        }
+
+    def to_dict(self):
+        return {
+            'startup_ms': self.startup_ms.to_dict(),
+            'stall_ms': self.stall_ms.to_dict(),
+            'bitrate_kbps': self.bitrate_kbps.to_dict(),
+            'level_switches': self.level_switches,
+            'errors': dict(self.errors),
+            'autoplay': dict(self.autoplay),
+            'last_seen': self.last_seen,
+        }
+
+
+class QoEAggregator:
+    """Process-wide QoE aggregates by channel and by upstream host.
+
+    At most ``max_keys`` channels and hosts are tracked each; events for
+    further ones are counted under ``'(other)'``.
+    """
+
+    def __init__(self, max_keys=5000):
+        self.max_keys = max_keys
+        self.by_channel = {}
+        self.by_host = {}
+        self._lock = threading.Lock()
+        self.events = 0
+        self.rejected = 0
+        self.batches = 0
+        self.rejected_batches = 0
+        self.started_at = time.time()
+
+    def _stats(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= self.max_keys:
+                key = '(other)'
+                stats = table.get(key)
+            if stats is None:
+                stats = table[key] = QoEStats()
+        return stats
+
+    def ingest(self, events, resolve_url=None):
+        """Fold a batch of player events in; ``resolve_url`` maps player URLs to upstream ones."""
+        with self._lock:
+            self.batches += 1
+            if not isinstance(events, (list, tuple)):
+                # Not a batch at all: iterating it could raise into the rerun
+                self.rejected_batches += 1
+                return
+            for event in events:
+                try:
+                    kind, value = normalize(event)
+                    url = str(event.get('url') or '')
+                    if resolve_url is not None and url:
+                        url = resolve_url(url)
+                    host_name = urlsplit(url).netloc or '(unknown)'
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    # Malformed client data never breaks a rerun
+                    self.rejected += 1
+                    continue
+                self._stats(self.by_channel, str(event.get('name') or '(unknown)')[:200]).add(kind, value)
+                self._stats(self.by_host, host_name).add(kind, value)
+                self.events += 1
+
+    def rows(self, by='channel'):
+        """Summary rows, most played first, for ``by`` in ``('channel', 'host')``."""
+        table = self.by_channel if by == 'channel' else self.by_host
+        with self._lock:
+            rows = [dict({by: key}, **stats.summary()) for key, stats in table.items()]
+        rows.sort(key=lambda row: (-row['plays'], -row['stalls']))
+        return rows
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'exported_at': time.time(),
+                'events': self.events,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'rejected_batches': self.rejected_batches,
+                'by_channel': {key: stats.to_dict() for key, stats in self.by_channel.items()},
+                'by_host': {key: stats.to_dict() for key, stats in self.by_host.items()},
+            }
+
+    def export_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def export_csv(self, by='channel'):
+        rows = self.rows(by)
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=[by] + list(QoEStats().summary()))
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+
+    def stats(self):
+        return {
+            'events': self.events,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'rejected_batches': self.rejected_batches,
+            'channels': len(self.by_channel),
+            'hosts': len(self.by_host),
+        }
+
+
+# Process-wide aggregates shared by all sessions
+qoe_stats = QoEAggregator()
@@ -0,0 +1,300 @@
+"""Indexed, typo-tolerant channel search.
+
+Names are split into tokens: letter and digit runs, plus the parts of
+camel-case words, so "StarSports1" and "StarSports 1 HD" both index
+``starsports``, ``star``, ``sports`` and ``1``. A query matches a channel
+when every query term matches one of its name tokens (or its category)
+exactly, as a prefix, or within one typo; results are ranked by the best
+kind of match, then by shorter name, then by playlist order:
+
+    index = search_cache.get(catalog)
+    index.search("strasports 1")     # channel IDs, best first
+
+Typos are found with a deletion neighbourhood over the vocabulary (every
+token with one character removed), kept as a sorted array of hashes, so a
+lookup is a few binary searches instead of a scan. A reloaded catalog
+reuses the tokenization of names it has already seen, and the whole typo
+table when the vocabulary didn't change. Run ``python
+search.py PLAYLIST QUERY...`` to try it from the command line.
+"""
+import argparse
+import heapq
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from metrics import metrics
+
+EXACT, PREFIX, FUZZY = 0, 1, 2
+
+# Typo keys pack a 40-bit variant hash and a 24-bit token number
+_NUMBER_BITS = 24
+_NUMBER_MASK = (1 << _NUMBER_BITS) - 1
+_HASH_MASK = (1 << (64 - _NUMBER_BITS)) - 1
+
+# Letter runs and digit runs; camel-case parts of letter runs
+_RUN_RE = re.compile(r'[^\W\d_]+|\d+')
+_CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+')
+
+
+def name_tokens(name):
+    """Distinct search tokens of a channel name or category, in order."""
+    tokens = []
+    for run in _RUN_RE.findall(name):
+        tokens.append(run.casefold())
+        parts = _CAMEL_RE.findall(run)
+        if len(parts) > 1:
+            tokens.extend(part.casefold() for part in parts)
+    return tuple(dict.fromkeys(tokens))
+
+
+def query_terms(query):
+    """Distinct terms of a search query, in order."""
+    return list(dict.fromkeys(run.casefold() for run in _RUN_RE.findall(query)))
+
+
+def _deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class SearchIndex:
+    """Token index over the names and categories of one ``ChannelIndex``.
+
+    Channels are numbered by rank (shorter names first, then playlist
+    order) and each token's posting list holds the ranks of its channels in
+    ascending order, so the best hits of a token come first. Only tokens of
+    at least ``min_fuzzy_length`` letters are matched with typos.
+    """
+
+    def __init__(self, channel_index, previous=None, max_prefix_tokens=64, min_fuzzy_length=4):
+        self.channel_index = channel_index
+        self.max_prefix_tokens = max_prefix_tokens
+        self.min_fuzzy_length = min_fuzzy_length
+        names = list(channel_index.original_names)
+        known_tokens = previous.tokens_by_name if previous is not None else {}
+
+        order = sorted(range(len(names)), key=lambda channel_id: len(names[channel_id]))
+        self.by_rank = array('I', order)
+        self.rank_of = array('I', bytes(4 * len(order)))
+        self.tokens_by_name = {}
+        rank_tokens = []
+        for rank, channel_id in enumerate(order):
+            self.rank_of[channel_id] = rank
+            name = names[channel_id]
+            tokens = self.tokens_by_name.get(name)
+            if tokens is None:
+                tokens = known_tokens.get(name)
+                if tokens is None:
+                    tokens = name_tokens(name)
+                self.tokens_by_name[name] = tokens
+            rank_tokens.append(tokens)
+
+        # Token numbers are positions in the sorted vocabulary, so prefixes
+        # are contiguous and an unchanged vocabulary keeps its numbers
+        self.vocabulary = sorted({token for tokens in self.tokens_by_name.values() for token in tokens})
+        numbers = {token: number for number, token in enumerate(self.vocabulary)}
+        postings = [[] for _ in self.vocabulary]
+        # Each rank's token numbers and each token's ranks, in compressed sparse rows
+        self.rank_token_starts = array('I', [0])
+        self.rank_tokens = array('I')
+        for rank, tokens in enumerate(rank_tokens):
+            for token in tokens:
+                number = numbers[token]
+                postings[number].append(rank)
+                self.rank_tokens.append(number)
+            self.rank_token_starts.append(len(self.rank_tokens))
+        self.posting_starts = array('I', [0])
+        self.posting_ranks = array('I')
+        for ranks in postings:
+            self.posting_ranks.extend(ranks)
+            self.posting_starts.append(len(self.posting_ranks))
+
+        if previous is not None and previous.vocabulary == self.vocabulary:
+            self.typo_keys = previous.typo_keys
+        else:
+            self.typo_keys = self._typo_keys()
+
+        self.category_tokens = [
+            (name_tokens(category), channel_index.category_ranges[category])
+            for category in channel_index.categories
+        ]
+
+    def _typo_keys(self):
+        # Every fuzzy token and its one-deletion variants as sorted
+        # ``hash << 24 | token number`` keys: far smaller than a dict of
+        # variant strings; hash collisions are weeded out at lookup
+        keys = []
+        for number, token in enumerate(self.vocabulary):
+            if len(token) >= self.min_fuzzy_length and not token.isdigit():
+                keys.extend(((hash(variant) & _HASH_MASK) << _NUMBER_BITS) | number
+                            for variant in _deletions(token) | {token})
+        keys.sort()
+        return array('Q', keys)
+
+    def __len__(self):
+        return len(self.by_rank)
+
+    def _postings(self, number):
+        return self.posting_ranks[self.posting_starts[number]:self.posting_starts[number + 1]]
+
+    def _match(self, term):
+        """``({token number: kind of match}, [category ID ranges])`` for one query term."""
+        matches = {}
+        vocabulary = self.vocabulary
+        position = bisect_left(vocabulary, term)
+        exact = position < len(vocabulary) and vocabulary[position] == term
+        end = min(len(vocabulary), position + self.max_prefix_tokens + 1)
+        while position < end and vocabulary[position].startswith(term):
+            matches[position] = EXACT if vocabulary[position] == term else PREFIX
+            position += 1
+
+        if not exact and len(term) >= self.min_fuzzy_length and not term.isdigit():
+            # One typo: a deleted, inserted, replaced or swapped character
+            variants = _deletions(term) | {term}
+            keys = self.typo_keys
+            for variant in variants:
+                key = (hash(variant) & _HASH_MASK) << _NUMBER_BITS
+                position = bisect_left(keys, key)
+                while position < len(keys) and keys[position] >> _NUMBER_BITS == key >> _NUMBER_BITS:
+                    number = keys[position] & _NUMBER_MASK
+                    token = vocabulary[number]
+                    if number not in matches and (token in variants or not variants.isdisjoint(_deletions(token))):
+                        matches[number] = FUZZY
+                    position += 1
+
+        categories = [
+            channel_range for tokens, channel_range in self.category_tokens
+            if any(token.startswith(term) for token in tokens)
+        ]
+        return matches, categories
+
+    def _accepts(self, rank, matches, categories):
+        tokens = self.rank_tokens[self.rank_token_starts[rank]:self.rank_token_starts[rank + 1]]
+        if any(number in matches for number in tokens):
+            return True
+        channel_id = self.by_rank[rank]
+        return any(channel_id in channel_range for channel_range in categories)
+
+    def search(self, query, limit=20):
+        """IDs of up to ``limit`` channels matching every term of ``query``, best first."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        term_matches = [self._match(term) for term in terms]
+        if not all(matches or categories for matches, categories in term_matches):
+            return []
+
+        # The term with the fewest candidates drives; the others filter
+        term_matches.sort(key=lambda term_match: (
+            not term_match[0],
+            sum(self.posting_starts[number + 1] - self.posting_starts[number] for number in term_match[0]),
+        ))
+        (driver, driver_categories), others = term_matches[0], term_matches[1:]
+
+        results = []
+        seen = set()
+        for kind in (EXACT, PREFIX, FUZZY):
+            lists = [self._postings(number) for number, match in driver.items() if match == kind]
+            if not lists:
+                continue
+            for rank in lists[0] if len(lists) == 1 else heapq.merge(*lists):
+                if rank in seen:
+                    continue
+                seen.add(rank)
+                if all(self._accepts(rank, matches, categories) for matches, categories in others):
+                    results.append(self.by_rank[rank])
+                    if len(results) == limit:
+                        return results
+
+        # Channels that only match through their category come last
+        matched = set(results)
+        for channel_range in driver_categories:
+            for channel_id in channel_range:
+                if channel_id in matched:
+                    continue
+                if all(self._accepts(self.rank_of[channel_id], matches, categories) for matches, categories in others):
+                    matched.add(channel_id)
+                    results.append(channel_id)
+                    if len(results) == limit:
+                        return results
+        return results
+
+
+class SearchIndexCache:
+    """The ``SearchIndex`` of the current catalog, rebuilt when it reloads."""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self.builds = 0
+        self.last_build_seconds = 0.0
+
+    def get(self, catalog):
+        index = self._index
+        if index is not None and index.channel_index is catalog.index:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index.channel_index is not catalog.index:
+                started = time.perf_counter()
+                index = self._index = SearchIndex(catalog.index, previous=index)
+                self.last_build_seconds = time.perf_counter() - started
+                metrics.observe('search_index_build', self.last_build_seconds)
+                self.builds += 1
+            return index
+
+    def prepare(self, catalog):
+        """Start building the index of ``catalog`` in the background, so the first search needn't wait."""
+        index = self._index
+        if (index is not None and index.channel_index is catalog.index) or self._pending is catalog.index:
+            return
+        self._pending = catalog.index
+        threading.Thread(target=self.get, args=(catalog,), name='search-index', daemon=True).start()
+
+    def stats(self):
+        index = self._index
+        return {
+            'builds': self.builds,
+            'last_build_ms': round(self.last_build_seconds * 1000, 3),
+            'channels': len(index) if index is not None else 0,
+            'tokens': len(index.vocabulary) if index is not None else 0,
+        }
+
+
+# Process-wide search index shared by all sessions
+search_cache = SearchIndexCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the channels of a playlist.")
+    parser.add_argument('playlist', help="M3U playlist")
+    parser.add_argument('queries', nargs='+', help="search queries")
+    parser.add_argument('--limit', type=int, default=10, help="results per query")
+    args = parser.parse_args(argv)
+
+    from catalog import CatalogCache
+
+    catalog = CatalogCache([args.playlist]).get()
+    if catalog is None:
+        print(f"{args.playlist}: no playlist found")
+        return 1
+    started = time.perf_counter()
+    index = search_cache.get(catalog)
+    print(f"indexed {len(index)} channels, {len(index.vocabulary)} tokens "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    for query in args.queries:
+        started = time.perf_counter()
+        results = index.search(query, args.limit)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(f"{query!r}: {len(results)} results in {elapsed_us:.0f} us")
+        for channel_id in results:
+            print(f"  {catalog.index.full_names[channel_id]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""Two-tier LRU cache for proxied HLS segments.
+
+Popular live channels have the same few ``.ts`` segments requested by every
+viewer within seconds. Segments are kept in a byte-bounded in-memory LRU;
+entries pushed out of memory while still live spill to a byte-bounded disk
+tier and are served from memory-mapped files, so a disk hit costs no read
+copy. Entries expire with the live window of the manifest that listed them
+(target duration x segment count) rather than on a fixed timer; expired
+entries are swept out on insert, before anything live is evicted.
+
+Disk writes happen in a worker thread (``flush``), off the proxy's event
+loop; until its write completes, a spilled segment is still served from
+memory. The write queue's ``spill_bytes`` come out of the memory budget,
+and when the disk falls that far behind, segments pushed out of memory are
+dropped instead of queued.
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import posixpath
+import re
+import tempfile
+import time
+from collections import OrderedDict
+
+SEGMENT_MEMORY_BYTES = int(os.environ.get('AAEC_SEGMENT_CACHE_MB', '128')) << 20
+SEGMENT_DISK_BYTES = int(os.environ.get('AAEC_SEGMENT_DISK_MB', '1024')) << 20
+# Segments waiting for their disk write, at most; part of the memory budget
+SEGMENT_SPILL_BYTES = int(os.environ.get('AAEC_SEGMENT_SPILL_MB', '16')) << 20
+SEGMENT_CACHE_DIR = os.environ.get('AAEC_SEGMENT_CACHE_DIR')
+
+_TARGET_DURATION_RE = re.compile(rb'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+
+
+def live_window(manifest_body, default=30.0):
+    """Return how long, in seconds, segments of a media playlist stay listed.
+
+    Live playlists slide by one target duration per segment, so a segment is
+    requested for at most ``target duration x segment count``. VOD playlists
+    (``#EXT-X-ENDLIST``) don't slide; they get ten times the default.
+    """
+    if b'#EXT-X-ENDLIST' in manifest_body:
+        return default * 10
+    match = _TARGET_DURATION_RE.search(manifest_body)
+    if match is None:
+        return default
+    return float(match.group(1)) * max(manifest_body.count(b'#EXTINF'), 3)
+
+
+class SegmentCache:
+    """URL-keyed segment cache with a memory tier and an mmap'd disk tier.
+
+    ``get`` returns ``(content_type, body)`` where ``body`` is ``bytes`` for a
+    memory hit and a ``memoryview`` over the mapped file for a disk hit.
+    """
+
+    def __init__(self, memory_bytes=SEGMENT_MEMORY_BYTES, disk_bytes=SEGMENT_DISK_BYTES,
+                 directory=SEGMENT_CACHE_DIR, default_ttl=30.0, sweep_interval=5.0, max_windows=4096,
+                 spill_bytes=SEGMENT_SPILL_BYTES):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # Reserved out of memory_bytes for segments waiting to be written
+        self.spill_bytes = min(spill_bytes, memory_bytes // 2) if disk_bytes > 0 else 0
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self.max_windows = max_windows
+        self.directory = directory
+        self.memory_size = 0
+        self.disk_size = 0
+        self.spilling_size = 0
+        # url -> (expires_at, content_type, body)
+        self._memory = OrderedDict()
+        # url -> (expires_at, content_type, path, size, mapped memoryview or None)
+        self._disk = OrderedDict()
+        # url -> (expires_at, content_type, body) pushed out of memory, awaiting ``flush``
+        self._spilling = OrderedDict()
+        self._flushing = False
+        self._next_sweep = 0.0
+        # manifest directory -> live window seconds, least recently listed first
+        self._windows = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.spills = 0
+        self.spill_drops = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def note_manifest(self, manifest_url, manifest_body):
+        """Remember the live window for segments that live next to ``manifest_url``."""
+        directory = posixpath.dirname(manifest_url)
+        self._windows[directory] = live_window(manifest_body, self.default_ttl)
+        self._windows.move_to_end(directory)
+        if len(self._windows) > self.max_windows:
+            self._windows.popitem(last=False)
+
+    def ttl_for(self, url):
+        return self._windows.get(posixpath.dirname(url), self.default_ttl)
+
+    def get(self, url):
+        now = time.monotonic()
+        entry = self._memory.get(url)
+        if entry is not None:
+            if entry[0] < now:
+                self._drop_memory(url)
+                self.expirations += 1
+            else:
+                self._memory.move_to_end(url)
+                self.memory_hits += 1
+                self.bytes_served += len(entry[2])
+                return entry[1], entry[2]
+
+        entry = self._spilling.get(url)
+        if entry is not None and entry[0] >= now:
+            self.memory_hits += 1
+            self.bytes_served += len(entry[2])
+            return entry[1], entry[2]
+
+        entry = self._disk.get(url)
+        if entry is not None:
+            if entry[0] < now:
+                self._drop_disk(url)
+                self.expirations += 1
+            else:
+                expires_at, content_type, path, size, view = entry
+                if view is None:
+                    view = self._map(path, size)
+                    if view is None:
+                        self._drop_disk(url)
+                        self.misses += 1
+                        return None
+                    self._disk[url] = (expires_at, content_type, path, size, view)
+                self._disk.move_to_end(url)
+                self.disk_hits += 1
+                self.bytes_served += size
+                return content_type, view
+
+        self.misses += 1
+        return None
+
+    def put(self, url, content_type, body, ttl=None):
+        size = len(body)
+        limit = self.memory_bytes - self.spill_bytes
+        if size > limit:
+            return
+        if url in self._memory:
+            self._drop_memory(url)
+        if url in self._disk:
+            self._drop_disk(url)
+        if url in self._spilling:
+            self._drop_spilling(url)
+        now = time.monotonic()
+        expires_at = now + (ttl if ttl is not None else self.ttl_for(url))
+        self._memory[url] = (expires_at, content_type, bytes(body))
+        self.memory_size += size
+
+        if now >= self._next_sweep:
+            self.sweep(now)
+        while self.memory_size > limit:
+            old_url, entry = self._memory.popitem(last=False)
+            old_size = len(entry[2])
+            self.memory_size -= old_size
+            if entry[0] <= now or self.spill_bytes <= 0:
+                self.evictions += 1
+            elif self.spilling_size + old_size > self.spill_bytes:
+                # The disk is behind: queued writes would outgrow their share
+                self.spill_drops += 1
+            else:
+                self._spilling[old_url] = entry
+                self.spilling_size += old_size
+
+    def sweep(self, now=None):
+        """Drop every expired entry of both tiers; ``put`` calls this every ``sweep_interval``."""
+        now = time.monotonic() if now is None else now
+        self._next_sweep = now + self.sweep_interval
+        for url in [url for url, entry in self._memory.items() if entry[0] < now]:
+            self._drop_memory(url)
+            self.expirations += 1
+        for url in [url for url, entry in self._spilling.items() if entry[0] < now]:
+            self._drop_spilling(url)
+            self.expirations += 1
+        for url in [url for url, entry in self._disk.items() if entry[0] < now]:
+            self._drop_disk(url)
+            self.expirations += 1
+
+    def pending(self):
+        """Whether segments pushed out of memory are waiting for ``flush``."""
+        return bool(self._spilling)
+
+    async def flush(self):
+        """Write the segments pushed out of memory to the disk tier in a worker thread.
+
+        Runs as a task on the event loop after ``put`` leaves ``pending``
+        segments; one caller at a time drains the queue.
+        """
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            while self._spilling:
+                url, entry = next(iter(self._spilling.items()))
+                if self.directory is None:
+                    self.directory = tempfile.mkdtemp(prefix='aaec-segments-')
+                path = os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+                try:
+                    await asyncio.to_thread(self._write, path, entry[2])
+                except OSError:
+                    if self._spilling.get(url) is entry:
+                        self._drop_spilling(url)
+                    self.evictions += 1
+                    continue
+                if self._spilling.get(url) is not entry:
+                    # Expired or stored again while it was being written
+                    self._remove(path)
+                    continue
+                self._drop_spilling(url)
+                self._disk[url] = (entry[0], entry[1], path, len(entry[2]), None)
+                self.disk_size += len(entry[2])
+                self.spills += 1
+                while self.disk_size > self.disk_bytes:
+                    self._drop_disk(next(iter(self._disk)))
+                    self.evictions += 1
+        finally:
+            self._flushing = False
+
+    @staticmethod
+    def _write(path, body):
+        with open(path, 'wb') as file:
+            file.write(body)
+
+    @staticmethod
+    def _map(path, size):
+        if size == 0:
+            return memoryview(b'')
+        try:
+            with open(path, 'rb') as file:
+                return memoryview(mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+
+    def _drop_memory(self, url):
+        _, _, body = self._memory.pop(url)
+        self.memory_size -= len(body)
+
+    def _drop_spilling(self, url):
+        _, _, body = self._spilling.pop(url)
+        self.spilling_size -= len(body)
+
+    def _drop_disk(self, url):
+        _, _, path, size, _ = self._disk.pop(url)
+        self.disk_size -= size
+        # Unlinking is safe while a response still holds the mapping; the
+        # pages are released when the last memoryview goes away.
+        self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'memory_bytes': self.memory_size,
+            'spilling_entries': len(self._spilling),
+            'spilling_bytes': self.spilling_size,
+            'disk_entries': len(self._disk),
+            'disk_bytes': self.disk_size,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            'bytes_served': self.bytes_served,
+            'spills': self.spills,
+            'spill_drops': self.spill_drops,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
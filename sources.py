@@ -0,0 +1,310 @@
+"""Multi-source playlist ingestion with conditional background refreshes.
+
+Set ``AAEC_PLAYLIST_SOURCES`` to a comma-separated list of local paths and
+``http(s)://`` playlist URLs to build the catalog from several providers
+instead of a single local ``list.m3u``:
+
+    AAEC_PLAYLIST_SOURCES=list.m3u,https://provider.example/tv.m3u
+
+A daemon thread re-checks every source each ``AAEC_PLAYLIST_REFRESH``
+seconds; until a first catalog has loaded, it retries sooner, backing off
+from one second up to that interval. HTTP sources are fetched with ``If-None-Match`` and
+``If-Modified-Since``, so an unchanged source costs one 304; local files are
+only re-read when their ``stat`` changes. Sources are merged in order and
+channels deduplicated by URL (the first source wins); a channel listed by
+several providers under the same name and category becomes one channel
+with mirror URLs. The new catalog is built off the request path and
+published with a single reference swap, so a rerun never waits on a refresh
+and never sees a half-built catalog.
+
+Run ``python sources.py SOURCE... --rounds 2`` to fetch and merge from the
+command line, e.g. against a local HTTP stand-in.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+
+from catalog import Catalog, build_channel_dicts, file_digest, iter_m3u_entries, iter_m3u_file
+from httppool import ConnectionPool, HTTPError
+from metrics import metrics
+
+PLAYLIST_SOURCES = [
+    location.strip() for location in os.environ.get('AAEC_PLAYLIST_SOURCES', '').split(',') if location.strip()
+]
+PLAYLIST_REFRESH_SECONDS = float(os.environ.get('AAEC_PLAYLIST_REFRESH', '300'))
+
+
+class PlaylistSource:
+    """One configured playlist location and what was last fetched from it.
+
+    ``entries`` holds the parsed items of the last good fetch; a failed
+    refresh keeps them, so one provider going down doesn't empty the catalog.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.is_remote = '://' in location
+        self.entries = None
+        self.digest = None
+        self.size = 0
+        self.etag = None
+        self.last_modified = None
+        self.stat_key = None
+        self.checked_at = None
+        self.error = None
+        self.fetches = 0
+        self.not_modified = 0
+
+    async def refresh(self, pool, timeout):
+        """Re-check the source; return ``True`` when its entries changed."""
+        try:
+            if self.is_remote:
+                changed = await self._refresh_remote(pool, timeout)
+            else:
+                changed = self._refresh_local()
+        except asyncio.TimeoutError:
+            self.error = "Timed out"
+            return False
+        except Exception as e:
+            self.error = str(e) or e.__class__.__name__
+            return False
+        self.error = None
+        self.checked_at = time.time()
+        return changed
+
+    async def _refresh_remote(self, pool, timeout):
+        headers = {}
+        if self.entries is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+        response = await asyncio.wait_for(pool.get(self.location, headers, max_body=64 << 20), timeout)
+        self.fetches += 1
+        if response.status == 304 and self.entries is not None:
+            self.not_modified += 1
+            return False
+        if response.status != 200:
+            raise HTTPError(f"HTTP {response.status}")
+        self.etag = response.headers.get('etag')
+        self.last_modified = response.headers.get('last-modified')
+
+        # Servers without validators resend the same body; don't rebuild for it
+        digest = hashlib.sha1(response.body).hexdigest()
+        if digest == self.digest:
+            return False
+        text = response.body.decode('utf-8', 'replace')
+        self.entries = list(iter_m3u_entries(io.StringIO(text)))
+        self.digest = digest
+        self.size = len(response.body)
+        return True
+
+    def _refresh_local(self):
+        st_result = os.stat(self.location)
+        stat_key = (st_result.st_mtime_ns, st_result.st_size)
+        if stat_key == self.stat_key and self.entries is not None:
+            self.not_modified += 1
+            return False
+        self.fetches += 1
+        self.stat_key = stat_key
+        digest = file_digest(self.location)
+        if digest == self.digest:
+            return False
+        self.entries = list(iter_m3u_entries(iter_m3u_file(self.location)))
+        self.digest = digest
+        self.size = st_result.st_size
+        return True
+
+
+class SourceCatalog:
+    """Merged catalog of several playlist sources, refreshed in the background.
+
+    Offers the same ``get``/``current``/``warnings``/``stats`` surface as
+    ``CatalogCache``, so the app uses whichever one is configured.
+    """
+
+    def __init__(self, locations, interval=PLAYLIST_REFRESH_SECONDS, timeout=15.0, limit_per_host=4,
+                 retry_seconds=1.0):
+        self.sources = [PlaylistSource(location) for location in locations]
+        self.interval = interval
+        self.retry_seconds = retry_seconds
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self._catalog = None
+        self._loaded_once = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.refreshes = 0
+        self.duplicates = 0
+        self.last_rebuild_seconds = 0.0
+        # Per-source errors from the most recent refresh, shown by the UI
+        self.warnings = []
+
+    def get(self):
+        """Return the current merged ``Catalog``, or ``None`` if nothing loaded yet.
+
+        Only the very first call loads synchronously; after that the
+        background thread keeps the catalog fresh and this never blocks.
+        """
+        catalog = self._catalog
+        if catalog is not None:
+            self.hits += 1
+        else:
+            with self._lock:
+                if not self._loaded_once:
+                    self._loaded_once = True
+                    self.refresh_now()
+            catalog = self._catalog
+            self.misses += 1
+        self.start()
+        return catalog
+
+    def current(self):
+        """Return the last published ``Catalog`` without checking the sources."""
+        return self._catalog
+
+    async def refresh(self, pool):
+        """Re-check every source concurrently and publish a new catalog if any changed."""
+        changed = await asyncio.gather(*(source.refresh(pool, self.timeout) for source in self.sources))
+        self.refreshes += 1
+        self.warnings = [
+            f"Error reading {source.location}: {source.error}" for source in self.sources if source.error
+        ]
+        if any(changed):
+            self._rebuild()
+        return self._catalog
+
+    def refresh_now(self):
+        """Blocking one-off refresh on a private loop and pool."""
+
+        async def refresh_once():
+            pool = ConnectionPool(limit_per_host=self.limit_per_host)
+            try:
+                return await self.refresh(pool)
+            finally:
+                pool.close()
+
+        return asyncio.run(refresh_once())
+
+    def _merge(self, entry_lists):
+        # Category names pass through so empty categories are still known
+        seen = set()
+        for entries in entry_lists:
+            for entry in entries:
+                if isinstance(entry, str):
+                    yield entry
+                elif entry.url in seen:
+                    self.duplicates += 1
+                else:
+                    seen.add(entry.url)
+                    yield entry
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        loaded = [source for source in self.sources if source.entries is not None]
+        if not loaded:
+            return
+        self.duplicates = 0
+        mirrors = {}
+        channel_sources, channel_categories, clean_channels = build_channel_dicts(
+            self._merge(source.entries for source in loaded), mirrors
+        )
+        digest = hashlib.sha1(''.join(source.digest for source in loaded).encode('ascii')).hexdigest()
+        catalog = Catalog.from_dicts(', '.join(source.location for source in loaded), time.time_ns(),
+                                     sum(source.size for source in loaded), digest,
+                                     channel_sources, channel_categories, clean_channels, mirrors)
+        # A single reference swap: readers see the old catalog or the new one
+        self._catalog = catalog
+        self.rebuilds += 1
+        self.last_rebuild_seconds = time.perf_counter() - started
+        metrics.observe('catalog_rebuild', self.last_rebuild_seconds)
+        metrics.inc('catalog_reloads')
+
+    def _delay(self, attempt):
+        """Seconds before the next round: the interval once a catalog loaded, else a doubling retry delay."""
+        if self._catalog is not None:
+            return self.interval
+        return min(self.retry_seconds * 2 ** min(attempt, 16), self.interval)
+
+    async def _run(self):
+        pool = ConnectionPool(limit_per_host=self.limit_per_host)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+            try:
+                await self.refresh(pool)
+            except Exception:
+                # A bad round must not kill the thread; the old catalog stays
+                pass
+
+    def start(self):
+        """Start the background refresher once per process; later calls are no-ops."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=asyncio.run, args=(self._run(),), name='playlist-refresh', daemon=True
+            )
+            self._thread.start()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'refreshes': self.refreshes,
+            'duplicates': self.duplicates,
+            'fetches': sum(source.fetches for source in self.sources),
+            'not_modified': sum(source.not_modified for source in self.sources),
+            'last_rebuild_ms': round(self.last_rebuild_seconds * 1000, 3),
+            'path': self._catalog.path if self._catalog else None,
+        }
+
+
+# Process-wide merged catalog shared by all sessions (used when sources are configured)
+source_catalog = SourceCatalog(PLAYLIST_SOURCES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch, merge and dedupe playlist sources.")
+    parser.add_argument('sources', nargs='+', help="playlist files and/or http(s) URLs")
+    parser.add_argument('--rounds', type=int, default=1, help="refresh rounds to run (later ones are conditional)")
+    parser.add_argument('--interval', type=float, default=0.0, help="seconds between rounds")
+    args = parser.parse_args(argv)
+
+    merged = SourceCatalog(args.sources)
+
+    async def run():
+        pool = ConnectionPool(limit_per_host=merged.limit_per_host)
+        try:
+            for round_number in range(args.rounds):
+                if round_number:
+                    await asyncio.sleep(args.interval)
+                started = time.perf_counter()
+                catalog = await merged.refresh(pool)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                print(f"round {round_number + 1}: {elapsed_ms:.1f} ms, "
+                      f"{len(catalog.index) if catalog else 0} channels, "
+                      f"{merged.duplicates} duplicates dropped, {merged.rebuilds} rebuilds")
+        finally:
+            pool.close()
+
+    asyncio.run(run())
+    for source in merged.sources:
+        channels = sum(1 for entry in source.entries or () if not isinstance(entry, str))
+        print(f"  {source.location}: {channels} channels, {source.fetches} fetches, "
+              f"{source.not_modified} not modified" + (f"  ({source.error})" if source.error else ''))
+    return 0 if merged.current() is not None and not merged.warnings else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandIn:
+    """A local HTTP server answering from ``routes``: path -> ``(status, headers, body)``.
+
+    A route may also be a callable taking the request headers and returning
+    that tuple. Every request is kept in ``requests`` as ``(method, path, headers)``.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def respond(self, send_body):
+                stand_in.requests.append((self.command, self.path, dict(self.headers)))
+                route = stand_in.routes.get(self.path)
+                if route is None:
+                    route = (404, {}, b'not found')
+                elif callable(route):
+                    route = route(self.headers)
+                status, headers, body = route
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.netloc = f'127.0.0.1:{self.server.server_address[1]}'
+        self.url = f'http://{self.netloc}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    """Factory for ``StandIn`` servers, shut down after the test."""
+    servers = []
+
+    def start():
+        servers.append(StandIn())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,34 @@
+import urllib.request
+
+import assets as assets_module
+from assets import ASSET_FILES, HLS_JS_CDN, PlayerAssets
+
+
+def test_hls_js_falls_back_to_the_pinned_cdn_until_vendored(tmp_path, monkeypatch):
+    (tmp_path / 'iframe_player.js').write_text('start();')
+    monkeypatch.setattr(assets_module, 'HLS_JS_INTEGRITY', 'sha384-pinned')
+    assets = PlayerAssets(str(tmp_path), retry_seconds=0.0)
+    assert assets.url('hls.js') == HLS_JS_CDN
+    assert assets.integrity('hls.js') == 'sha384-pinned'
+
+    # Picked up without a restart once vendored
+    (tmp_path / ASSET_FILES['hls.js']).write_text('window.Hls = function () {};')
+    assert assets.url('hls.js').startswith('/component/assets.player_assets/hls-')
+    assert assets.integrity('hls.js') == ''
+
+
+def test_server_serves_hashed_names_as_immutable(tmp_path):
+    (tmp_path / ASSET_FILES['hls.js']).write_text('window.Hls = function () {};')
+    (tmp_path / 'iframe_player.js').write_text('start();')
+    assets = PlayerAssets(str(tmp_path), public_url='http://127.0.0.1:0')
+    assets.start_server(port=0, host='127.0.0.1')
+    try:
+        assets.public_url = f'http://127.0.0.1:{assets._server.server_address[1]}'
+        url = assets.url('hls.js')
+        assert url.endswith(f".{assets.digest(ASSET_FILES['hls.js'])}.js")
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.read() == b'window.Hls = function () {};'
+            assert 'immutable' in response.headers['Cache-Control']
+    finally:
+        assets._server.shutdown()
+        assets._server.server_close()
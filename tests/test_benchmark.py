@@ -0,0 +1,18 @@
+import json
+
+import benchmark
+from assets import player_assets
+
+
+def test_benchmark_runs_end_to_end_without_vendored_assets(tmp_path, monkeypatch):
+    # A fresh clone has no vendored hls.js
+    monkeypatch.setattr(player_assets, 'directory', str(tmp_path))
+    monkeypatch.setattr(player_assets, '_digests', {})
+    monkeypatch.setattr(player_assets, '_missing', {})
+    (tmp_path / 'iframe_player.js').write_text('start();')
+    output = tmp_path / 'bench.json'
+
+    assert benchmark.main(['--sizes', '100', '--repeat', '1', '--no-memory', '--output', str(output)]) in (0, None)
+
+    results = json.loads(output.read_text())
+    assert 'player_html' in json.dumps(results)
@@ -0,0 +1,129 @@
+from catalog import (ChannelIndex, build_channel_dicts, iter_m3u_entries, normalize_entries, parse_m3u_content,
+                     rewrite_playlist)
+
+IRREGULAR = '''#EXTM3U
+#EXTINF:-1 tvg-name=Bar group-title='News',Bar
+http://cdn.test/bar.m3u8
+#EXTINF:,Baz, the show
+HTTPS://cdn.test/baz.m3u8
+#EXTINF:-1,Radio
+rtmp://cdn.test/live
+#EXTINF:garbage
+http://cdn.test/lost.m3u8
+'''
+
+
+def test_irregular_extinf_lines_are_parsed_leniently():
+    report = {}
+    entries = [item for item in iter_m3u_entries(IRREGULAR.splitlines(), report) if not isinstance(item, str)]
+    assert [(entry.name, entry.category) for entry in entries] == [('Bar', 'News'), ('Baz, the show', 'General')]
+    assert entries[0].attributes == {'tvg-name': 'Bar', 'group-title': 'News'}
+    assert report == {'rejected_lines': 1, 'unsupported_urls': 1}
+
+
+PLAYLIST = '''#EXTM3U
+#========Sports==========
+#EXTINF:-1 tvg-id="ss1" tvg-logo="http://logo.test/ss1.png",StarSports 1 HD
+http://a.test/ss1.m3u8
+#EXTINF:-1 group-title="Movies",Cinema
+http://a.test/cinema.m3u8
+#EXTGRP:Kids
+#EXTINF:-1,Cartoons
+http://a.test/cartoons.m3u8
+#EXTINF:-1,StarSports 1 HD
+http://b.test/ss1.m3u8
+#========Empty==========
+'''
+
+
+def test_entries_carry_attributes_and_categories():
+    items = list(iter_m3u_entries(PLAYLIST.splitlines()))
+    assert [item for item in items if isinstance(item, str)] == ['Sports', 'Empty']
+    entries = [item for item in items if not isinstance(item, str)]
+    assert [(entry.name, entry.category) for entry in entries] == [
+        ('StarSports 1 HD', 'Sports'), ('Cinema', 'Movies'), ('Cartoons', 'Kids'), ('StarSports 1 HD', 'Sports'),
+    ]
+    assert entries[0].tvg_id == 'ss1'
+    assert entries[0].tvg_logo == 'http://logo.test/ss1.png'
+    assert entries[2].attributes == {}
+
+
+def test_mirrors_fold_repeated_channels():
+    mirrors = {}
+    channels, categories, clean_channels = parse_m3u_content(PLAYLIST, mirrors)
+    assert categories['Sports'] == ['[Sports] 01. StarSports 1 HD']
+    assert categories['Empty'] == []
+    assert mirrors == {'[Sports] 01. StarSports 1 HD': ['http://a.test/ss1.m3u8', 'http://b.test/ss1.m3u8']}
+    assert clean_channels['03. Cartoons'].url == 'http://a.test/cartoons.m3u8'
+
+    # Without a mirrors dict every entry is its own channel
+    channels, categories, _ = build_channel_dicts(iter_m3u_entries(PLAYLIST.splitlines()))
+    assert len(channels) == 4
+    assert categories['Sports'][-1] == '[Sports] 04. StarSports 1 HD'
+
+
+def test_channel_index_views_and_defaults():
+    mirrors = {}
+    index = ChannelIndex.from_dicts(*parse_m3u_content(PLAYLIST, mirrors), mirrors,
+                                    quick_access_channels=['Cinema', 'StarSports 1 HD', 'Missing'])
+    assert len(index) == 3
+    assert index.view() == range(3)
+    assert index.view('Sports') == range(0, 1)
+    assert index.view('Movies') == range(1, 2)
+    assert index.view('Empty') == range(3, 3)
+    assert index.display_names[2] == '03. Cartoons'
+    assert index.full_names[1] == '[Movies] 02. Cinema'
+
+    # The default channel wherever it is listed, else the first of the view
+    assert index.default_id() == 0
+    assert index.default_id('Sports') == 0
+    assert index.default_id('Kids') == 2
+    assert index.quick_access_ids == [0, 1]
+
+    assert index.urls_for(0) == ('http://a.test/ss1.m3u8', 'http://b.test/ss1.m3u8')
+    assert index.urls_for(1) == ('http://a.test/cinema.m3u8',)
+    assert index.stream_urls[:2] == ['http://a.test/ss1.m3u8', 'http://b.test/ss1.m3u8']
+    assert index.upstream_hosts == {('http', 'a.test'), ('http', 'b.test')}
+
+
+MESSY = '''#EXTM3U
+#========Sports ==========
+#EXTINF:-1 group-title="sports",  Colors   HD
+http://a.test/colors.m3u8
+#EXTINF:-1,Colors
+http://a.test/colors.m3u8
+#EXTINF:-1,Broken
+http:///nohost
+'''
+
+
+def test_normalize_entries_counts_what_it_cleans():
+    report = {}
+    items = list(normalize_entries(iter_m3u_entries(MESSY.splitlines()), report=report))
+    entries = [item for item in items if not isinstance(item, str)]
+    assert [(entry.name, entry.category) for entry in entries] == [('Colors HD', 'Sports'), ('Broken', 'Sports')]
+    assert entries[0].attribute_text == ' group-title="Sports"'
+    assert report == {'channels': 2, 'duplicates': 1, 'renamed': 1, 'recategorized': 1, 'invalid_urls': 1}
+
+    report = {}
+    list(normalize_entries(iter_m3u_entries(MESSY.splitlines()), dedupe=False, normalize=False, report=report))
+    assert report['channels'] == 3
+    assert report['duplicates'] == report['recategorized'] == 0
+
+
+def test_rewrite_playlist_writes_the_cleaned_playlist(tmp_path):
+    path = tmp_path / 'list.m3u'
+    path.write_text(MESSY)
+    report = rewrite_playlist(str(path))
+    assert (report['untrimmed'], report['duplicates'], report['output']) == (1, 1, None)
+    assert path.read_text() == MESSY
+
+    report = rewrite_playlist(str(path), str(path))
+    assert report['output'] == str(path)
+    assert path.read_text() == (
+        '#EXTM3U\n'
+        '\n#========Sports==========\n'
+        '#EXTINF:-1 group-title="Sports",Colors HD\nhttp://a.test/colors.m3u8\n'
+        '#EXTINF:-1,Broken\nhttp:///nohost\n'
+    )
+    assert rewrite_playlist(str(path))['untrimmed'] == 0
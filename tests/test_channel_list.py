@@ -0,0 +1,48 @@
+import channel_list
+from channel_list import ChannelListState, window_start
+
+
+def test_window_start_keeps_the_row_a_third_down_and_in_bounds():
+    assert window_start(0, 1000, page=60) == 0
+    assert window_start(10, 1000, page=60) == 0
+    assert window_start(500, 1000, page=60) == 480
+    assert window_start(999, 1000, page=60) == 940
+    assert window_start(5, 20, page=60) == 0
+
+
+def test_state_follows_selection_and_scrolled_windows(monkeypatch):
+    rendered = []
+    monkeypatch.setattr(channel_list, 'channel_list',
+                        lambda rows, offset, total, *args, **kwargs: rendered.append((rows, offset, total)))
+    session_state = {'channel': 500}
+    state = ChannelListState(session_state, 'list', 'channel', page=60)
+    channels = range(1000)
+
+    state.render(channels, str, view='All')
+    rows, offset, total = rendered[-1]
+    assert (offset, total, len(rows)) == (480, 1000, 60)
+    assert rows[20] == [500, '500', '']
+
+    # Scrolling away keeps the viewer's window on the next rerun
+    session_state['list'] = {'event': 'window', 'start': 100, 'seq': 1}
+    state.on_event()
+    state.render(channels, str, view='All')
+    assert rendered[-1][1] == 100
+
+    # Clicking a row selects it without moving the window
+    session_state['list'] = {'event': 'select', 'id': 120, 'seq': 2}
+    state.on_event()
+    assert session_state['channel'] == 120
+    state.render(channels, str, view='All')
+    assert rendered[-1][1] == 100
+
+    # A selection made elsewhere outside the window scrolls to it
+    session_state['channel'] = 900
+    state.render(channels, str, view='All')
+    assert rendered[-1][1] == 880
+
+    # So does a new view
+    session_state['channel'] = 5
+    state.render(range(50), str, view='Sports')
+    rows, offset, total = rendered[-1]
+    assert (offset, total, len(rows)) == (0, 50, 50)
@@ -0,0 +1,67 @@
+import pytest
+
+from catalog import CatalogCache, file_digest, parse_m3u_content
+from channel_table import SNAPSHOT_SUFFIX, ChannelTable
+from channel_table import main as compile_snapshot
+
+PLAYLIST = '''#EXTM3U
+#========Sports==========
+#EXTINF:-1 tvg-id="ss1",StarSports 1 HD
+http://a.test/ss1.m3u8
+#EXTINF:-1,Ten 1
+http://a.test/ten1.m3u8
+#EXTINF:-1,StarSports 1 HD
+http://b.test/ss1.m3u8
+#========News==========
+#EXTINF:-1,Ten 1
+http://a.test/news.m3u8
+'''
+
+
+def build(source_digest=None):
+    mirrors = {}
+    return ChannelTable.from_dicts(*parse_m3u_content(PLAYLIST, mirrors), mirrors, source_digest)
+
+
+def test_table_round_trips_through_bytes():
+    table = build('0' * 40)
+    loaded = ChannelTable.from_buffer(table.to_bytes())
+    assert loaded.categories == ('Sports', 'News')
+    assert list(loaded.category_range(1)) == [2]
+    assert [loaded.names[row] for row in range(len(loaded))] == ['StarSports 1 HD', 'Ten 1', 'Ten 1']
+    assert [loaded.full_names[row] for row in range(len(loaded))] == [
+        '[Sports] 01. StarSports 1 HD', '[Sports] 02. Ten 1', '[News] 03. Ten 1',
+    ]
+    assert loaded.find('Ten 1') == [1, 2]
+    assert loaded.find('Ten') == []
+    assert loaded.mirrors_of(0) == ('http://a.test/ss1.m3u8', 'http://b.test/ss1.m3u8')
+    assert loaded.mirrors_of(1) is None
+    assert loaded.tvg_id(0) == 'ss1'
+    assert loaded.tvg_id(1) is None
+    assert loaded.distinct_urls() == table.distinct_urls()
+    assert loaded.source_digest == '0' * 40
+
+
+def test_snapshot_is_mapped_until_the_playlist_changes(tmp_path):
+    playlist = tmp_path / 'list.m3u'
+    playlist.write_text(PLAYLIST)
+    assert compile_snapshot([str(playlist)]) == 0
+    snapshot = str(playlist) + SNAPSHOT_SUFFIX
+
+    table = ChannelTable.load(snapshot, file_digest(str(playlist)))
+    assert table.buffer is not None
+    assert len(table) == 3
+
+    cache = CatalogCache([str(playlist)], shared_dir=None, use_snapshots=True)
+    assert len(cache.get().index) == 3
+    assert cache.stats()['snapshot_loads'] == 1
+    assert cache.stats()['mapped']
+
+    # Edited content: the snapshot is stale and the playlist is parsed instead
+    playlist.write_text(PLAYLIST.replace('Ten 1', 'Ten 2'))
+    with pytest.raises(ValueError):
+        ChannelTable.load(snapshot, file_digest(str(playlist)))
+    assert compile_snapshot([str(playlist), '--check']) == 1
+    cache = CatalogCache([str(playlist)], shared_dir=None, use_snapshots=True)
+    assert cache.get().index.original_names[1] == 'Ten 2'
+    assert cache.stats()['snapshot_loads'] == 0
@@ -0,0 +1,30 @@
+from epg import EPGStore
+
+FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<tv>
+  <channel id="{channel}"><display-name>{channel}</display-name></channel>
+  <programme channel="{channel}" start="20240101100000 +0000" stop="20240101110000 +0000"><title>Morning</title></programme>
+  <programme channel="{channel}" start="20240101110000 +0000" stop="20240101120000 +0000"><title>Noon</title></programme>
+</tv>
+'''
+TEN_THIRTY = 1704105000  # 2024-01-01 10:30 UTC
+
+
+def test_failing_feed_keeps_its_last_good_programmes(tmp_path):
+    news, sport = tmp_path / 'news.xml', tmp_path / 'sport.xml'
+    news.write_text(FEED.format(channel='News'))
+    sport.write_text(FEED.format(channel='Sport'))
+    store = EPGStore([str(news), str(sport)], window_hours=6, cache_dir=str(tmp_path))
+    assert len(store.refresh_now(TEN_THIRTY)) == 4
+
+    sport.write_text('<tv><programme')
+    guide = store.refresh_now(TEN_THIRTY + 60)
+    assert len(store.warnings) == 1
+    current, upcoming = guide.now_next(guide.slot_for('Sport', 'Sport'), TEN_THIRTY + 60)
+    assert (current.title, upcoming.title) == ('Morning', 'Noon')
+
+    # The window moves on past the old programmes of the failing feed
+    guide = store.refresh_now(TEN_THIRTY + 3600)
+    assert len(guide) == 2
+    current, upcoming = guide.now_next(guide.slot_for('Sport', 'Sport'), TEN_THIRTY + 3600)
+    assert (current.title, upcoming) == ('Noon', None)
@@ -0,0 +1,61 @@
+import asyncio
+
+from catalog import ChannelIndex, parse_m3u_content
+from health import HealthChecker
+
+PLAYLIST = {'Content-Type': 'application/vnd.apple.mpegurl'}
+
+
+def test_probes_ask_for_the_playlist_only(stand_in):
+    upstream = stand_in()
+    upstream.routes['/live.m3u8'] = (200, PLAYLIST, b'#EXTM3U\n#EXT-X-TARGETDURATION:6\n')
+    upstream.routes['/movie.mp4'] = (200, {'Content-Type': 'video/mp4'}, b'\0' * (2 << 20))
+    upstream.routes['/gone.m3u8'] = (404, {}, b'')
+    checker = HealthChecker(probe_bytes=64 << 10)
+    fed = []
+    checker.listeners.append(lambda url, final_url, body: fed.append(url))
+
+    results = checker.check_now([f'{upstream.url}{path}' for path in ('/live.m3u8', '/movie.mp4', '/gone.m3u8')])
+
+    assert [result.up for result in results.values()] == [True, False, False]
+    assert results[f'{upstream.url}/gone.m3u8'].error == 'HTTP 404'
+    assert fed == [f'{upstream.url}/live.m3u8']
+    assert all(headers.get('Range') == 'bytes=0-65535' for _, _, headers in upstream.requests)
+
+
+def test_failed_rounds_are_counted():
+    checker = HealthChecker(interval=0.01)
+
+    def urls():
+        raise LookupError('catalog vanished')
+
+    async def run_briefly():
+        task = asyncio.create_task(checker._run(urls))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run_briefly())
+    stats = checker.stats()
+    assert stats['failed_rounds'] >= 1
+    assert stats['last_error'] == 'LookupError: catalog vanished'
+
+
+def test_offline_channels_follow_the_last_round(stand_in):
+    upstream = stand_in()
+    upstream.routes['/up.m3u8'] = upstream.routes['/also-up.m3u8'] = (200, PLAYLIST, b'#EXTM3U\n')
+    mirrors = {}
+    index = ChannelIndex.from_dicts(*parse_m3u_content(
+        '#EXTM3U\n'
+        f'#EXTINF:-1,Down\n{upstream.url}/down.m3u8\n'
+        f'#EXTINF:-1,Mirrored\n{upstream.url}/down.m3u8?b\n#EXTINF:-1,Mirrored\n{upstream.url}/up.m3u8\n'
+        f'#EXTINF:-1,Up\n{upstream.url}/also-up.m3u8\n',
+        mirrors,
+    ), mirrors)
+    checker = HealthChecker()
+    assert checker.offline_channels(index) == frozenset()
+
+    checker.check_now(index.stream_urls)
+    offline = checker.offline_channels(index)
+    # A channel with one mirror still up isn't offline
+    assert offline == {0}
+    assert checker.offline_channels(index) is offline
@@ -0,0 +1,32 @@
+import asyncio
+
+from health import HealthChecker
+from manifest import ManifestAnalyzer
+
+MASTER = (b'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\nlow/index.m3u8\n'
+          b'#EXT-X-STREAM-INF:BANDWIDTH=3000000,RESOLUTION=1280x720\nhigh/index.m3u8\n')
+MEDIA = b'#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXTINF:6.0,\n1.ts\n#EXTINF:6.0,\n2.ts\n'
+PLAYLIST = {'Content-Type': 'application/vnd.apple.mpegurl'}
+
+
+def test_analyzer_reuses_the_health_probe_playlist(stand_in):
+    upstream = stand_in()
+    upstream.routes['/master.m3u8'] = (200, PLAYLIST, MASTER)
+    upstream.routes['/low/index.m3u8'] = (200, PLAYLIST, MEDIA)
+    upstream.routes['/media.m3u8'] = (200, PLAYLIST, MEDIA)
+    master, media = f'{upstream.url}/master.m3u8', f'{upstream.url}/media.m3u8'
+
+    health = HealthChecker()
+    analyzer = ManifestAnalyzer()
+    health.listeners.append(analyzer.feed)
+    health.check_now([master, media])
+
+    # A media playlist needs nothing more; a master only its first variant
+    assert analyzer.info(media).target_duration == 6.0
+    pending = analyzer._pending
+    asyncio.run(analyzer.check(pending, variants=pending))
+    info = analyzer.info(master)
+    assert [variant.bandwidth for variant in info.variants] == [800000, 3000000]
+    assert info.window_seconds == 12.0
+    paths = [path for _, path, _ in upstream.requests]
+    assert sorted(paths) == ['/low/index.m3u8', '/master.m3u8', '/media.m3u8']
@@ -0,0 +1,122 @@
+import asyncio
+import re
+import socket
+import time
+import urllib.error
+import urllib.request
+
+from proxy import HLSProxy
+
+
+def test_waiter_survives_cancelled_leader():
+    proxy = HLSProxy()
+    calls = []
+
+    async def fetch_upstream(url):
+        calls.append(url)
+        if len(calls) == 1:
+            await asyncio.sleep(60)
+        return 200, 'video/mp2t', b'segment'
+
+    proxy._fetch_upstream = fetch_upstream
+
+    async def scenario():
+        url = 'http://upstream.test/live/1.ts'
+        leader = asyncio.create_task(proxy.fetch(url))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(proxy.fetch(url))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await asyncio.wait_for(waiter, 5)
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(scenario()) == (200, 'video/mp2t', b'segment')
+    assert len(calls) == 2
+    assert proxy.coalesced == 1
+    assert not proxy._in_flight
+
+
+def test_redirected_manifest_is_served_through_the_proxy(stand_in):
+    origin, cdn = stand_in(), stand_in()
+    origin.routes['/live.m3u8'] = (302, {'Location': f'{cdn.url}/edge/live.m3u8'}, b'')
+    cdn.routes['/edge/live.m3u8'] = (200, {'Content-Type': 'application/vnd.apple.mpegurl'},
+                                     b'#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXTINF:4,\n1.ts\n')
+    cdn.routes['/edge/1.ts'] = (200, {'Content-Type': 'video/mp2t'}, b'segment')
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    proxy = HLSProxy(public_url=f'http://127.0.0.1:{port}')
+    proxy.start(lambda: {('http', origin.netloc)}, host='127.0.0.1', port=port)
+
+    def get(url):
+        for _ in range(50):
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    return response.read()
+            except urllib.error.URLError as e:
+                if not isinstance(e.reason, ConnectionRefusedError):
+                    raise
+                time.sleep(0.1)
+        raise AssertionError(f'proxy did not start on port {port}')
+
+    manifest = get(proxy.proxied_url(f'{origin.url}/live.m3u8')).decode()
+    segment_url = f'http://127.0.0.1:{port}/hls/http/{cdn.netloc}/edge/1.ts'
+    assert segment_url in manifest
+    assert get(segment_url) == b'segment'
+    assert ('http', cdn.netloc) in proxy.linked_hosts
+
+
+def test_linked_hosts_expire_and_are_bounded():
+    proxy = HLSProxy(public_url='http://proxy.test', linked_host_ttl=60, max_linked_hosts=2)
+    proxy.rewrite_manifest(b'#EXTM3U\nhttp://a.test/1.ts\nhttp://b.test/1.ts\n', 'http://origin.test/live.m3u8')
+    assert proxy._linked(('http', 'a.test'))
+    # Relinking b and linking c pushes out a, used least recently
+    proxy.rewrite_manifest(b'#EXTM3U\nhttp://b.test/2.ts\nhttp://c.test/2.ts\n', 'http://origin.test/live.m3u8')
+    assert list(proxy.linked_hosts) == [('http', 'b.test'), ('http', 'c.test')]
+    assert not proxy._linked(('http', 'a.test'))
+
+    proxy.linked_hosts[('http', 'b.test')] = time.monotonic() - 1
+    assert not proxy._linked(('http', 'b.test'))
+    assert list(proxy.linked_hosts) == [('http', 'c.test')]
+
+
+def test_extensionless_manifests_are_cached_as_manifests(stand_in):
+    upstream = stand_in()
+    upstream.routes['/live?channel=1'] = (200, {'Content-Type': 'application/vnd.apple.mpegurl'},
+                                          b'#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXTINF:4,\n1.ts\n')
+    proxy = HLSProxy(public_url='http://proxy.test', manifest_ttl=60)
+
+    async def scenario():
+        first = await proxy.fetch(f'{upstream.url}/live?channel=1')
+        misses = proxy.segments.misses
+        second = await proxy.fetch(f'{upstream.url}/live?channel=1')
+        # Looked up in the manifest cache, where the first response was stored
+        assert proxy.segments.misses == misses
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert len(upstream.requests) == 1
+    assert proxy.cache_hits == 1
+
+
+def test_request_bodies_are_not_parsed_as_requests():
+    proxy = HLSProxy()
+
+    async def scenario():
+        server = await asyncio.start_server(proxy._handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            body = b'GET /hls/http/evil.test/ HTTP/1.1\r\n\r\n'
+            writer.write(b'POST /qoe HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+            writer.write(b'OPTIONS / HTTP/1.1\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            responses = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert re.findall(rb'HTTP/1\.1 (\d+)', responses) == [b'405', b'204']
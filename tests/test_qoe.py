@@ -0,0 +1,21 @@
+import pytest
+
+from qoe import QoEAggregator, normalize
+
+
+def test_non_list_batches_are_rejected_whole():
+    stats = QoEAggregator()
+    stats.ingest(42)
+    stats.ingest({'type': 'stall', 'ms': 900})
+    stats.ingest([{'type': 'startup', 'ms': 1200, 'name': 'News', 'url': 'http://cdn.test/news.m3u8'}, 'junk'])
+    counts = stats.stats()
+    assert (counts['batches'], counts['rejected_batches']) == (3, 2)
+    assert (counts['events'], counts['rejected']) == (1, 1)
+
+
+def test_non_finite_and_negative_bitrates_are_rejected():
+    assert normalize({'type': 'level', 'bitrate': 2_500_000, 'initial': True}) == ('level', (2500.0, True))
+    assert normalize({'type': 'level', 'bitrate': 0}) == ('level', (None, False))
+    for bitrate in (float('nan'), float('inf'), 'inf', -1):
+        with pytest.raises(ValueError):
+            normalize({'type': 'level', 'bitrate': bitrate})
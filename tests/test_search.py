@@ -0,0 +1,47 @@
+from catalog import ChannelIndex, parse_m3u_content
+from search import SearchIndex, name_tokens
+
+PLAYLIST = '''#EXTM3U
+#========Sports==========
+#EXTINF:-1,StarSports 1 HD
+http://a.test/1.m3u8
+#EXTINF:-1,StarSports 1
+http://a.test/2.m3u8
+#EXTINF:-1,Sony Ten 2 HD
+http://a.test/3.m3u8
+#========News==========
+#EXTINF:-1,Star News
+http://a.test/4.m3u8
+#EXTINF:-1,Aaj Tak
+http://a.test/5.m3u8
+#EXTINF:-1,Tenx
+http://a.test/6.m3u8
+'''
+
+
+def index():
+    return SearchIndex(ChannelIndex.from_dicts(*parse_m3u_content(PLAYLIST)))
+
+
+def test_names_split_into_runs_and_camel_case_parts():
+    assert name_tokens('StarSports1 HD') == ('starsports', 'star', 'sports', '1', 'hd')
+
+
+def test_search_ranks_exact_then_prefix_then_typo():
+    search = index().search
+    # Exact token matches first, shorter names before longer ones
+    assert search('star') == [3, 1, 0]
+    assert search('sports 1') == [1, 0]
+    # An exact match beats a shorter name that only matches as a prefix
+    assert search('ten') == [2, 5]
+    # Prefixes, then channels listed under a matching category
+    assert search('spo') == [1, 0, 2]
+    # One typo: a swapped pair of letters, a missing letter
+    assert search('strasports') == [1, 0]
+    assert search('sny') == []
+    assert search('sonny') == [2]
+    # Category names match every channel listed under them, after name matches
+    assert search('news') == [3, 4, 5]
+    assert search('news aaj') == [4]
+    assert search('') == []
+    assert search('star', limit=1) == [3]
@@ -0,0 +1,51 @@
+import asyncio
+
+from segment_cache import SegmentCache
+
+
+def test_spilled_segments_reach_disk_through_flush(tmp_path):
+    cache = SegmentCache(memory_bytes=20, disk_bytes=100, directory=str(tmp_path), spill_bytes=8)
+    cache.put('http://cdn.test/live/1.ts', 'video/mp2t', b'a' * 8)
+    cache.put('http://cdn.test/live/2.ts', 'video/mp2t', b'b' * 8)
+    assert cache.pending()
+    # Still served from memory while the write is queued
+    assert cache.get('http://cdn.test/live/1.ts') == ('video/mp2t', b'a' * 8)
+
+    asyncio.run(cache.flush())
+    assert not cache.pending()
+    content_type, body = cache.get('http://cdn.test/live/1.ts')
+    assert bytes(body) == b'a' * 8
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_queued_writes_share_the_memory_budget(tmp_path):
+    cache = SegmentCache(memory_bytes=40, disk_bytes=100, directory=str(tmp_path), spill_bytes=16)
+    for number in range(6):
+        cache.put(f'http://cdn.test/live/{number}.ts', 'video/mp2t', b'x' * 8)
+    stats = cache.stats()
+    # 24 bytes in memory, the queue full at 16, the rest dropped until flush catches up
+    assert (stats['memory_bytes'], stats['spilling_bytes'], stats['spill_drops']) == (24, 16, 1)
+    assert cache.get('http://cdn.test/live/0.ts') is not None
+    assert cache.get('http://cdn.test/live/2.ts') is None
+
+    asyncio.run(cache.flush())
+    stats = cache.stats()
+    assert (stats['spilling_bytes'], stats['disk_bytes']) == (0, 16)
+
+
+def test_expired_entries_are_swept_on_insert(tmp_path):
+    cache = SegmentCache(directory=str(tmp_path), sweep_interval=0.0)
+    cache.put('http://cdn.test/live/1.ts', 'video/mp2t', b'old', ttl=-1)
+    cache.put('http://cdn.test/live/2.ts', 'video/mp2t', b'new')
+    stats = cache.stats()
+    assert stats['memory_entries'] == 1
+    assert stats['expirations'] == 1
+
+
+def test_live_windows_are_bounded():
+    cache = SegmentCache(max_windows=2)
+    for channel in range(5):
+        cache.note_manifest(f'http://cdn.test/{channel}/index.m3u8', b'#EXT-X-TARGETDURATION:6\n')
+    assert len(cache._windows) == 2
+    assert cache.ttl_for('http://cdn.test/4/1.ts') == 18.0
+    assert cache.ttl_for('http://cdn.test/0/1.ts') == cache.default_ttl
@@ -0,0 +1,44 @@
+import asyncio
+
+from httppool import ConnectionPool
+from sources import PlaylistSource, SourceCatalog
+
+PLAYLIST = b'#EXTM3U\n#EXTINF:-1 group-title="News",News One\nhttp://cdn.test/news/index.m3u8\n'
+
+
+def test_unchanged_remote_playlist_costs_one_304(stand_in):
+    upstream = stand_in()
+
+    def playlist(headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return 200, {'ETag': '"v1"', 'Content-Type': 'audio/x-mpegurl'}, PLAYLIST
+
+    upstream.routes['/tv.m3u'] = playlist
+    source = PlaylistSource(f'{upstream.url}/tv.m3u')
+
+    async def refresh_twice():
+        pool = ConnectionPool()
+        try:
+            return await source.refresh(pool, 5.0), await source.refresh(pool, 5.0)
+        finally:
+            pool.close()
+
+    assert asyncio.run(refresh_twice()) == (True, False)
+    assert source.error is None
+    assert len(source.entries) == 1
+    assert (source.fetches, source.not_modified) == (2, 1)
+    first, second = (headers for _, _, headers in upstream.requests)
+    assert 'If-None-Match' not in first
+    assert second['If-None-Match'] == '"v1"'
+
+
+def test_retries_back_off_until_a_catalog_loads(tmp_path):
+    catalog = SourceCatalog([str(tmp_path / 'missing.m3u')], interval=300, retry_seconds=1.0)
+    assert [catalog._delay(attempt) for attempt in range(4)] == [1.0, 2.0, 4.0, 8.0]
+    assert catalog._delay(100) == 300
+
+    (tmp_path / 'missing.m3u').write_bytes(PLAYLIST)
+    catalog.refresh_now()
+    assert catalog.current() is not None
+    assert catalog._delay(1) == 300
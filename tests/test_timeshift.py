@@ -0,0 +1,48 @@
+import asyncio
+
+from timeshift import SegmentRing
+
+
+def test_ring_wraps_and_serves_written_segments(tmp_path):
+    ring = SegmentRing(str(tmp_path / 'ring.ts'), capacity=4000, max_seconds=600, guard=0)
+
+    async def record():
+        for number in range(12):
+            await ring.append(bytes([number]) * 900, 2.0)
+
+    asyncio.run(record())
+    sequences = [entry.sequence for entry in ring.entries]
+    assert len(sequences) == 4
+    newest = ring.segment(sequences[-1])
+    assert newest.count == 900
+    ring.file.seek(newest.offset)
+    assert ring.file.read(newest.count) == bytes([11]) * 900
+
+
+def test_cancelled_append_lists_nothing_and_finishes_its_write(tmp_path):
+    ring = SegmentRing(str(tmp_path / 'ring.ts'), capacity=1 << 20, max_seconds=600)
+
+    async def scenario():
+        task = asyncio.create_task(ring.append(b'x' * 1000, 2.0))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await ring.idle()
+        assert ring._writing.done()
+
+    asyncio.run(scenario())
+    assert not ring.entries
+
+
+def test_guarded_segments_are_neither_listed_nor_served(tmp_path):
+    ring = SegmentRing(str(tmp_path / 'ring.ts'), capacity=1 << 20, max_seconds=600, guard=2)
+
+    async def record():
+        for number in range(5):
+            await ring.append(bytes([number]) * 100, 2.0)
+
+    asyncio.run(record())
+    sequences = [entry.sequence for entry in ring.entries]
+    assert [entry.sequence for entry in ring.listed()] == sequences[2:]
+    assert ring.segment(sequences[1]) is None
+    assert ring.segment(sequences[2]) is not None
@@ -0,0 +1,530 @@
+"""Timeshift: on-disk recordings of live channels for pausing and catch-up.
+
+Upstream live playlists only list the last few segments, so a viewer who
+pauses or reconnects loses what aired meanwhile. With
+``AAEC_TIMESHIFT_CHANNELS=N`` (and the proxy on), the N channels most
+recently selected by any viewer are recorded as they air, each into a
+``SegmentRing``: one file of ``AAEC_TIMESHIFT_DISK_MB / N`` preallocated at
+first use, written append-only and wrapping around, so the recordings never
+take more disk than the budget and never fragment. A channel keeps at most
+``AAEC_TIMESHIFT_MINUTES`` of media, less when its bitrate fills the ring
+first, and stops being recorded ``AAEC_TIMESHIFT_IDLE_MINUTES`` after it
+was last selected, or earlier when more recently selected channels need
+its slot.
+
+The recorder runs in the proxy's event loop and fetches through
+``hls_proxy.fetch``, so recording a channel that viewers are watching
+shares their upstream fetches. Recordings are served by the proxy:
+
+    /timeshift/<key>/live.m3u8              sliding window over the whole recording
+    /timeshift/<key>/event.m3u8?from=<seq>  EVENT playlist from segment <seq> on
+    /timeshift/<key>/<seq>.ts               a segment, sent with sendfile()
+
+``catchup_url(url, seconds)`` is an EVENT playlist starting that far back,
+which players start from its beginning (``EXT-X-START``) and which keeps
+growing like the live stream. Only unencrypted playlists without
+``EXT-X-MAP`` (MPEG-TS or packed audio segments) are recorded. Run
+``python timeshift.py URL...`` to record streams through a local proxy.
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from manifest import parse_master
+from metrics import metrics
+from proxy import PROXY_ENABLED, FileRange, hls_proxy
+
+# Channels recorded at once; 0 turns timeshift off
+TIMESHIFT_CHANNELS = int(os.environ.get('AAEC_TIMESHIFT_CHANNELS', '0'))
+# Disk shared by all recordings, preallocated per channel on first use
+TIMESHIFT_DISK_BYTES = int(os.environ.get('AAEC_TIMESHIFT_DISK_MB', '2048')) << 20
+TIMESHIFT_MINUTES = int(os.environ.get('AAEC_TIMESHIFT_MINUTES', '60'))
+# Recordings are made and served by the proxy
+TIMESHIFT_ENABLED = PROXY_ENABLED and TIMESHIFT_CHANNELS > 0 and TIMESHIFT_MINUTES > 0
+TIMESHIFT_IDLE_MINUTES = float(os.environ.get('AAEC_TIMESHIFT_IDLE_MINUTES', '60'))
+# Best variant of a multi-bitrate channel recorded within this bitrate
+TIMESHIFT_KBPS = int(os.environ.get('AAEC_TIMESHIFT_KBPS', '3000'))
+TIMESHIFT_DIR = os.environ.get('AAEC_TIMESHIFT_DIR')
+
+RingSegment = namedtuple('RingSegment', ['sequence', 'offset', 'size', 'duration', 'discontinuity', 'recorded_at'])
+MediaSegment = namedtuple('MediaSegment', ['sequence', 'duration', 'discontinuity', 'uri'])
+
+_MEDIA_SEQUENCE_RE = re.compile(r'#EXT-X-MEDIA-SEQUENCE:\s*(\d+)')
+_TARGET_DURATION_RE = re.compile(r'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)')
+_EXTINF_RE = re.compile(r'#EXTINF:\s*(\d+(?:\.\d+)?)')
+
+
+def recording_key(url):
+    """Path component naming the recording of channel ``url``."""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_segments(text):
+    """``(target_duration, segments, unsupported)`` of a media playlist.
+
+    ``segments`` are ``MediaSegment``s numbered from the playlist's media
+    sequence; ``unsupported`` names what keeps the playlist from being
+    recorded (``None`` if nothing does).
+    """
+    if '#EXT-X-MAP' in text:
+        return None, [], 'fragmented MP4'
+    if re.search(r'#EXT-X-KEY:(?!METHOD=NONE)', text):
+        return None, [], 'encrypted'
+    match = _MEDIA_SEQUENCE_RE.search(text)
+    sequence = int(match.group(1)) if match else 0
+    match = _TARGET_DURATION_RE.search(text)
+    target_duration = float(match.group(1)) if match else None
+    segments = []
+    duration = None
+    discontinuity = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF'):
+            match = _EXTINF_RE.match(line)
+            duration = float(match.group(1)) if match else 0.0
+        elif line.startswith('#EXT-X-DISCONTINUITY') and not line.startswith('#EXT-X-DISCONTINUITY-SEQUENCE'):
+            discontinuity = True
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append(MediaSegment(sequence, duration, discontinuity, line))
+            sequence += 1
+            duration = None
+            discontinuity = False
+    return target_duration, segments, None
+
+
+class SegmentRing:
+    """Segments of one recording in a preallocated file used as a ring.
+
+    Segments are written back to back at the head and never rewritten; one
+    that doesn't fit before the end of the file starts over at offset 0,
+    and the oldest segments are dropped as the head reaches them (or as the
+    recording exceeds ``max_seconds``). The ``guard`` oldest segments are
+    left out of playlists, so they aren't being sent when overwritten.
+    Only the recorder writes, in a worker thread so the event loop never
+    waits on the disk; other threads only read ``entries`` through a copy.
+    The constructor allocates the file, so create rings off the loop too.
+    """
+
+    def __init__(self, path, capacity, max_seconds, guard=2):
+        self.path = path
+        self.capacity = capacity
+        self.max_seconds = max_seconds
+        self.guard = guard
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Reserve the whole ring up front: no ENOSPC mid-recording, no fragmentation
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, capacity)
+            else:
+                os.ftruncate(fd, capacity)
+        except OSError:
+            os.ftruncate(fd, capacity)
+        self.file = os.fdopen(fd, 'r+b', buffering=0)
+        self._writing = None
+        self.reset()
+
+    def reset(self, content_type='video/mp2t'):
+        """Forget the recording; the file stays allocated for the next one."""
+        self.entries = deque()
+        self.content_type = content_type
+        self.head = 0
+        self.seconds = 0.0
+        # Numbered from the clock, so a channel recorded again later doesn't
+        # reuse the segment URLs of its earlier recording
+        self.next_sequence = int(time.time())
+        self.dropped_discontinuities = 0
+        self.bytes_written = 0
+
+    def close(self):
+        self.file.close()
+
+    def _drop_oldest(self):
+        entry = self.entries.popleft()
+        self.seconds -= entry.duration
+        if entry.discontinuity:
+            self.dropped_discontinuities += 1
+
+    async def idle(self):
+        """Wait for a write left behind by a cancelled ``append``, before the ring is ``reset``."""
+        if self._writing is not None:
+            await asyncio.wait([self._writing])
+
+    def _write(self, data, offset):
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += os.pwrite(self.file.fileno(), view[written:], offset + written)
+
+    async def append(self, data, duration, discontinuity=False):
+        """Write one segment at the head and return its ``RingSegment`` (``None`` if it can't fit)."""
+        size = len(data)
+        if size > self.capacity // 4:
+            return None
+        offset = self.head
+        if offset + size > self.capacity:
+            # Wrap: what is left past the head is the oldest part of the ring
+            while self.entries and self.entries[0].offset >= offset:
+                self._drop_oldest()
+            offset = 0
+        end = offset + size
+        while self.entries and self.entries[0].offset < end and offset < self.entries[0].offset + self.entries[0].size:
+            self._drop_oldest()
+        while self.entries and self.seconds + duration > self.max_seconds:
+            self._drop_oldest()
+
+        # Shielded: a cancelled recorder leaves the write to finish, and
+        # ``idle`` waits for it before the region can be reused
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self._write, data, offset))
+        await asyncio.shield(self._writing)
+        entry = RingSegment(self.next_sequence, offset, size, duration, discontinuity, time.time())
+        self.entries.append(entry)
+        self.next_sequence += 1
+        self.head = offset + size
+        self.seconds += duration
+        self.bytes_written += size
+        return entry
+
+    def listed(self):
+        """Segments playlists may list: all but the ``guard`` oldest."""
+        # Copying a deque is atomic, so this is safe from other threads
+        return list(self.entries)[self.guard:]
+
+    def segment(self, sequence):
+        """``FileRange`` of a recorded segment, or ``None`` once it is gone."""
+        # The same segments playlists list: the guard ones may be overwritten next
+        entries = self.listed()
+        if not entries or not entries[0].sequence <= sequence <= entries[-1].sequence:
+            return None
+        entry = entries[sequence - entries[0].sequence]
+        return FileRange(self.file, entry.offset, entry.size)
+
+    def recorded_seconds(self):
+        return sum(entry.duration for entry in self.listed())
+
+    def sequence_before(self, seconds):
+        """Sequence of the listed segment airing ``seconds`` before the newest ends, or ``None``."""
+        entries = self.listed()
+        if not entries:
+            return None
+        elapsed = 0.0
+        for entry in reversed(entries):
+            elapsed += entry.duration
+            if elapsed >= seconds:
+                return entry.sequence
+        return entries[0].sequence
+
+    def playlist(self, first_sequence=None):
+        """The recording as a media playlist: sliding, or EVENT from ``first_sequence`` on."""
+        all_entries = list(self.entries)
+        entries = all_entries[self.guard:]
+        if first_sequence is not None:
+            # Starts later when the start was overwritten meanwhile
+            entries = [entry for entry in entries if entry.sequence >= first_sequence]
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+        target_duration = max((entry.duration for entry in entries), default=1.0)
+        lines.append(f'#EXT-X-TARGETDURATION:{max(1, math.ceil(target_duration))}')
+        if entries:
+            skipped = len(all_entries) - len(entries)
+            # Tags before the first segment, its own included (it isn't written for the first)
+            discontinuity_sequence = self.dropped_discontinuities + sum(
+                entry.discontinuity for entry in all_entries[:skipped + 1]
+            )
+            lines.append(f'#EXT-X-MEDIA-SEQUENCE:{entries[0].sequence}')
+            lines.append(f'#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuity_sequence}')
+        if first_sequence is not None:
+            lines.append('#EXT-X-PLAYLIST-TYPE:EVENT')
+            lines.append('#EXT-X-START:TIME-OFFSET=0')
+        for index, entry in enumerate(entries):
+            if entry.discontinuity and index:
+                lines.append('#EXT-X-DISCONTINUITY')
+            if index == 0 or entry.discontinuity:
+                aired = datetime.fromtimestamp(entry.recorded_at - entry.duration, timezone.utc)
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{aired.isoformat(timespec='milliseconds')}")
+            lines.append(f'#EXTINF:{entry.duration:.3f},')
+            lines.append(f'{entry.sequence}.ts')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class Recording:
+    """One channel being recorded into a ring slot."""
+
+    def __init__(self, url, slot, ring):
+        self.url = url
+        self.key = recording_key(url)
+        self.slot = slot
+        self.ring = ring
+        self.task = None
+        self.error = None
+
+
+class Timeshift:
+    """Records the most recently selected channels and serves the recordings.
+
+    ``request`` is called from script threads whenever a viewer is on a
+    channel; everything else runs in the proxy's event loop once ``start``
+    has mounted it on ``proxy``.
+    """
+
+    def __init__(self, proxy, channels=TIMESHIFT_CHANNELS, disk_bytes=TIMESHIFT_DISK_BYTES,
+                 max_minutes=TIMESHIFT_MINUTES, idle_minutes=TIMESHIFT_IDLE_MINUTES, max_kbps=TIMESHIFT_KBPS,
+                 directory=TIMESHIFT_DIR):
+        self.proxy = proxy
+        self.channels = channels
+        self.disk_bytes = disk_bytes
+        self.max_seconds = max_minutes * 60
+        self.idle_seconds = idle_minutes * 60
+        self.max_bps = max_kbps * 1000
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Channel URL -> when a viewer last selected it
+        self._requested = {}
+        self._recordings = {}
+        self._by_key = {}
+        self._rings = []
+        self.segments_recorded = 0
+        self.segments_served = 0
+        self.fetch_errors = 0
+        self.unsupported = 0
+
+    def request(self, url):
+        """Note that a viewer is on channel ``url``, so it gets (or stays) recorded."""
+        with self._lock:
+            self._requested[url] = time.monotonic()
+
+    def recorded_seconds(self, url):
+        """Seconds of channel ``url`` that can be played back now."""
+        recording = self._recordings.get(url)
+        return recording.ring.recorded_seconds() if recording is not None else 0.0
+
+    def catchup_url(self, url, seconds):
+        """URL of an EVENT playlist of channel ``url`` starting ``seconds`` back, or ``None`` if not recorded."""
+        recording = self._recordings.get(url)
+        sequence = recording.ring.sequence_before(seconds) if recording is not None else None
+        if sequence is None:
+            return None
+        return f"{self.proxy.public_url}/timeshift/{recording.key}/event.m3u8?from={sequence}"
+
+    def live_url(self, url):
+        """URL of the sliding playlist over the whole recording of channel ``url``."""
+        return f"{self.proxy.public_url}/timeshift/{recording_key(url)}/live.m3u8"
+
+    # Recording
+
+    async def _ring(self, slot):
+        while len(self._rings) <= slot:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix='aaec-timeshift-')
+            path = os.path.join(self.directory, f'ring-{len(self._rings)}.ts')
+            self._rings.append(await asyncio.to_thread(SegmentRing, path, self.disk_bytes // self.channels,
+                                                       self.max_seconds))
+        return self._rings[slot]
+
+    def _upstream(self, uri, base):
+        # Fetched playlists come rewritten for the proxy: map their URIs back
+        url = urljoin(base, uri)
+        if url.startswith(self.proxy.public_url + '/hls/'):
+            parts = urlsplit(url)
+            url = self.proxy.upstream_url(parts.path) + ('?' + parts.query if parts.query else '')
+        return url
+
+    async def _media_url(self, url, body):
+        """The media playlist to record for channel ``url``, whose playlist is ``body``."""
+        text = bytes(body).decode('utf-8', 'replace')
+        if '#EXT-X-STREAM-INF' not in text:
+            return url, text
+        variants = parse_master(text, url)
+        if not variants:
+            return url, text
+        fitting = [variant for variant in variants if variant.bandwidth <= self.max_bps]
+        variant = fitting[-1] if fitting else variants[0]
+        media_url = self._upstream(variant.url, url)
+        status, _, body = await self.proxy.fetch(media_url)
+        if status != 200:
+            raise ValueError(f"HTTP {status}")
+        return media_url, bytes(body).decode('utf-8', 'replace')
+
+    async def _record(self, recording):
+        ring = recording.ring
+        media_url = None
+        last_sequence = None
+        while True:
+            delay = 2.0
+            try:
+                status, _, body = await self.proxy.fetch(media_url or recording.url)
+                if status != 200:
+                    raise ValueError(f"HTTP {status}")
+                if media_url is None:
+                    media_url, text = await self._media_url(recording.url, body)
+                else:
+                    text = bytes(body).decode('utf-8', 'replace')
+                target_duration, segments, unsupported = parse_segments(text)
+                if unsupported:
+                    self.unsupported += 1
+                    recording.error = unsupported
+                    return
+                if target_duration:
+                    delay = min(10.0, max(1.0, target_duration / 2))
+                gap = False
+                if last_sequence is not None and segments:
+                    if segments[-1].sequence < last_sequence:
+                        # The upstream restarted its numbering
+                        last_sequence = None
+                        gap = True
+                    elif segments[0].sequence > last_sequence + 1:
+                        gap = True
+                for segment in segments:
+                    if last_sequence is not None and segment.sequence <= last_sequence:
+                        continue
+                    status, content_type, data = await self.proxy.fetch(self._upstream(segment.uri, media_url))
+                    if status != 200:
+                        gap = True
+                        continue
+                    if not ring.entries:
+                        ring.content_type = content_type
+                    await ring.append(data, segment.duration, segment.discontinuity or gap)
+                    last_sequence = segment.sequence
+                    gap = False
+                    self.segments_recorded += 1
+                recording.error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.fetch_errors += 1
+                recording.error = str(e) or e.__class__.__name__
+                media_url = None
+            await asyncio.sleep(delay)
+
+    async def _update(self):
+        """Record the ``channels`` most recently selected channels, and only those."""
+        now = time.monotonic()
+        with self._lock:
+            for url, requested_at in list(self._requested.items()):
+                if now - requested_at > self.idle_seconds:
+                    del self._requested[url]
+            wanted = sorted(self._requested, key=self._requested.get, reverse=True)[:self.channels]
+        # Replaced, not mutated, so script threads can read them without a lock
+        for recording in self._recordings.values():
+            if recording.url not in wanted:
+                recording.task.cancel()
+        self._recordings = {url: recording for url, recording in self._recordings.items() if url in wanted}
+        self._by_key = {recording.key: recording for recording in self._recordings.values()}
+        for url in wanted:
+            if url in self._recordings:
+                continue
+            used = {recording.slot for recording in self._recordings.values()}
+            slot = next(slot for slot in range(self.channels) if slot not in used)
+            ring = await self._ring(slot)
+            await ring.idle()
+            ring.reset()
+            recording = Recording(url, slot, ring)
+            recording.task = asyncio.create_task(self._record(recording))
+            self._recordings = {**self._recordings, url: recording}
+            self._by_key = {**self._by_key, recording.key: recording}
+
+    async def run(self):
+        while True:
+            try:
+                await self._update()
+            except Exception:
+                # A bad round must not stop recording for good
+                pass
+            await asyncio.sleep(1.0)
+
+    # Serving
+
+    async def handle(self, method, target):
+        path, _, query = target.partition('?')
+        parts = path.split('/')
+        if len(parts) != 4:
+            return 404, 'text/plain', b'Not found'
+        recording = self._by_key.get(parts[2])
+        if recording is None:
+            return 404, 'text/plain', b'Channel not recorded'
+        name = parts[3]
+        # Watching a recording keeps its channel recorded
+        self.request(recording.url)
+        if name == 'live.m3u8':
+            return 200, 'application/vnd.apple.mpegurl', recording.ring.playlist()
+        if name == 'event.m3u8':
+            first = parse_qs(query).get('from', ['0'])[0]
+            if not first.isdigit():
+                return 400, 'text/plain', b'Bad from'
+            return 200, 'application/vnd.apple.mpegurl', recording.ring.playlist(int(first))
+        sequence = name[:-len('.ts')] if name.endswith('.ts') else ''
+        body = recording.ring.segment(int(sequence)) if sequence.isdigit() else None
+        if body is None:
+            return 404, 'text/plain', b'Segment no longer recorded'
+        self.segments_served += 1
+        metrics.inc('timeshift_segments_served')
+        return 200, recording.ring.content_type, body
+
+    def start(self):
+        """Mount on the proxy, which records and serves from then on; later calls are no-ops."""
+        if self.channels > 0:
+            self.proxy.mount('/timeshift/', self.handle, self.run)
+
+    def stats(self):
+        recordings = list(self._recordings.values())
+        return {
+            'recordings': len(recordings),
+            'recorded_seconds': round(sum(recording.ring.recorded_seconds() for recording in recordings), 1),
+            'allocated_bytes': sum(ring.capacity for ring in self._rings),
+            'segments_recorded': self.segments_recorded,
+            'segments_served': self.segments_served,
+            'fetch_errors': self.fetch_errors,
+            'unsupported': self.unsupported,
+        }
+
+
+# Process-wide recorder shared by all sessions (used when the proxy is on)
+timeshift = Timeshift(hls_proxy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record HLS streams through a local proxy for timeshift.")
+    parser.add_argument('urls', nargs='+', help="stream URLs to record")
+    parser.add_argument('--port', type=int, default=8765, help="local proxy port")
+    parser.add_argument('--disk-mb', type=int, default=TIMESHIFT_DISK_BYTES >> 20, help="disk for all recordings")
+    parser.add_argument('--minutes', type=int, default=TIMESHIFT_MINUTES, help="longest recording per stream")
+    parser.add_argument('--seconds', type=float, help="stop after this long (default: until interrupted)")
+    args = parser.parse_args(argv)
+
+    from proxy import HLSProxy
+
+    proxy = HLSProxy(public_url=f'http://localhost:{args.port}')
+    recorder = Timeshift(proxy, len(args.urls), args.disk_mb << 20, args.minutes, idle_minutes=math.inf)
+    recorder.start()
+    hosts = {(urlsplit(url).scheme, urlsplit(url).netloc) for url in args.urls}
+    proxy.start(lambda: hosts, host='127.0.0.1', port=args.port)
+    for url in args.urls:
+        recorder.request(url)
+        print(f"{url}\n  live:  {recorder.live_url(url)}")
+    started = time.monotonic()
+    try:
+        while args.seconds is None or time.monotonic() - started < args.seconds:
+            time.sleep(min(10.0, args.seconds or 10.0))
+            stats = recorder.stats()
+            print(f"{stats['recordings']} recording, {stats['recorded_seconds']:.0f} s recorded, "
+                  f"{stats['segments_recorded']} segments, {stats['fetch_errors']} errors, "
+                  f"{stats['unsupported']} unsupported")
+    except KeyboardInterrupt:
+        pass
+    for url in args.urls:
+        recording = recorder._recordings.get(url)
+        if recording is not None and recording.error:
+            print(f"{url}: {recording.error}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())